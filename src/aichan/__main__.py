@@ -1,19 +1,20 @@
 import asyncio
-import os
 import signal
 from collections.abc import Generator
 from contextlib import contextmanager
 
-from dotenv import load_dotenv
-
 from src.aichan._cli import parse_args_and_setup_logging
-from src.aichan.database.dao.access_dao import AccessDAO
-from src.aichan.database.dao.channel_dao import ChannelDAO
-from src.aichan.database.dao.limit_dao import UsageLimitDAO
+from src.aichan.config.store import ConfigStore, get_settings
+from src.aichan.database.migrations import prepare_database
 from src.aichan.discord.client import BotClient
 from src.aichan.discord.commands import *
 from src.aichan.discord.event import *
-from src.aichan.utils.scheduler import TaskScheduler
+from src.aichan.utils.batch_queue import BatchQueue
+from src.aichan.utils.code_sandbox import SandboxPool
+from src.aichan.utils.jobs import register_jobs, register_process_jobs
+from src.aichan.utils.rate_limiter import RateLimiter
+from src.aichan.utils.scheduler import JobScheduler
+from src.aichan.utils.semantic_cache import SemanticCache
 
 
 @contextmanager
@@ -45,33 +46,44 @@ async def main() -> None:
     """Entry point for the Discord bot application."""
     logger = parse_args_and_setup_logging()
 
-    # Initialize database tables
-    await AccessDAO().create_table()
-    await ChannelDAO().create_table()
-    usage_limit_dao = UsageLimitDAO()
-    await usage_limit_dao.create_table()
-    await usage_limit_dao.create_usage_tracking_table()
-
-    # Start the usage reset scheduler and store the task reference
-    reset_scheduler_task = asyncio.create_task(TaskScheduler.start_reset_usage_scheduler())
-    logger.info("Started usage reset scheduler")
+    await prepare_database()
 
-    load_dotenv()
-    # This environment variable is specific to this function
-    DISCORD_BOT_TOKEN: str = os.environ["DISCORD_BOT_TOKEN"]  # noqa: N806
+    # Restore the rate limiter state saved on the last shutdown
+    rate_limiter = RateLimiter()
+    await rate_limiter.load_snapshot()
 
     client = BotClient.get_instance()
 
+    # Start the periodic jobs, in one process only when sharded over several.
+    # Each process prunes its own memory and submits and polls the batches
+    # of its own channels.
+    scheduler = JobScheduler()
+    if client.is_primary:
+        register_jobs(scheduler)
+    register_process_jobs(scheduler)
+    BatchQueue().register_jobs(scheduler)
+    await scheduler.start()
+
+    # Pre-start the sandbox workers verifying /fixpy answers, if enabled
+    sandbox = SandboxPool()
+    await sandbox.start()
+
+    # Every process watches the configuration files, as each holds its own snapshot
+    config_watcher = asyncio.create_task(ConfigStore().watch())
+
     try:
-        await client.start(DISCORD_BOT_TOKEN)
+        await client.start(get_settings().discord_bot_token)
     except Exception:
         logger.exception("An unexpected error occurred")
     finally:
         with ignore_signals([signal.SIGTERM, signal.SIGINT]):
-            # Cancel the scheduler task before cleanup
-            if not reset_scheduler_task.done():
-                reset_scheduler_task.cancel()
+            config_watcher.cancel()
+            # Let running jobs finish before cleanup
+            await scheduler.shutdown()
             await client.cleanup_hook()
+            await rate_limiter.save_snapshot()
+            await sandbox.close()
+            SemanticCache().close()
             logger.info("Cleanup process finished")
 
 
@@ -1,19 +1,225 @@
 from __future__ import annotations
 
-import os
+from typing import TYPE_CHECKING, NamedTuple
 
 from discord import Message as DiscordMessage
 from discord import MessageType
-from dotenv import load_dotenv
 from pydantic import BaseModel
 
-load_dotenv()
-BOT_NAME: str = os.environ["BOT_NAME"]
+from src.aichan.config.store import get_settings
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+BOT_NAME: str = get_settings().bot_name
+
+# Provider roles of message senders. Any other sender is treated as "user".
+_ROLES: dict[str, str] = {
+    "developer": "developer",
+    "assistant": "assistant",
+    BOT_NAME: "assistant",
+}
+
+
+def to_provider_role(role: str) -> str:
+    """Map the role or author name of a message to a provider role.
+
+    Parameters
+    ----------
+    role : str
+        A role such as 'developer' or 'assistant', or the name of a
+        Discord user.
+
+    Returns
+    -------
+    str
+        'developer', 'assistant' or 'user'.
+    """
+    return _ROLES.get(role, "user")
+
+
+def _discord_message_text(message: DiscordMessage) -> str | None:
+    # The thread starter message refers to the embed sent by /talk,
+    # whose "message" field holds the first prompt
+    if message.type == MessageType.thread_starter_message and message.reference is not None:
+        # Discord sends the referenced message along, so the message cache
+        # is only needed if it is missing
+        starter = message.reference.resolved
+        if not isinstance(starter, DiscordMessage):
+            starter = message.reference.cached_message
+        if starter is not None and starter.embeds and starter.embeds[0].fields:
+            fields = starter.embeds[0].fields
+            for field in fields:
+                if field.name == "message":
+                    return field.value
+            return fields[0].value
+    return message.content
+
+
+class ChatTurn(NamedTuple):
+    """A lightweight chat message for the internal hot path.
+
+    Unlike `ChatMessage`, creating a ChatTurn runs no validation, and its
+    role is already mapped to a provider role.
+
+    Attributes
+    ----------
+    role : str
+        The provider role: 'developer', 'assistant' or 'user'.
+    content : str
+        The content of the message.
+    """
+
+    role: str
+    content: str
+
+    @classmethod
+    def from_discord_message(cls, message: DiscordMessage) -> ChatTurn | None:
+        """Convert a DiscordMessage instance to a ChatTurn instance.
+
+        Parameters
+        ----------
+        message : DiscordMessage
+            A message from Discord, which may be a thread starter or a
+            regular message.
+
+        Returns
+        -------
+        ChatTurn | None
+            A ChatTurn instance if the message has content, otherwise None.
+        """
+        content = _discord_message_text(message)
+        if content is None:
+            return None
+        return cls(to_provider_role(message.author.name), content)
+
+
+# The empty assistant turn appended to every request for the model to complete
+_ASSISTANT_TAIL: dict[str, str] = {"role": "assistant", "content": ""}
+
+
+class Conversation:
+    """An append-only conversation rendered in the provider message format.
+
+    Each turn is rendered once when appended, and merged into the previous
+    message if both have the same role, so the messages always alternate
+    between user and assistant. The rendered messages are shared by every
+    later request, and are accepted by both the Anthropic and the OpenAI
+    chat APIs.
+
+    Parameters
+    ----------
+    turns : Iterable[ChatTurn]
+        The initial turns of the conversation.
+
+    Attributes
+    ----------
+    messages : list[dict[str, str]]
+        The rendered messages.
+    message_ids : list[int | None]
+        ID of the last Discord message merged into each rendered message.
+    last_message_id : int | None
+        ID of the last Discord message appended, if any.
+    """
+
+    __slots__ = ("last_message_id", "message_ids", "messages")
+
+    def __init__(self, turns: Iterable[ChatTurn] = ()) -> None:
+        self.messages: list[dict[str, str]] = []
+        self.message_ids: list[int | None] = []
+        self.last_message_id: int | None = None
+        self.extend(turns)
+
+    def append(self, turn: ChatTurn, message_id: int | None = None) -> None:
+        """Append a turn to the conversation.
+
+        Parameters
+        ----------
+        turn : ChatTurn
+            The turn to append. Turns without content are ignored.
+        message_id : int | None
+            ID of the Discord message of the turn, if any.
+        """
+        if not turn.content:
+            return
+        messages = self.messages
+        if messages and messages[-1]["role"] == turn.role:
+            # Replace rather than update, as the old dict may be in use by a request
+            messages[-1] = {
+                "role": turn.role,
+                "content": f"{messages[-1]['content']}\n{turn.content}",
+            }
+            self.message_ids[-1] = message_id
+        else:
+            messages.append({"role": turn.role, "content": turn.content})
+            self.message_ids.append(message_id)
+
+    def extend(self, turns: Iterable[ChatTurn]) -> None:
+        """Append several turns to the conversation.
+
+        Parameters
+        ----------
+        turns : Iterable[ChatTurn]
+            The turns to append.
+        """
+        for turn in turns:
+            self.append(turn)
+
+    def clear(self) -> None:
+        """Remove every message, so that the conversation is rebuilt from scratch."""
+        self.messages = []
+        self.message_ids = []
+        self.last_message_id = None
+
+    def drop_until(self, message_id: int) -> None:
+        """Remove the leading messages up to a Discord message.
+
+        Parameters
+        ----------
+        message_id : int
+            ID of the last Discord message to remove.
+        """
+        count = 0
+        for rendered_id in self.message_ids:
+            if rendered_id is None or rendered_id > message_id:
+                break
+            count += 1
+        del self.messages[:count]
+        del self.message_ids[:count]
+
+    def render_anthropic(self) -> list[dict[str, str]]:
+        """Render the messages for the Anthropic Messages API.
+
+        Returns
+        -------
+        list[dict[str, str]]
+            The messages, followed by an empty assistant turn.
+        """
+        return [*self.messages, _ASSISTANT_TAIL]
+
+    def render_openai(self, system_prompt: str) -> list[dict[str, str]]:
+        """Render the messages for the OpenAI Chat Completions API.
+
+        Parameters
+        ----------
+        system_prompt : str
+            The system instruction, sent as a developer message.
+
+        Returns
+        -------
+        list[dict[str, str]]
+            The developer message and the messages, followed by an empty
+            assistant turn.
+        """
+        return [{"role": "developer", "content": system_prompt}, *self.messages, _ASSISTANT_TAIL]
 
 
 class ChatMessage(BaseModel):
     """Represents a single chat message with a role and content.
 
+    Use this model to validate messages at the boundaries, e.g. user
+    input from slash commands, and `to_turn` to pass them on.
+
     Attributes
     ----------
     role : str
@@ -33,21 +239,18 @@ class ChatMessage(BaseModel):
         -------
         dict
             A dictionary with 'role' and 'content' keys.
+        """
+        return {"role": to_provider_role(self.role), "content": self.content or ""}
+
+    def to_turn(self) -> ChatTurn:
+        """Convert the message to a ChatTurn.
 
-        Raises
-        ------
-        RuntimeError
-            If the bot client is not initialized when trying to get the bot name
+        Returns
+        -------
+        ChatTurn
+            The message with its role mapped to a provider role.
         """
-        return {
-            # If self.role matches BOT_NAME, return "assistant",
-            # otherwise if self.role is "developer" or "assistant", use that value,
-            # otherwise treat it as "user"
-            "role": "assistant"
-            if self.role == BOT_NAME
-            else (self.role if self.role in ("developer", "assistant") else "user"),
-            "content": self.content or "",
-        }
+        return ChatTurn(to_provider_role(self.role), self.content or "")
 
     @classmethod
     async def from_discord_message(cls, message: DiscordMessage) -> ChatMessage | None:
@@ -72,20 +275,10 @@ class ChatMessage(BaseModel):
         >>> if chat_msg:
         ...     print(chat_msg.format_message())
         """
-        # Process thread starter message
-        if (
-            message.type == MessageType.thread_starter_message
-            and message.reference is not None
-            and message.reference.cached_message
-            and message.reference.cached_message.embeds
-            and message.reference.cached_message.embeds[0].fields
-        ):
-            field = message.reference.cached_message.embeds[0].fields[0]
-            return cls(role=message.author.name, content=field.value)
-        # Process regular message
-        if message.content is not None:
-            return cls(role=message.author.name, content=message.content)
-        return None
+        content = _discord_message_text(message)
+        if content is None:
+            return None
+        return cls(role=message.author.name, content=content)
 
 
 class ChatHistory(BaseModel):
@@ -1,9 +1,12 @@
+import asyncio
+import io
 from enum import Enum
 
-from discord import Colour, Embed, Thread
+from discord import Colour, Embed, File, Thread
 from pydantic import BaseModel
 
-from src.aichan.config.env import MAX_CHARS_PER_MESSAGE
+from src.aichan.config.store import get_settings
+from src.aichan.discord.outbound import OutboundDispatcher
 
 
 class ResponseStatus(Enum):
@@ -34,15 +37,68 @@ class ResponseResult(BaseModel):
         The status of the response generation process.
     result : str | None
         The generated text response, or None if generation failed.
+    input_tokens : int | None
+        The number of input tokens of the request, if reported.
+    output_tokens : int | None
+        The number of generated tokens, if reported.
     """
 
     status: ResponseStatus
     result: str | None
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+
+
+# Name of the file long responses are attached as
+RESPONSE_FILENAME = "response.md"
+# Shown instead of a response when the prompt was flagged before reaching the model
+MODERATION_FLAGGED_MESSAGE = "**The message was not sent to the assistant.**"
+
+_FENCE = "```"
+# Longest code block opening line (fence and language) reopened in the next chunk
+_MAX_FENCE_LENGTH = 32
+
+
+def _split_long_line(line: str, limit: int) -> list[str]:
+    """Split a line longer than the limit, preferably at spaces.
+
+    Text without nearby spaces (e.g. Japanese) is cut at the limit.
+
+    Parameters
+    ----------
+    line : str
+        The line to split.
+    limit : int
+        The maximum number of characters per piece.
+
+    Returns
+    -------
+    list[str]
+        The pieces of the line, each within the limit.
+    """
+    pieces = []
+    while len(line) > limit:
+        cut = line.rfind(" ", 0, limit) + 1
+        if cut <= limit // 2:
+            cut = limit
+        pieces.append(line[:cut])
+        line = line[cut:]
+    pieces.append(line)
+    return pieces
+
+
+def _close_fence(chunk: str) -> str:
+    return f"{chunk}{_FENCE}" if chunk.endswith("\n") else f"{chunk}\n{_FENCE}"
 
 
 def _split_into_shorter_messages(message: str) -> list[str]:
     """Split a long message into multiple shorter messages.
 
+    The message is cut at paragraph breaks where possible, otherwise at
+    line breaks, and long lines at spaces. A code block cut in two is
+    closed at the end of a message and reopened, with its language, at
+    the start of the next one.
+
     Parameters
     ----------
     message : str
@@ -53,10 +109,49 @@ def _split_into_shorter_messages(message: str) -> list[str]:
     list[str]
         A list of message segments, each within the character limit.
     """
-    return [
-        message[i : i + MAX_CHARS_PER_MESSAGE]
-        for i in range(0, len(message), MAX_CHARS_PER_MESSAGE)
-    ]
+    limit = get_settings().max_chars_per_message
+    chunks: list[str] = []
+    lines: list[str] = []
+    size = 0
+    # Lines and size of the current chunk up to its last paragraph break
+    boundary = 0
+    boundary_size = 0
+    # Opening line of the code block the current line is in, if any
+    fence: str | None = None
+
+    for raw_line in message.splitlines(keepends=True):
+        stripped = raw_line.strip()
+        is_fence = stripped.startswith(_FENCE)
+        next_fence = (
+            (None if fence else stripped.split()[0][:_MAX_FENCE_LENGTH]) if is_fence else fence
+        )
+
+        # Leave room for closing the code block and reopening it in the next chunk
+        open_fence = fence or next_fence
+        reserve = len(_FENCE) + 1 if open_fence else 0
+        reopen = f"{open_fence}\n" if open_fence else ""
+        for line in _split_long_line(raw_line, limit - reserve - len(reopen)):
+            while lines and size + len(line) + reserve > limit:
+                if boundary and boundary_size >= limit // 2:
+                    chunks.append("".join(lines[:boundary]))
+                    lines = lines[boundary:]
+                else:
+                    chunk = "".join(lines)
+                    chunks.append(_close_fence(chunk) if fence else chunk)
+                    lines = [reopen] if fence else []
+                size = sum(map(len, lines))
+                boundary = boundary_size = 0
+            lines.append(line)
+            size += len(line)
+
+        fence = next_fence
+        if fence is None and not stripped:
+            boundary = len(lines)
+            boundary_size = size
+
+    chunks.append("".join(lines))
+    # Discord rejects empty messages
+    return [chunk for chunk in chunks if chunk.strip()]
 
 
 async def send_response_result(thread: Thread, result: ResponseResult) -> None:
@@ -70,23 +165,40 @@ async def send_response_result(thread: Thread, result: ResponseResult) -> None:
         The result of the response process, containing status,
         generated message, and status information.
     """
+    dispatcher = OutboundDispatcher()
     status = result.status
     if status == ResponseStatus.SUCCESS:
         if not result.result:
-            await thread.send(
+            await dispatcher.send(
+                thread,
                 embed=Embed(
                     description="**The assistant's response is empty.**",
                     color=Colour.yellow(),
                 ),
             )
+        elif 0 < get_settings().response_attachment_threshold < len(result.result):
+            # One upload instead of many messages
+            await dispatcher.send(
+                thread,
+                file=File(io.BytesIO(result.result.encode()), filename=RESPONSE_FILENAME),
+            )
         else:
             shorter_response = _split_into_shorter_messages(result.result)
-            for res in shorter_response:
-                await thread.send(res)
+            # Queue every chunk at once; the dispatcher keeps them in order
+            await asyncio.gather(*[dispatcher.enqueue(thread, res) for res in shorter_response])
     elif status == ResponseStatus.ERROR:
-        await thread.send(
+        await dispatcher.send(
+            thread,
             embed=Embed(
                 description="**An error has occurred.**",
                 color=Colour.red(),
             ),
         )
+    elif status == ResponseStatus.MODERATION_FLAGGED:
+        await dispatcher.send(
+            thread,
+            embed=Embed(
+                description=MODERATION_FLAGGED_MESSAGE,
+                color=Colour.yellow(),
+            ),
+        )
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.adapters.response import ResponseResult, ResponseStatus
+from src.aichan.ai.services.anthropic_text import get_client
+
+if TYPE_CHECKING:
+    from src.aichan.adapters.chat import Conversation
+    from src.aichan.ai.models.claude_model import ClaudeModelParams
+
+logger = parse_args_and_setup_logging()
+
+
+def anthropic_batch_params(
+    system_prompt: str,
+    prompt: Conversation,
+    model_params: ClaudeModelParams,
+) -> dict[str, Any]:
+    """Build the parameters of a request of a message batch.
+
+    Parameters
+    ----------
+    system_prompt : str
+        The system instruction.
+    prompt : Conversation
+        The conversation history.
+    model_params : ClaudeModelParams
+        The model parameters.
+
+    Returns
+    -------
+    dict[str, Any]
+        The parameters, as for the Messages API. They are JSON, so that
+        they can be stored until the batch is submitted.
+    """
+    return {
+        "model": str(model_params.model),
+        "max_tokens": model_params.max_tokens,
+        "system": system_prompt,
+        "messages": prompt.render_anthropic(),
+        "temperature": model_params.temperature,
+        "top_p": model_params.top_p,
+    }
+
+
+async def submit_anthropic_batch(requests: dict[str, dict[str, Any]]) -> str:
+    """Submit requests to the Message Batches API.
+
+    Parameters
+    ----------
+    requests : dict[str, dict[str, Any]]
+        The parameters of each request by custom_id, from
+        `anthropic_batch_params`.
+
+    Returns
+    -------
+    str
+        ID of the batch.
+    """
+    batch = await get_client().messages.batches.create(
+        # mypy(arg-type): expected "Iterable[Request]", the params are a plain dict
+        requests=[
+            {"custom_id": custom_id, "params": params}  # type: ignore
+            for custom_id, params in requests.items()
+        ],
+    )
+    return batch.id
+
+
+async def fetch_anthropic_batch(batch_id: str) -> dict[str, ResponseResult] | None:
+    """Get the results of a message batch once it has ended.
+
+    Parameters
+    ----------
+    batch_id : str
+        ID of the batch.
+
+    Returns
+    -------
+    dict[str, ResponseResult] | None
+        The result of each request by custom_id, or None if the batch is
+        still processing. Requests that errored, expired or were
+        canceled have status ERROR.
+    """
+    client = get_client()
+    batch = await client.messages.batches.retrieve(batch_id)
+    if batch.processing_status != "ended":
+        return None
+
+    results: dict[str, ResponseResult] = {}
+    async for entry in await client.messages.batches.results(batch_id):
+        result = entry.result
+        if result.type != "succeeded":
+            logger.warning("Request %s of batch %s %s", entry.custom_id, batch_id, result.type)
+            results[entry.custom_id] = ResponseResult(status=ResponseStatus.ERROR, result=None)
+            continue
+        message = result.message
+        results[entry.custom_id] = ResponseResult(
+            status=ResponseStatus.SUCCESS,
+            # mypy(union-attr): has no attribute "text"
+            result=message.content[0].text,  # type: ignore
+            input_tokens=message.usage.input_tokens,
+            output_tokens=message.usage.output_tokens,
+        )
+    return results
@@ -1,17 +1,44 @@
-import anthropic
+from __future__ import annotations
+
+from functools import cache
+from typing import TYPE_CHECKING
 
 from src.aichan._cli import parse_args_and_setup_logging
-from src.aichan.adapters.chat import ChatHistory, ChatMessage
 from src.aichan.adapters.response import ResponseResult, ResponseStatus
-from src.aichan.ai.models.claude_model import ClaudeModelParams
 
-client = anthropic.Anthropic()
+if TYPE_CHECKING:
+    from anthropic import AsyncAnthropic
+
+    from src.aichan.adapters.chat import Conversation
+    from src.aichan.ai.models.claude_model import ClaudeModelParams
+
 logger = parse_args_and_setup_logging()
 
 
+@cache
+def get_client() -> AsyncAnthropic:
+    """Return the Anthropic client, creating it on first use.
+
+    The SDK takes longer to import than the rest of the bot, so it is
+    only imported once a response is generated.
+
+    The client is asynchronous, so that concurrent requests do not
+    block the event loop.
+
+    Returns
+    -------
+    AsyncAnthropic
+        The shared Anthropic client.
+    """
+    # Deferred to keep the SDK out of the startup path
+    import anthropic  # noqa: PLC0415
+
+    return anthropic.AsyncAnthropic()
+
+
 async def generate_anthropic_response(
     system_prompt: str,
-    prompt: list[ChatMessage],
+    prompt: Conversation,
     model_params: ClaudeModelParams,
 ) -> ResponseResult:
     """Generate a response from the claude model.
@@ -21,15 +48,15 @@ async def generate_anthropic_response(
     system_prompt : str
         The system instruction.
 
-    prompt : list[ChatMessage]
-        A list of chat messages forming the conversation history.
+    prompt : Conversation
+        The conversation history.
 
     model_params : ClaudeModelParams
         The model parameters.
     """
     try:
-        convo = ChatHistory(messages=[*prompt, ChatMessage(role="assistant")]).render_message()
-        result = client.messages.create(
+        convo = prompt.render_anthropic()
+        result = await get_client().messages.create(
             # mypy(arg-type): expected "Iterable[MessageParam]"
             messages=convo,  # type: ignore
             # mypy(arg-type): expected ModelParam
@@ -42,7 +69,12 @@ async def generate_anthropic_response(
         )
         # mypy(union-attr): has no attribute "text"
         claude_result = result.content[0].text  # type: ignore
-        return ResponseResult(status=ResponseStatus.SUCCESS, result=claude_result)
+        return ResponseResult(
+            status=ResponseStatus.SUCCESS,
+            result=claude_result,
+            input_tokens=result.usage.input_tokens,
+            output_tokens=result.usage.output_tokens,
+        )
     except Exception as err:
         msg = f"Unexpected error has occurred: {err!s}"
         logger.exception(msg)
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import TYPE_CHECKING, Any, Final
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.adapters.response import ResponseResult, ResponseStatus
+from src.aichan.ai.services.openai_text import get_client
+
+if TYPE_CHECKING:
+    from src.aichan.adapters.chat import Conversation
+    from src.aichan.ai.models.gpt_model import GptModelParams
+
+logger = parse_args_and_setup_logging()
+
+_ENDPOINT: Final = "/v1/chat/completions"
+# Statuses of a batch after which it never changes
+_FINAL_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
+_HTTP_OK = 200
+
+
+def openai_batch_params(
+    system_prompt: str,
+    prompt: Conversation,
+    model_params: GptModelParams,
+) -> dict[str, Any]:
+    """Build the body of a request of a batch.
+
+    Parameters
+    ----------
+    system_prompt : str
+        The system instruction.
+    prompt : Conversation
+        The conversation history.
+    model_params : GptModelParams
+        The model parameters.
+
+    Returns
+    -------
+    dict[str, Any]
+        The body, as for the Chat Completions API. It is JSON, so that it
+        can be stored until the batch is submitted.
+    """
+    return {
+        "model": str(model_params.model),
+        "messages": prompt.render_openai(system_prompt),
+        "max_tokens": model_params.max_tokens,
+        "temperature": model_params.temperature,
+        "top_p": model_params.top_p,
+    }
+
+
+async def submit_openai_batch(requests: dict[str, dict[str, Any]]) -> str:
+    """Upload requests and submit them to the Batch API.
+
+    Parameters
+    ----------
+    requests : dict[str, dict[str, Any]]
+        The body of each request by custom_id, from `openai_batch_params`.
+
+    Returns
+    -------
+    str
+        ID of the batch.
+    """
+    lines = "".join(
+        json.dumps({"custom_id": custom_id, "method": "POST", "url": _ENDPOINT, "body": body})
+        + "\n"
+        for custom_id, body in requests.items()
+    )
+
+    def submit() -> str:
+        client = get_client()
+        file = client.files.create(file=("batch.jsonl", lines.encode()), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=file.id,
+            endpoint=_ENDPOINT,
+            completion_window="24h",
+        )
+        return batch.id
+
+    # The client is synchronous; uploads can take a while
+    return await asyncio.to_thread(submit)
+
+
+async def fetch_openai_batch(batch_id: str) -> dict[str, ResponseResult] | None:
+    """Get the results of a batch once it has finished.
+
+    Parameters
+    ----------
+    batch_id : str
+        ID of the batch.
+
+    Returns
+    -------
+    dict[str, ResponseResult] | None
+        The result of each request by custom_id, or None if the batch is
+        still processing. Failed requests have status ERROR, and those of
+        a batch that failed or expired as a whole are missing.
+    """
+
+    def fetch() -> dict[str, ResponseResult] | None:
+        client = get_client()
+        batch = client.batches.retrieve(batch_id)
+        if batch.status not in _FINAL_STATUSES:
+            return None
+        if batch.status != "completed":
+            logger.warning("Batch %s %s", batch_id, batch.status)
+        results: dict[str, ResponseResult] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id is None:
+                continue
+            for line in client.files.content(file_id).text.splitlines():
+                if line.strip():
+                    entry = json.loads(line)
+                    results[entry["custom_id"]] = _to_response_result(entry)
+        return results
+
+    return await asyncio.to_thread(fetch)
+
+
+def _to_response_result(entry: dict[str, Any]) -> ResponseResult:
+    response = entry.get("response") or {}
+    if response.get("status_code") != _HTTP_OK:
+        logger.warning("Request %s of a batch failed: %s", entry["custom_id"], entry.get("error"))
+        return ResponseResult(status=ResponseStatus.OPENAI_ERROR, result=None)
+    body = response["body"]
+    usage = body.get("usage") or {}
+    return ResponseResult(
+        status=ResponseStatus.SUCCESS,
+        result=body["choices"][0]["message"]["content"],
+        input_tokens=usage.get("prompt_tokens"),
+        output_tokens=usage.get("completion_tokens"),
+    )
@@ -1,23 +1,41 @@
-from openai import (
-    APIConnectionError,
-    APITimeoutError,
-    BadRequestError,
-    InternalServerError,
-    OpenAI,
-)
+from __future__ import annotations
+
+from functools import cache
+from typing import TYPE_CHECKING
 
 from src.aichan._cli import parse_args_and_setup_logging
-from src.aichan.adapters.chat import ChatHistory, ChatMessage
 from src.aichan.adapters.response import ResponseResult, ResponseStatus
-from src.aichan.ai.models.gpt_model import GptModelParams
 
-client = OpenAI()
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+    from src.aichan.adapters.chat import Conversation
+    from src.aichan.ai.models.gpt_model import GptModelParams
+
 logger = parse_args_and_setup_logging()
 
 
+@cache
+def get_client() -> OpenAI:
+    """Return the OpenAI client, creating it on first use.
+
+    The SDK takes longer to import than the rest of the bot, so it is
+    only imported once a response is generated.
+
+    Returns
+    -------
+    OpenAI
+        The shared OpenAI client.
+    """
+    # Deferred to keep the SDK out of the startup path
+    import openai  # noqa: PLC0415
+
+    return openai.OpenAI()
+
+
 async def generate_openai_response(
     system_prompt: str,
-    prompt: list[ChatMessage],
+    prompt: Conversation,
     model_params: GptModelParams,
 ) -> ResponseResult:
     """Generate a response from the GPT model.
@@ -27,17 +45,19 @@ async def generate_openai_response(
     system_prompt : str
         The system instruction.
 
-    prompt : list[ChatMessage]
-        A list of chat messages forming the conversation history.
+    prompt : Conversation
+        The conversation history.
 
     model_params : GptModelParams
         Configuration settings for the model, including parameters like
         max_tokens, temperature and top-p sampling.
     """
+    # Cheap once get_client has imported it; needed for the exception types
+    import openai  # noqa: PLC0415
+
     try:
-        convo = ChatHistory(messages=[*prompt, ChatMessage(role="assistant")]).render_message()
-        full_prompt = [{"role": "developer", "content": system_prompt}, *convo]
-        completion = client.chat.completions.create(
+        full_prompt = prompt.render_openai(system_prompt)
+        completion = get_client().chat.completions.create(
             # mypy(arg-type): expected loooooooooooooooooooooooong type
             messages=full_prompt,  # type: ignore
             # mypy(arg-type): expected ChatModel | str
@@ -48,12 +68,18 @@ async def generate_openai_response(
             top_p=model_params.top_p,
         )
         completion_result = completion.choices[0].message.content
-        return ResponseResult(status=ResponseStatus.SUCCESS, result=completion_result)
-    except (APIConnectionError, APITimeoutError, BadRequestError) as err:
+        usage = completion.usage
+        return ResponseResult(
+            status=ResponseStatus.SUCCESS,
+            result=completion_result,
+            input_tokens=None if usage is None else usage.prompt_tokens,
+            output_tokens=None if usage is None else usage.completion_tokens,
+        )
+    except (openai.APIConnectionError, openai.APITimeoutError, openai.BadRequestError) as err:
         msg = f"Failed to genarate text: {err!s}"
         logger.exception(msg)
         return ResponseResult(status=ResponseStatus.OPENAI_ERROR, result=None)
-    except InternalServerError as err:
+    except openai.InternalServerError as err:
         msg = f"InternalServerError has occurred: {err!s}"
         logger.exception(msg)
         return ResponseResult(status=ResponseStatus.OPENAI_ERROR, result=None)
@@ -1,40 +1,307 @@
 from __future__ import annotations
 
-import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
 
 from discord import app_commands
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Claude
-CLAUDE_DEFAULT_CONTEXT_WINDOW: int = int(os.environ["CLAUDE_DEFAULT_CONTEXT_WINDOW"])
-CLAUDE_DEFAULT_MAX_TOKENS: int = int(os.environ["CLAUDE_DEFAULT_MAX_TOKENS"])
-CLAUDE_DEFAULT_TEMPERATURE: float = float(os.environ["CLAUDE_DEFAULT_TEMPERATURE"])
-CLAUDE_DEFAULT_TOP_P: float = float(os.environ["CLAUDE_DEFAULT_TOP_P"])
-
-# Discord
-ADMIN_USER_IDS: list[int] = [
-    int(id_str) for id_str in os.environ["ADMIN_USER_IDS"].split(",") if id_str.strip()
-]
-AUTHORIZED_SERVER_IDS: list[int] = [
-    int(id_str) for id_str in os.environ["AUTHORIZED_SERVER_IDS"].split(",") if id_str.strip()
-]
-MAX_CHARS_PER_MESSAGE: int = int(os.environ["MAX_CHARS_PER_MESSAGE"])
-
-# GPT
-GPT_DEFAULT_CONTEXT_WINDOW: int = int(os.environ["GPT_DEFAULT_CONTEXT_WINDOW"])
-GPT_DEFAULT_MAX_TOKENS: int = int(os.environ["GPT_DEFAULT_MAX_TOKENS"])
-GPT_DEFAULT_TEMPERATURE: float = float(os.environ["GPT_DEFAULT_TEMPERATURE"])
-GPT_DEFAULT_TOP_P: float = float(os.environ["GPT_DEFAULT_TOP_P"])
-
-# Models
-CHAT_MODEL: str = os.environ["CHAT_MODEL"]
-FIXPY_MODEL: str = os.environ["FIXPY_MODEL"]
-
-
-def _get_model_choices(env_var: str) -> list[app_commands.Choice[int]]:
-    models_str = os.environ[env_var]
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+# 数字で上の階層を指定する (0は現在の階層、1は1つ上、2は2つ上...)
+ENV_PATH = Path(__file__).parents[3].joinpath(".env")
+
+# Discord's limit on the length of a message
+_DISCORD_MESSAGE_LIMIT = 2000
+
+
+class ModelPrice(NamedTuple):
+    """The price of a model, in USD per million tokens.
+
+    Attributes
+    ----------
+    model : str
+        The name of the model.
+    input : float
+        The price of input tokens.
+    output : float
+        The price of output tokens.
+    """
+
+    model: str
+    input: float
+    output: float
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class Settings:
+    """The configuration of the bot, read from the environment and `.env`.
+
+    Use `get_settings` from `config.store` instead of creating instances
+    directly, so that every module sees the same snapshot.
+
+    Raises
+    ------
+    ValueError
+        If a setting is out of its valid range.
+    """
+
+    # General
+    bot_name: str
+    db_name: str
+    timezone: str
+    discord_bot_token: str = field(repr=False)
+
+    # Claude
+    claude_default_context_window: int
+    claude_default_max_tokens: int
+    claude_default_temperature: float
+    claude_default_top_p: float
+    claude_models: tuple[app_commands.Choice[int], ...]
+    # Thread sessions of /talk kept in memory (count, idle seconds) and in the database (days)
+    thread_session_cache_size: int
+    thread_session_cache_ttl: float
+    thread_session_retention_days: int
+    # Summarize older messages of /talk threads once a request exceeds the threshold
+    # (input tokens), keeping the most recent messages verbatim. Without a model,
+    # threads are locked at claude_default_context_window messages instead.
+    thread_summary_model: str
+    thread_summary_max_tokens: int
+    thread_summary_threshold: int
+    thread_summary_keep_messages: int
+
+    # Discord
+    admin_user_ids: frozenset[int]
+    authorized_server_ids: frozenset[int]
+    max_chars_per_message: int
+    # Send longer responses as a file attachment (0 always splits into messages)
+    response_attachment_threshold: int
+    # Gateway memory profile. Without the members intent, members are fetched on demand.
+    discord_members_intent: bool
+    discord_chunk_guilds: bool
+    # Number of messages kept in the message cache (0 disables it)
+    discord_message_cache_size: int
+    # Sharding. A shard count of 0 uses the count recommended by Discord.
+    # discord_shard_ids (the shards of this process) is set by the launcher.
+    discord_shard_count: int
+    discord_shard_ids: tuple[int, ...]
+    discord_shard_processes: int
+    # Sync the slash commands on startup even if they have not changed
+    force_command_sync: bool
+    # Preload the allowed channels of authorized_server_ids when the bot is ready
+    channel_cache_warmup: bool
+
+    # GPT
+    gpt_default_context_window: int
+    gpt_default_max_tokens: int
+    gpt_default_temperature: float
+    gpt_default_top_p: float
+    gpt_models: tuple[app_commands.Choice[int], ...]
+
+    # Models
+    chat_model: str
+    # Answers of /chat reused for similar prompts (0 disables it): the number of
+    # answers, the minimum estimated cosine similarity, the index file and the
+    # days an answer is kept, which also drops those of a recreated index
+    chat_cache_size: int
+    chat_cache_threshold: float
+    chat_cache_path: str
+    chat_cache_retention_days: int
+    fixpy_model: str
+    # Worker processes checking /fixpy code locally before the model (0 disables it)
+    fixpy_analysis_workers: int
+    # Sandbox workers running the code of /fixpy answers and its doctests (0 disables
+    # it), with the wall-clock seconds and memory (MiB) each run may use
+    fixpy_verify_workers: int
+    fixpy_verify_timeout: float
+    fixpy_verify_memory_mb: int
+    # Answers of /fixpy kept for code equivalent up to formatting and names (0 disables it)
+    fixpy_cache_size: int
+    # /fixpy_batch: largest upload and total size of the files in a zip (bytes),
+    # functions fixed per upload and model requests running at once
+    fixpy_batch_max_bytes: int
+    fixpy_batch_max_units: int
+    fixpy_batch_concurrency: int
+
+    # Route simple turns of /talk and /chat to cheaper models of claude_models and
+    # gpt_models, which are listed from the cheapest to the most capable. The prices
+    # (USD per million input and output tokens) are used to record the cost saved.
+    model_routing: bool
+    model_prices: tuple[ModelPrice, ...]
+    # Days routing decisions are kept for /routing
+    model_routing_retention_days: int
+
+    # Scheduled jobs (cron expressions evaluated in timezone)
+    usage_sweep_cron: str
+
+    # Non-interactive requests sent through the batch APIs of the providers, at half
+    # the price within 24 hours: when queued requests are submitted, when running
+    # batches are checked, the most requests per batch, and the work deferred to them
+    batch_submit_cron: str
+    batch_poll_cron: str
+    batch_max_requests: int
+    fixpy_batch_deferred: bool
+    thread_summary_deferred: bool
+
+    # Seconds between checks of .env and .prompt.yml for changes (0 disables reloading)
+    config_watch_interval: float
+
+    # Rate limit (a rate of 0 disables the corresponding bucket)
+    rate_limit_user_per_minute: float
+    rate_limit_user_burst: int
+    rate_limit_guild_per_minute: float
+    rate_limit_guild_burst: int
+
+    # Local moderation of prompts before the model: a file of blocked terms (one per
+    # line, "re:" for a regular expression), the longest prompt, the longest run of one
+    # character and the smallest zlib compression ratio (0 disables each check)
+    moderation_blocklist_path: str
+    moderation_max_chars: int
+    moderation_max_char_run: int
+    moderation_min_compression_ratio: float
+
+    def __post_init__(self) -> None:
+        """Check that the settings are within their valid ranges."""
+        # The slash commands reject values outside of these ranges as well
+        for name in ("claude_default_temperature", "claude_default_top_p"):
+            if not 0.0 <= getattr(self, name) <= 1.0:
+                msg = f"{name.upper()} must be between 0.0 and 1.0."
+                raise ValueError(msg)
+        if not 0 < self.max_chars_per_message <= _DISCORD_MESSAGE_LIMIT:
+            msg = f"MAX_CHARS_PER_MESSAGE must be between 1 and {_DISCORD_MESSAGE_LIMIT}."
+            raise ValueError(msg)
+
+    @classmethod
+    def from_environ(cls, environ: Mapping[str, str]) -> Settings:
+        """Parse the settings from environment variables.
+
+        Parameters
+        ----------
+        environ : Mapping[str, str]
+            The environment variables.
+
+        Returns
+        -------
+        Settings
+            The parsed settings.
+
+        Raises
+        ------
+        KeyError
+            If a required variable is missing.
+        ValueError
+            If a variable has an invalid value.
+        """
+        return cls(
+            bot_name=environ["BOT_NAME"],
+            db_name=environ["DB_NAME"],
+            timezone=environ["TIMEZONE"],
+            discord_bot_token=environ["DISCORD_BOT_TOKEN"],
+            claude_default_context_window=int(environ["CLAUDE_DEFAULT_CONTEXT_WINDOW"]),
+            claude_default_max_tokens=int(environ["CLAUDE_DEFAULT_MAX_TOKENS"]),
+            claude_default_temperature=float(environ["CLAUDE_DEFAULT_TEMPERATURE"]),
+            claude_default_top_p=float(environ["CLAUDE_DEFAULT_TOP_P"]),
+            claude_models=_parse_model_choices(environ["CLAUDE_AVAILABLE_MODELS"]),
+            thread_session_cache_size=int(environ.get("THREAD_SESSION_CACHE_SIZE", "1024")),
+            thread_session_cache_ttl=float(environ.get("THREAD_SESSION_CACHE_TTL", "3600")),
+            thread_session_retention_days=int(environ.get("THREAD_SESSION_RETENTION_DAYS", "30")),
+            thread_summary_model=environ.get("THREAD_SUMMARY_MODEL", ""),
+            thread_summary_max_tokens=int(environ.get("THREAD_SUMMARY_MAX_TOKENS", "1024")),
+            thread_summary_threshold=int(environ.get("THREAD_SUMMARY_THRESHOLD", "8000")),
+            thread_summary_keep_messages=int(environ.get("THREAD_SUMMARY_KEEP_MESSAGES", "6")),
+            admin_user_ids=frozenset(_parse_ids(environ["ADMIN_USER_IDS"])),
+            authorized_server_ids=frozenset(_parse_ids(environ["AUTHORIZED_SERVER_IDS"])),
+            max_chars_per_message=int(environ["MAX_CHARS_PER_MESSAGE"]),
+            response_attachment_threshold=int(
+                environ.get("RESPONSE_ATTACHMENT_THRESHOLD", "6000"),
+            ),
+            discord_members_intent=_parse_bool(environ.get("DISCORD_MEMBERS_INTENT", "true")),
+            discord_chunk_guilds=_parse_bool(environ.get("DISCORD_CHUNK_GUILDS", "true")),
+            discord_message_cache_size=int(environ.get("DISCORD_MESSAGE_CACHE_SIZE", "1000")),
+            discord_shard_count=int(environ.get("DISCORD_SHARD_COUNT", "1")),
+            discord_shard_ids=_parse_ids(environ.get("DISCORD_SHARD_IDS", "")),
+            discord_shard_processes=int(environ.get("DISCORD_SHARD_PROCESSES", "1")),
+            force_command_sync=_parse_bool(environ.get("FORCE_COMMAND_SYNC", "false")),
+            channel_cache_warmup=_parse_bool(environ.get("CHANNEL_CACHE_WARMUP", "true")),
+            gpt_default_context_window=int(environ["GPT_DEFAULT_CONTEXT_WINDOW"]),
+            gpt_default_max_tokens=int(environ["GPT_DEFAULT_MAX_TOKENS"]),
+            gpt_default_temperature=float(environ["GPT_DEFAULT_TEMPERATURE"]),
+            gpt_default_top_p=float(environ["GPT_DEFAULT_TOP_P"]),
+            gpt_models=_parse_model_choices(environ["GPT_AVAILABLE_MODELS"]),
+            chat_model=environ["CHAT_MODEL"],
+            chat_cache_size=int(environ.get("CHAT_CACHE_SIZE", "0")),
+            chat_cache_threshold=float(environ.get("CHAT_CACHE_THRESHOLD", "0.97")),
+            chat_cache_path=environ.get("CHAT_CACHE_PATH", "chat_cache.bin"),
+            chat_cache_retention_days=int(environ.get("CHAT_CACHE_RETENTION_DAYS", "30")),
+            fixpy_model=environ["FIXPY_MODEL"],
+            fixpy_analysis_workers=int(environ.get("FIXPY_ANALYSIS_WORKERS", "2")),
+            fixpy_verify_workers=int(environ.get("FIXPY_VERIFY_WORKERS", "0")),
+            fixpy_verify_timeout=float(environ.get("FIXPY_VERIFY_TIMEOUT", "2")),
+            fixpy_verify_memory_mb=int(environ.get("FIXPY_VERIFY_MEMORY_MB", "256")),
+            fixpy_cache_size=int(environ.get("FIXPY_CACHE_SIZE", "1000")),
+            fixpy_batch_max_bytes=int(environ.get("FIXPY_BATCH_MAX_BYTES", "1000000")),
+            fixpy_batch_max_units=int(environ.get("FIXPY_BATCH_MAX_UNITS", "50")),
+            fixpy_batch_concurrency=int(environ.get("FIXPY_BATCH_CONCURRENCY", "4")),
+            model_routing=_parse_bool(environ.get("MODEL_ROUTING", "false")),
+            model_prices=_parse_model_prices(environ.get("MODEL_PRICES", "")),
+            model_routing_retention_days=int(environ.get("MODEL_ROUTING_RETENTION_DAYS", "30")),
+            usage_sweep_cron=environ.get("USAGE_SWEEP_CRON", "0 4 * * *"),
+            batch_submit_cron=environ.get("BATCH_SUBMIT_CRON", "*/5 * * * *"),
+            batch_poll_cron=environ.get("BATCH_POLL_CRON", "*/5 * * * *"),
+            batch_max_requests=int(environ.get("BATCH_MAX_REQUESTS", "10000")),
+            fixpy_batch_deferred=_parse_bool(environ.get("FIXPY_BATCH_DEFERRED", "false")),
+            thread_summary_deferred=_parse_bool(environ.get("THREAD_SUMMARY_DEFERRED", "false")),
+            config_watch_interval=float(environ.get("CONFIG_WATCH_INTERVAL", "5")),
+            rate_limit_user_per_minute=float(environ.get("RATE_LIMIT_USER_PER_MINUTE", "6")),
+            rate_limit_user_burst=int(environ.get("RATE_LIMIT_USER_BURST", "3")),
+            rate_limit_guild_per_minute=float(environ.get("RATE_LIMIT_GUILD_PER_MINUTE", "60")),
+            rate_limit_guild_burst=int(environ.get("RATE_LIMIT_GUILD_BURST", "20")),
+            moderation_blocklist_path=environ.get("MODERATION_BLOCKLIST_PATH", ""),
+            moderation_max_chars=int(environ.get("MODERATION_MAX_CHARS", "8000")),
+            moderation_max_char_run=int(environ.get("MODERATION_MAX_CHAR_RUN", "200")),
+            moderation_min_compression_ratio=float(
+                environ.get("MODERATION_MIN_COMPRESSION_RATIO", "0.1"),
+            ),
+        )
+
+
+# Settings that are only read on startup. Changes to them are ignored
+# by a reload and take effect after a restart.
+RESTART_ONLY_SETTINGS: frozenset[str] = frozenset(
+    {
+        "bot_name",
+        "db_name",
+        "timezone",
+        "discord_bot_token",
+        "discord_members_intent",
+        "discord_chunk_guilds",
+        "discord_message_cache_size",
+        "discord_shard_count",
+        "discord_shard_ids",
+        "discord_shard_processes",
+        "force_command_sync",
+        "channel_cache_warmup",
+        "usage_sweep_cron",
+        "batch_submit_cron",
+        "batch_poll_cron",
+        "fixpy_analysis_workers",
+        "fixpy_verify_workers",
+        "chat_cache_size",
+        "chat_cache_path",
+    },
+)
+
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() == "true"
+
+
+def _parse_ids(value: str) -> tuple[int, ...]:
+    return tuple(int(id_str) for id_str in value.split(",") if id_str.strip())
+
+
+def _parse_model_choices(models_str: str) -> tuple[app_commands.Choice[int], ...]:
     choices: list[app_commands.Choice[int]] = []
     if models_str:
         for entry in models_str.split(","):
@@ -49,8 +316,18 @@ def _get_model_choices(env_var: str) -> list[app_commands.Choice[int]]:
                 msg = "Invalid format in environment variable, expected 'name:value'."
                 raise ValueError(msg) from err
             choices.append(app_commands.Choice(name=name, value=value))
-    return choices
+    return tuple(choices)
 
 
-CLAUDE_MODELS = _get_model_choices("CLAUDE_AVAILABLE_MODELS")
-GPT_MODELS = _get_model_choices("GPT_AVAILABLE_MODELS")
+def _parse_model_prices(prices_str: str) -> tuple[ModelPrice, ...]:
+    prices: list[ModelPrice] = []
+    for entry in prices_str.split(","):
+        if not entry.strip():
+            continue
+        try:
+            model, input_price, output_price = entry.strip().split(":")
+            prices.append(ModelPrice(model, float(input_price), float(output_price)))
+        except ValueError as err:
+            msg = "Invalid format in MODEL_PRICES, expected 'name:input:output'."
+            raise ValueError(msg) from err
+    return tuple(prices)
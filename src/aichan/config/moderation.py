@@ -0,0 +1,223 @@
+"""The rules of the local moderation filter, compiled from the settings.
+
+Blocked words and phrases are looked up in a set, one hash lookup per
+word of the prompt (and per run of words, for phrases). Terms in text
+without spaces, such as Japanese, are compiled into a single regular
+expression shaped like a trie, so that the regex engine matches all of
+them in one pass in C, as an Aho-Corasick automaton would, instead of
+trying every term in turn.
+
+Spam is detected by its length, by long runs of one character and by how
+well it compresses, as repeated text compresses far better than prose.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+import zlib
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from src.aichan.config.env import Settings
+
+# Lines of the blocklist holding a regular expression instead of a term
+_REGEX_PREFIX = "re:"
+# ASCII terms and prompts are split into words, so that "ass" does not match "class"
+_WORD = re.compile(r"[a-z0-9]+")
+# Shorter prompts are not checked for repetition, as they barely compress
+_MIN_COMPRESSED_LENGTH = 256
+
+
+class ModerationFilter(NamedTuple):
+    """The compiled rules of the filter.
+
+    Use `get_config` from `config.store` instead of compiling them, so
+    that an invalid blocklist is rejected when the settings are loaded.
+
+    Attributes
+    ----------
+    words : frozenset[str]
+        The blocked ASCII terms, as their words joined by single spaces.
+    phrase_lengths : tuple[int, ...]
+        The numbers of words of the blocked phrases, i.e. terms of more
+        than one word.
+    patterns : tuple[re.Pattern[str], ...]
+        The other blocked terms as a trie, and the blocked expressions.
+    max_chars : int
+        The longest prompt allowed (0 allows any length).
+    char_run : re.Pattern[str] | None
+        Matches a character repeated too many times.
+    min_compression_ratio : float
+        The smallest compressed to original size ratio allowed.
+    """
+
+    words: frozenset[str]
+    phrase_lengths: tuple[int, ...]
+    patterns: tuple[re.Pattern[str], ...]
+    max_chars: int
+    char_run: re.Pattern[str] | None
+    min_compression_ratio: float
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> ModerationFilter:
+        """Compile the rules from the settings and the blocklist file.
+
+        Parameters
+        ----------
+        settings : Settings
+            The settings.
+
+        Returns
+        -------
+        ModerationFilter
+            The compiled rules.
+
+        Raises
+        ------
+        OSError
+            If the blocklist file cannot be read.
+        re.error
+            If an expression of the blocklist is invalid.
+        """
+        words: set[str] = set()
+        terms: list[str] = []
+        expressions: list[str] = []
+        if settings.moderation_blocklist_path:
+            text = Path(settings.moderation_blocklist_path).read_text(encoding="utf-8")
+            for raw_line in text.splitlines():
+                line = raw_line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith(_REGEX_PREFIX):
+                    expressions.append(line.removeprefix(_REGEX_PREFIX))
+                    continue
+                term = normalize(line)
+                term_words = _WORD.findall(term)
+                if term.isascii() and term_words:
+                    words.add(" ".join(term_words))
+                else:
+                    terms.append(term)
+
+        patterns: list[re.Pattern[str]] = []
+        # Separate patterns, as the regex engine only skips ahead to the
+        # possible first characters of a pattern that is not an alternation
+        if terms:
+            patterns.append(re.compile(trie_pattern(terms)))
+        if expressions:
+            patterns.append(re.compile("|".join(f"(?:{exp})" for exp in expressions)))
+        max_run = settings.moderation_max_char_run
+        return cls(
+            words=frozenset(words),
+            phrase_lengths=tuple(sorted({word.count(" ") + 1 for word in words} - {1})),
+            patterns=tuple(patterns),
+            max_chars=settings.moderation_max_chars,
+            char_run=re.compile(rf"(.)\1{{{max_run - 1},}}", re.DOTALL) if max_run > 1 else None,
+            min_compression_ratio=settings.moderation_min_compression_ratio,
+        )
+
+    def check(self, text: str) -> str | None:
+        """Check a prompt against the rules.
+
+        Parameters
+        ----------
+        text : str
+            The prompt.
+
+        Returns
+        -------
+        str | None
+            The reason the prompt was flagged, or None if it passes.
+        """
+        if self.max_chars and len(text) > self.max_chars:
+            return "too-long"
+        if self.char_run is not None and self.char_run.search(text):
+            return "repeated-character"
+        if self.min_compression_ratio > 0:
+            data = text.encode()
+            if len(data) >= _MIN_COMPRESSED_LENGTH:
+                # Level 1 is several times faster and finds repetition just as well
+                ratio = len(zlib.compress(data, 1)) / len(data)
+                if ratio < self.min_compression_ratio:
+                    return "repetitive"
+        if self.words or self.patterns:
+            normalized = normalize(text)
+            if self._has_blocked_words(normalized) or any(
+                pattern.search(normalized) for pattern in self.patterns
+            ):
+                return "blocked-term"
+        return None
+
+    def _has_blocked_words(self, normalized: str) -> bool:
+        if not self.words:
+            return False
+        words = _WORD.findall(normalized)
+        if not self.words.isdisjoint(words):
+            return True
+        for length in self.phrase_lengths:
+            runs = zip(*(words[i:] for i in range(length)), strict=False)
+            if not self.words.isdisjoint(map(" ".join, runs)):
+                return True
+        return False
+
+
+def normalize(text: str) -> str:
+    """Normalize text so that width and case variants match the same terms.
+
+    Parameters
+    ----------
+    text : str
+        The text.
+
+    Returns
+    -------
+    str
+        The NFKC normalized, case folded text.
+    """
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def trie_pattern(terms: list[str]) -> str:
+    """Build a regular expression matching any of the terms.
+
+    Terms sharing a prefix share the branch of the prefix, so the regex
+    engine tests each character of the text against one trie node
+    instead of against every term.
+
+    Parameters
+    ----------
+    terms : list[str]
+        The literal terms, at least one.
+
+    Returns
+    -------
+    str
+        The regular expression.
+    """
+    trie: dict[str, dict] = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        # An empty key marks the end of a term
+        node[""] = {}
+    return _trie_to_pattern(trie)
+
+
+def _trie_to_pattern(node: dict[str, dict]) -> str:
+    # A term that ends here, as "" sorts first, makes the rest optional
+    ends = "" in node
+    branches = [re.escape(char) + _trie_to_pattern(child) for char, child in node.items() if char]
+    if not branches:
+        return ""
+    # Single characters combine into a class, which is faster than an alternation
+    if all(len(branch) == 1 for branch in branches) and len(branches) > 1:
+        pattern = f"[{''.join(branches)}]"
+    elif len(branches) == 1:
+        pattern = branches[0]
+    else:
+        pattern = f"(?:{'|'.join(branches)})"
+    if ends:
+        return f"(?:{pattern})?" if len(branches) > 1 or len(pattern) > 1 else f"{pattern}?"
+    return pattern
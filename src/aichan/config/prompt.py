@@ -1,11 +1,111 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any
 
 import yaml
 
 # 数字で上の階層を指定する (0は現在の階層、1は1つ上、2は2つ上...)
-with Path(__file__).parents[3].joinpath(".prompt.yml").open(encoding="utf-8") as f:
-    config = yaml.safe_load(f)
+PROMPT_PATH = Path(__file__).parents[3].joinpath(".prompt.yml")
+
+_DEFAULT_SUMMARY_SYSTEM = (
+    "Summarize the conversation so that it can be continued without the original messages. "
+    "Keep facts, decisions, open questions and the user's preferences, "
+    "and write in the language of the conversation."
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Prompts:
+    """The system prompts of the bot, read from `.prompt.yml`.
+
+    Use `get_config` from `config.store` instead of creating instances
+    directly, so that every module sees the same snapshot.
+    """
+
+    chat_system: str
+    claude_system: str
+    fixpy_system: str
+    summary_system: str
+
+    @classmethod
+    def from_file(cls, path: Path) -> Prompts:
+        """Read the prompts from a YAML file.
+
+        Parameters
+        ----------
+        path : Path
+            Path of the file, usually `PROMPT_PATH`.
+
+        Returns
+        -------
+        Prompts
+            The system prompts.
+
+        Raises
+        ------
+        OSError
+            If the file cannot be read.
+        yaml.YAMLError
+            If the file is not valid YAML.
+        TypeError
+            If the file is not a mapping.
+        KeyError
+            If a required prompt is missing.
+        """
+        with path.open(encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        if not isinstance(config, dict):
+            msg = f"{path.name} must be a mapping of prompt keys to prompts."
+            raise TypeError(msg)
+        return cls.from_config(config)
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> Prompts:
+        """Create the prompts from the parsed `.prompt.yml`.
+
+        Parameters
+        ----------
+        config : dict[str, Any]
+            The parsed YAML document.
+
+        Returns
+        -------
+        Prompts
+            The system prompts.
+
+        Raises
+        ------
+        KeyError
+            If a required prompt is missing.
+        """
+        return cls(
+            chat_system=config["chat_system"],
+            claude_system=config["claude_system"],
+            fixpy_system=config["fixpy_system"],
+            summary_system=config.get("summary_system", _DEFAULT_SUMMARY_SYSTEM),
+        )
+
+    def by_key(self, key: str) -> str:
+        """Look up a system prompt by its key in `.prompt.yml`.
+
+        Parameters
+        ----------
+        key : str
+            The key of the prompt, e.g. "claude_system".
+
+        Returns
+        -------
+        str
+            The system prompt.
 
-CHAT_SYSTEM: str = config.get("chat_system")
-CLAUDE_SYSTEM: str = config.get("claude_system")
-FIXPY_SYSTEM: str = config.get("fixpy_system")
+        Raises
+        ------
+        KeyError
+            If there is no prompt with the key.
+        """
+        if key not in self.__slots__:
+            raise KeyError(key)
+        prompt: str = getattr(self, key)
+        return prompt
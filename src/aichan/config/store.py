@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import os
+import re
+from typing import TYPE_CHECKING, NamedTuple, Self
+
+import yaml
+from dotenv import dotenv_values, load_dotenv
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.config.env import ENV_PATH, RESTART_ONLY_SETTINGS, Settings
+from src.aichan.config.moderation import ModerationFilter
+from src.aichan.config.prompt import PROMPT_PATH, Prompts
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+logger = parse_args_and_setup_logging()
+
+# Errors of an invalid `.env`, `.prompt.yml` or blocklist, which keep the current snapshot
+_CONFIG_ERRORS = (OSError, KeyError, TypeError, ValueError, yaml.YAMLError, re.error)
+
+
+class ConfigSnapshot(NamedTuple):
+    """The settings and prompts of the bot, loaded together.
+
+    A snapshot never changes. A reload replaces it with a new one, so a
+    handler that takes a snapshot at the start of a turn sees the same
+    configuration until the turn ends.
+
+    The moderation filter is compiled with the settings, so that an
+    invalid blocklist is rejected when it is loaded.
+    """
+
+    settings: Settings
+    prompts: Prompts
+    moderation: ModerationFilter
+    version: int
+
+
+class ReloadResult(NamedTuple):
+    """The outcome of a configuration reload."""
+
+    changed: tuple[str, ...]
+    needs_restart: tuple[str, ...]
+
+
+class ConfigStore:
+    """A singleton holder of the current configuration snapshot.
+
+    The snapshot is loaded from the environment, `.env` and `.prompt.yml`
+    on first use, and replaced by `reload` when the files change. An
+    invalid file is reported and the previous snapshot is kept.
+
+    Variables set in the process environment take precedence over `.env`,
+    as with `load_dotenv`, so only `.env` entries can be reloaded.
+    """
+
+    _instance = None
+    snapshot: ConfigSnapshot | None
+    process_env: dict[str, str]
+    mtimes: tuple[int | None, int | None]
+
+    def __new__(cls) -> Self:
+        """Create a new instance of ConfigStore or return the existing one.
+
+        Returns
+        -------
+        Self
+            The singleton instance of ConfigStore.
+        """
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.snapshot = None
+            cls._instance.process_env = {}
+            cls._instance.mtimes = (None, None)
+        return cls._instance
+
+    @property
+    def current(self) -> ConfigSnapshot:
+        """The current snapshot, loaded on first use."""
+        if self.snapshot is None:
+            self.process_env = dict(os.environ)
+            # Provider SDKs read their API keys from the environment
+            load_dotenv(ENV_PATH)
+            self.mtimes = self._stat()
+            settings = self._load_settings()
+            self.snapshot = ConfigSnapshot(
+                settings=settings,
+                prompts=Prompts.from_file(PROMPT_PATH),
+                moderation=ModerationFilter.from_settings(settings),
+                version=1,
+            )
+        return self.snapshot
+
+    def reload(self) -> ReloadResult:
+        """Load `.env` and `.prompt.yml` again and swap in a new snapshot.
+
+        Changes to settings that are only read on startup are reported
+        but not applied.
+
+        Returns
+        -------
+        ReloadResult
+            The names of the changed settings and prompts, and of the
+            changed settings that need a restart.
+
+        Raises
+        ------
+        OSError, KeyError, TypeError, ValueError, yaml.YAMLError, re.error
+            If a file, including the moderation blocklist, is invalid. The
+            current snapshot is kept.
+        """
+        old = self.current
+        self.mtimes = self._stat()
+        settings = self._load_settings()
+        prompts = Prompts.from_file(PROMPT_PATH)
+
+        needs_restart = tuple(
+            name
+            for name in sorted(RESTART_ONLY_SETTINGS)
+            if getattr(settings, name) != getattr(old.settings, name)
+        )
+        settings = dataclasses.replace(
+            settings,
+            **{name: getattr(old.settings, name) for name in RESTART_ONLY_SETTINGS},
+        )
+        changed = tuple(
+            field.name
+            for snapshot_field, new in (("settings", settings), ("prompts", prompts))
+            for field in dataclasses.fields(new)
+            if getattr(new, field.name) != getattr(getattr(old, snapshot_field), field.name)
+        )
+
+        moderation = ModerationFilter.from_settings(settings)
+
+        self.snapshot = ConfigSnapshot(settings, prompts, moderation, old.version + 1)
+        logger.info("Loaded configuration version %d", self.snapshot.version)
+        if needs_restart:
+            logger.warning("Restart to apply the changes to %s", ", ".join(needs_restart))
+        return ReloadResult(changed, needs_restart)
+
+    async def watch(self) -> None:
+        """Reload the configuration whenever `.env` or `.prompt.yml` changes.
+
+        Runs until cancelled. The files are checked every
+        `config_watch_interval` seconds; an interval of 0 disables it.
+        """
+        while (interval := self.current.settings.config_watch_interval) > 0:
+            await asyncio.sleep(interval)
+            if self._stat() == self.mtimes:
+                continue
+            try:
+                result = self.reload()
+            except _CONFIG_ERRORS:
+                logger.exception("Kept the current configuration, the new one is invalid")
+                continue
+            logger.info("Configuration changed: %s", ", ".join(result.changed) or "nothing")
+
+    def _load_settings(self) -> Settings:
+        environ = {
+            key: value for key, value in dotenv_values(ENV_PATH).items() if value is not None
+        }
+        environ.update(self.process_env)
+        return Settings.from_environ(environ)
+
+    @staticmethod
+    def _stat() -> tuple[int | None, int | None]:
+        return _mtime(ENV_PATH), _mtime(PROMPT_PATH)
+
+
+def _mtime(path: Path) -> int | None:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def get_config() -> ConfigSnapshot:
+    """Return the current configuration snapshot.
+
+    Take one snapshot per turn and read both settings and prompts from
+    it, so that a reload in the middle of the turn is not seen halfway.
+
+    Returns
+    -------
+    ConfigSnapshot
+        The current snapshot.
+    """
+    return ConfigStore().current
+
+
+def get_settings() -> Settings:
+    """Return the settings of the current snapshot.
+
+    Returns
+    -------
+    Settings
+        The current settings.
+    """
+    return ConfigStore().current.settings
@@ -1,15 +1,13 @@
 from __future__ import annotations
 
-import os
 from typing import TYPE_CHECKING
 
 import pytz
-from dotenv import load_dotenv
+
+from src.aichan.config.store import get_settings
 
 if TYPE_CHECKING:
     from pytz import _UTCclass
     from pytz.tzinfo import DstTzInfo, StaticTzInfo
 
-load_dotenv()
-_tz: str = os.environ["TIMEZONE"]
-TIMEZONE: _UTCclass | DstTzInfo | StaticTzInfo = pytz.timezone(_tz)
+TIMEZONE: _UTCclass | DstTzInfo | StaticTzInfo = pytz.timezone(get_settings().timezone)
@@ -1,16 +1,67 @@
-import os
 import re
 
-from dotenv import load_dotenv
+import aiosqlite
 
-load_dotenv()
+from src.aichan.config.store import get_settings
+
+# SQLite's value of `PRAGMA auto_vacuum` for incremental mode
+_AUTO_VACUUM_INCREMENTAL = 2
 
 
 class SQLiteDaoBase:
-    DB_NAME: str = os.environ["DB_NAME"]
+    DB_NAME: str = get_settings().db_name
 
     @staticmethod
     def validate_table_name(table_name: str) -> bool:
         """Only letters, numbers, and underscores are allowed."""
         pattern = r"^[A-Za-z0-9_]+$"
         return bool(re.match(pattern, table_name))
+
+    @classmethod
+    async def enable_incremental_vacuum(cls) -> None:
+        """Switch the database file to incremental auto-vacuum mode.
+
+        Changing the mode of an existing database requires a one-off
+        `VACUUM`, which is only run when the mode is not already set.
+        """
+        conn = await aiosqlite.connect(cls.DB_NAME)
+        try:
+            cursor = await conn.execute("PRAGMA auto_vacuum")
+            row = await cursor.fetchone()
+            if row is not None and row[0] == _AUTO_VACUUM_INCREMENTAL:
+                return
+            await conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await conn.execute("VACUUM")
+        finally:
+            await conn.close()
+
+    @classmethod
+    async def enable_wal(cls) -> None:
+        """Switch the database file to write-ahead logging.
+
+        In WAL mode readers do not block the writer and vice versa, so
+        several bot processes can share the database. The mode is stored
+        in the file and only needs to be set once.
+        """
+        conn = await aiosqlite.connect(cls.DB_NAME)
+        try:
+            await conn.execute("PRAGMA journal_mode = WAL")
+        finally:
+            await conn.close()
+
+    @classmethod
+    async def incremental_vacuum(cls, pages: int = 1000) -> None:
+        """Return up to `pages` free pages to the file system.
+
+        Parameters
+        ----------
+        pages : int
+            Maximum number of free pages to release.
+        """
+        conn = await aiosqlite.connect(cls.DB_NAME)
+        try:
+            cursor = await conn.execute(f"PRAGMA incremental_vacuum({int(pages)})")
+            # The pragma frees pages step by step while its rows are read
+            await cursor.fetchall()
+        finally:
+            await conn.close()
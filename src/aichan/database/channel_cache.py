@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from typing import Self
+
+from src.aichan.database.dao.channel_dao import ChannelDAO
+
+
+class AllowedChannelCache:
+    """A singleton write-through cache of allowed channels per guild.
+
+    Reads are served from an in-memory frozenset per guild, loaded from
+    the database on the first miss. Writes go through this class so that
+    the database and the cache never diverge.
+    """
+
+    _instance = None
+    data: dict[int, frozenset[int]]
+
+    def __new__(cls) -> Self:
+        """Create a new instance of AllowedChannelCache or return the existing one.
+
+        Returns
+        -------
+        Self
+            The singleton instance of AllowedChannelCache.
+        """
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.data = {}
+        return cls._instance
+
+    async def warmup(self, guild_ids: list[int]) -> None:
+        """Load the allowed channels of several guilds with one query.
+
+        Parameters
+        ----------
+        guild_ids : list[int]
+            IDs of the Discord guilds/servers to load.
+        """
+        channels = await ChannelDAO().get_allowed_channels_by_guilds(guild_ids)
+        for guild_id, channel_ids in channels.items():
+            self.data[guild_id] = frozenset(channel_ids)
+
+    async def get_allowed_channels(self, guild_id: int) -> frozenset[int]:
+        """Get the allowed channels of a guild.
+
+        Parameters
+        ----------
+        guild_id : int
+            ID of the Discord guild/server.
+
+        Returns
+        -------
+        frozenset[int]
+            Allowed channel IDs. Empty if no channel is restricted.
+        """
+        channels = self.data.get(guild_id)
+        if channels is None:
+            channels = frozenset(await ChannelDAO().get_allowed_channels(guild_id))
+            self.data[guild_id] = channels
+        return channels
+
+    async def add_allowed_channel(self, channel_id: int, guild_id: int, added_by: int) -> None:
+        """Add a channel to the allowed channels list.
+
+        Parameters
+        ----------
+        channel_id : int
+            ID of the Discord channel.
+        guild_id : int
+            ID of the Discord guild/server.
+        added_by : int
+            ID of the user who added the channel.
+        """
+        await ChannelDAO().add_allowed_channel(channel_id, guild_id, added_by)
+        # The upsert may move the channel from another guild
+        self._discard(channel_id)
+        if guild_id in self.data:
+            self.data[guild_id] = self.data[guild_id] | {channel_id}
+
+    async def remove_allowed_channel(self, channel_id: int) -> bool:
+        """Remove a channel from the allowed channels list.
+
+        Parameters
+        ----------
+        channel_id : int
+            ID of the Discord channel.
+
+        Returns
+        -------
+        bool
+            True if the channel was removed, False if it wasn't found.
+        """
+        removed = await ChannelDAO().remove_allowed_channel(channel_id)
+        self._discard(channel_id)
+        return removed
+
+    def _discard(self, channel_id: int) -> None:
+        for guild_id, channels in self.data.items():
+            if channel_id in channels:
+                self.data[guild_id] = channels - {channel_id}
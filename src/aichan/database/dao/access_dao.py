@@ -17,34 +17,6 @@ class AccessDAO(SQLiteDaoBase):
 
     _table_name = "access"
 
-    async def create_table(self) -> None:
-        """Create table if it doesn't exist.
-
-        Raises
-        ------
-        ValueError
-            If the table name contains invalid characters
-        """
-        if not self.validate_table_name(self._table_name):
-            msg = "Invalid table name: Only alphanumeric characters and underscores are allowed."
-            raise ValueError(msg)
-
-        conn = await aiosqlite.connect(super().DB_NAME)
-        try:
-            query = f"""
-            CREATE TABLE IF NOT EXISTS {self._table_name} (
-                id          INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id     INTEGER NOT NULL,
-                access_type TEXT NOT NULL,
-                granted_at  DATE NOT NULL,
-                disabled_at DATE DEFAULT NULL
-            );
-            """
-            await conn.execute(query)
-            await conn.commit()
-        finally:
-            await conn.close()
-
     async def insert(self, user_id: int, access_type: str) -> None:
         """Insert a new access right record for a user.
 
@@ -67,30 +39,57 @@ class AccessDAO(SQLiteDaoBase):
         finally:
             await conn.close()
 
-    async def fetch_user_ids_by_access_type(self, access_type: str) -> list[int]:
-        """Fetch IDs of users who have a specific active access type.
+    async def fetch_access_types(self, user_id: int) -> list[str]:
+        """Fetch the active access types of a user.
 
         Parameters
         ----------
-        access_type : str
-            Type of access to filter by.
+        user_id : int
+            ID of the user to look up.
 
         Returns
         -------
-        list[int]
-            List of user IDs with the specified active access type.
+        list[str]
+            Distinct active access types of the user.
         """
         conn = await aiosqlite.connect(super().DB_NAME)
         try:
             query = """
-            SELECT user_id FROM access WHERE access_type = ? AND disabled_at IS NULL;
+            SELECT DISTINCT access_type FROM access WHERE user_id = ? AND disabled_at IS NULL;
             """
-            cursor = await conn.execute(query, (access_type,))
+            cursor = await conn.execute(query, (user_id,))
             rows = await cursor.fetchall()
             return [row[0] for row in rows]
         finally:
             await conn.close()
 
+    async def has_access_type(self, user_id: int, access_type: str) -> bool:
+        """Check if a user has a specific active access type.
+
+        Parameters
+        ----------
+        user_id : int
+            ID of the user to look up.
+        access_type : str
+            Type of access to check.
+
+        Returns
+        -------
+        bool
+            True if the user has the active access type, False otherwise.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            SELECT 1 FROM access
+            WHERE access_type = ? AND disabled_at IS NULL AND user_id = ?
+            LIMIT 1;
+            """
+            cursor = await conn.execute(query, (access_type, user_id))
+            return await cursor.fetchone() is not None
+        finally:
+            await conn.close()
+
     async def disable(self, user_id: int, access_type: str) -> None:
         """Disable a specific access right for a user.
 
@@ -0,0 +1,60 @@
+import aiosqlite
+
+from src.aichan.database._dao_base import SQLiteDaoBase
+
+
+class AppStateDAO(SQLiteDaoBase):
+    """Data Access Object for small pieces of application state.
+
+    Attributes
+    ----------
+    _table_name : str
+        Name of the database table for application state.
+    """
+
+    _table_name = "app_state"
+
+    async def get(self, key: str) -> str | None:
+        """Get a stored value.
+
+        Parameters
+        ----------
+        key : str
+            Name of the value.
+
+        Returns
+        -------
+        str | None
+            The value, or None if it was never set.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            SELECT value FROM app_state WHERE key = ?
+            """
+            cursor = await conn.execute(query, (key,))
+            row = await cursor.fetchone()
+            return None if row is None else str(row[0])
+        finally:
+            await conn.close()
+
+    async def set(self, key: str, value: str) -> None:
+        """Store a value.
+
+        Parameters
+        ----------
+        key : str
+            Name of the value.
+        value : str
+            The value to store.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            INSERT INTO app_state (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            """
+            await conn.execute(query, (key, value))
+            await conn.commit()
+        finally:
+            await conn.close()
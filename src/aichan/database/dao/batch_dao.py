@@ -0,0 +1,294 @@
+import time
+
+import aiosqlite
+
+from src.aichan.database._dao_base import SQLiteDaoBase
+
+
+class BatchDAO(SQLiteDaoBase):
+    """Data Access Object for deferred requests sent through batch APIs.
+
+    Requests belong to a group, e.g. the functions of one `/fixpy_batch`
+    upload, and a group is delivered once every request has a result.
+    Groups belong to the process that created them, so that each process
+    delivers the results of its own threads.
+
+    Attributes
+    ----------
+    _table_name : str
+        Name of the database table for groups of requests.
+    """
+
+    _table_name = "batch_groups"
+
+    async def add_group(
+        self,
+        group_id: str,
+        kind: str,
+        owner: str,
+        context: str,
+        requests: list[tuple[str, str, str]],
+    ) -> bool:
+        """Add a group of requests, unless a group with the same ID exists.
+
+        Parameters
+        ----------
+        group_id : str
+            ID of the group.
+        kind : str
+            The kind of the group, which selects how it is delivered.
+        owner : str
+            The process that delivers the group.
+        context : str
+            JSON of what the delivery needs, e.g. the thread ID.
+        requests : list[tuple[str, str, str]]
+            (custom_id, provider, JSON of the request parameters) of each request.
+
+        Returns
+        -------
+        bool
+            True if the group was added, False if it already exists.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            INSERT OR IGNORE INTO batch_groups (group_id, kind, owner, context, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            """
+            cursor = await conn.execute(query, (group_id, kind, owner, context, time.time()))
+            if cursor.rowcount == 0:
+                return False
+            query = """
+            INSERT INTO batch_requests (custom_id, group_id, provider, params)
+            VALUES (?, ?, ?, ?)
+            """
+            await conn.executemany(
+                query,
+                [
+                    (custom_id, group_id, provider, params)
+                    for custom_id, provider, params in requests
+                ],
+            )
+            await conn.commit()
+            return True
+        finally:
+            await conn.close()
+
+    async def get_unsubmitted(
+        self,
+        owner: str,
+        provider: str,
+        limit: int,
+    ) -> list[tuple[str, str]]:
+        """Get the requests of a provider that are not in a batch yet.
+
+        Parameters
+        ----------
+        owner : str
+            The process that owns the groups of the requests.
+        provider : str
+            The provider, e.g. 'anthropic'.
+        limit : int
+            Maximum number of requests returned.
+
+        Returns
+        -------
+        list[tuple[str, str]]
+            (custom_id, JSON of the request parameters), oldest first.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            SELECT r.custom_id, r.params
+            FROM batch_requests r JOIN batch_groups g ON g.group_id = r.group_id
+            WHERE g.owner = ? AND r.provider = ? AND r.batch_id IS NULL
+            ORDER BY g.created_at
+            LIMIT ?
+            """
+            cursor = await conn.execute(query, (owner, provider, limit))
+            rows = await cursor.fetchall()
+            return [(row[0], row[1]) for row in rows]
+        finally:
+            await conn.close()
+
+    async def set_batch_id(self, custom_ids: list[str], batch_id: str) -> None:
+        """Record the batch that requests were submitted in.
+
+        Parameters
+        ----------
+        custom_ids : list[str]
+            The requests.
+        batch_id : str
+            ID of the batch at the provider.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            UPDATE batch_requests SET batch_id = ? WHERE custom_id = ?
+            """
+            await conn.executemany(query, [(batch_id, custom_id) for custom_id in custom_ids])
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def get_running_batches(self, owner: str) -> list[tuple[str, str]]:
+        """Get the batches that still have requests without a result.
+
+        Parameters
+        ----------
+        owner : str
+            The process that owns the groups of the requests.
+
+        Returns
+        -------
+        list[tuple[str, str]]
+            (provider, batch_id) of each batch.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            SELECT DISTINCT r.provider, r.batch_id
+            FROM batch_requests r JOIN batch_groups g ON g.group_id = r.group_id
+            WHERE g.owner = ? AND r.batch_id IS NOT NULL AND r.result IS NULL
+            """
+            cursor = await conn.execute(query, (owner,))
+            rows = await cursor.fetchall()
+            return [(row[0], row[1]) for row in rows]
+        finally:
+            await conn.close()
+
+    async def set_results(self, batch_id: str, results: dict[str, str], missing: str) -> None:
+        """Store the results of the requests of a finished batch.
+
+        Parameters
+        ----------
+        batch_id : str
+            ID of the batch at the provider.
+        results : dict[str, str]
+            JSON of the result of each request by custom_id.
+        missing : str
+            JSON of the result of the requests of the batch missing from
+            `results`, e.g. because the whole batch expired.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            UPDATE batch_requests SET result = ? WHERE custom_id = ? AND batch_id = ?
+            """
+            await conn.executemany(
+                query,
+                [(result, custom_id, batch_id) for custom_id, result in results.items()],
+            )
+            query = """
+            UPDATE batch_requests SET result = ? WHERE batch_id = ? AND result IS NULL
+            """
+            await conn.execute(query, (missing, batch_id))
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def get_completed_groups(self, owner: str) -> list[tuple[str, str, str]]:
+        """Get the groups in which every request has a result.
+
+        Parameters
+        ----------
+        owner : str
+            The process that owns the groups.
+
+        Returns
+        -------
+        list[tuple[str, str, str]]
+            (group_id, kind, context) of each group, oldest first.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            SELECT g.group_id, g.kind, g.context FROM batch_groups g
+            WHERE g.owner = ? AND NOT EXISTS (
+                SELECT 1 FROM batch_requests r
+                WHERE r.group_id = g.group_id AND r.result IS NULL
+            )
+            ORDER BY g.created_at
+            """
+            cursor = await conn.execute(query, (owner,))
+            rows = await cursor.fetchall()
+            return [(row[0], row[1], row[2]) for row in rows]
+        finally:
+            await conn.close()
+
+    async def get_results(self, group_id: str) -> dict[str, str]:
+        """Get the results of the requests of a group.
+
+        Parameters
+        ----------
+        group_id : str
+            ID of the group.
+
+        Returns
+        -------
+        dict[str, str]
+            JSON of the result of each request by custom_id.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            SELECT custom_id, result FROM batch_requests
+            WHERE group_id = ? AND result IS NOT NULL
+            """
+            cursor = await conn.execute(query, (group_id,))
+            rows = await cursor.fetchall()
+            return {row[0]: row[1] for row in rows}
+        finally:
+            await conn.close()
+
+    async def delete_group(self, group_id: str) -> None:
+        """Delete a delivered group and its requests.
+
+        Parameters
+        ----------
+        group_id : str
+            ID of the group.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            DELETE FROM batch_requests WHERE group_id = ?
+            """
+            await conn.execute(query, (group_id,))
+            query = """
+            DELETE FROM batch_groups WHERE group_id = ?
+            """
+            await conn.execute(query, (group_id,))
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def delete_older_than(self, created_before: float) -> int:
+        """Delete the groups created before a given time and their requests.
+
+        Parameters
+        ----------
+        created_before : float
+            UNIX timestamp; older groups are deleted.
+
+        Returns
+        -------
+        int
+            Number of deleted groups.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            DELETE FROM batch_requests WHERE group_id IN (
+                SELECT group_id FROM batch_groups WHERE created_at < ?
+            )
+            """
+            await conn.execute(query, (created_before,))
+            query = """
+            DELETE FROM batch_groups WHERE created_at < ?
+            """
+            cursor = await conn.execute(query, (created_before,))
+            await conn.commit()
+            return cursor.rowcount
+        finally:
+            await conn.close()
@@ -17,34 +17,6 @@ class ChannelDAO(SQLiteDaoBase):
 
     _table_name = "allowed_channels"
 
-    async def create_table(self) -> None:
-        """Create table if it doesn't exist.
-
-        Raises
-        ------
-        ValueError
-            If the table name contains invalid characters
-        """
-        if not self.validate_table_name(self._table_name):
-            msg = "Invalid table name: Only alphanumeric characters and underscores are allowed."
-            raise ValueError(msg)
-
-        conn = await aiosqlite.connect(super().DB_NAME)
-        try:
-            query = f"""
-            CREATE TABLE IF NOT EXISTS {self._table_name} (
-                id         INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_id INTEGER NOT NULL UNIQUE,
-                guild_id   INTEGER NOT NULL,
-                added_at   TIMESTAMP NOT NULL,
-                added_by   INTEGER NOT NULL
-            );
-            """
-            await conn.execute(query)
-            await conn.commit()
-        finally:
-            await conn.close()
-
     async def add_allowed_channel(self, channel_id: int, guild_id: int, added_by: int) -> None:
         """Add a channel to the allowed channels list.
 
@@ -147,3 +119,34 @@ class ChannelDAO(SQLiteDaoBase):
             return [row[0] for row in rows]
         finally:
             await conn.close()
+
+    async def get_allowed_channels_by_guilds(self, guild_ids: list[int]) -> dict[int, list[int]]:
+        """Get all allowed channels for several guilds in one query.
+
+        Parameters
+        ----------
+        guild_ids : list[int]
+            IDs of the Discord guilds/servers.
+
+        Returns
+        -------
+        dict[int, list[int]]
+            Mapping of every given guild ID to its allowed channel IDs.
+        """
+        channels: dict[int, list[int]] = {guild_id: [] for guild_id in guild_ids}
+        if not guild_ids:
+            return channels
+
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            # Only "?" placeholders are interpolated; the IDs are bound
+            placeholders = ", ".join("?" * len(guild_ids))
+            query = f"""
+            SELECT guild_id, channel_id FROM allowed_channels WHERE guild_id IN ({placeholders})
+            """  # noqa: S608
+            cursor = await conn.execute(query, guild_ids)
+            for guild_id, channel_id in await cursor.fetchall():
+                channels[guild_id].append(channel_id)
+            return channels
+        finally:
+            await conn.close()
@@ -0,0 +1,118 @@
+import time
+
+import aiosqlite
+
+from src.aichan.database._dao_base import SQLiteDaoBase
+
+
+class ChatCacheDAO(SQLiteDaoBase):
+    """Data Access Object for the cached answers of /chat.
+
+    The signatures of the prompts are kept by `SemanticCache` in its own
+    file; this table only maps their keys to the answers.
+
+    Attributes
+    ----------
+    _table_name : str
+        Name of the database table for cached answers.
+    """
+
+    _table_name = "chat_cache"
+
+    async def get(self, entry_key: str) -> str | None:
+        """Get a cached answer.
+
+        Parameters
+        ----------
+        entry_key : str
+            The key of the signature and context of the prompt.
+
+        Returns
+        -------
+        str | None
+            The answer, or None if it is not stored.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            SELECT response FROM chat_cache WHERE entry_key = ?
+            """
+            cursor = await conn.execute(query, (entry_key,))
+            row = await cursor.fetchone()
+            return None if row is None else str(row[0])
+        finally:
+            await conn.close()
+
+    async def put(self, entry_key: str, response: str) -> None:
+        """Store an answer.
+
+        Parameters
+        ----------
+        entry_key : str
+            The key of the signature and context of the prompt.
+        response : str
+            The answer.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            INSERT INTO chat_cache (entry_key, response, created_at) VALUES (?, ?, ?)
+            ON CONFLICT(entry_key) DO UPDATE SET
+                response = excluded.response,
+                created_at = excluded.created_at
+            """
+            await conn.execute(query, (entry_key, response, time.time()))
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def delete(self, entry_key: str) -> None:
+        """Delete an answer whose signature was evicted.
+
+        Parameters
+        ----------
+        entry_key : str
+            The key of the signature and context of the prompt.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            DELETE FROM chat_cache WHERE entry_key = ?
+            """
+            await conn.execute(query, (entry_key,))
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def delete_older_than(self, created_before: float, batch_size: int = 500) -> int:
+        """Delete answers stored before a given time.
+
+        Parameters
+        ----------
+        created_before : float
+            UNIX timestamp; older answers are deleted.
+        batch_size : int
+            Maximum number of rows deleted per transaction.
+
+        Returns
+        -------
+        int
+            Total number of deleted rows.
+        """
+        deleted = 0
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            DELETE FROM chat_cache
+            WHERE entry_key IN (
+                SELECT entry_key FROM chat_cache WHERE created_at < ? LIMIT ?
+            )
+            """
+            while True:
+                cursor = await conn.execute(query, (created_before, batch_size))
+                await conn.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    return deleted
+        finally:
+            await conn.close()
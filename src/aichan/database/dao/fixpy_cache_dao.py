@@ -0,0 +1,91 @@
+import json
+import time
+
+import aiosqlite
+
+from src.aichan.database._dao_base import SQLiteDaoBase
+
+
+class FixpyCacheDAO(SQLiteDaoBase):
+    """Data Access Object for cached answers of /fixpy.
+
+    Attributes
+    ----------
+    _table_name : str
+        Name of the database table for cached answers.
+    """
+
+    _table_name = "fixpy_cache"
+
+    async def get(self, cache_key: str) -> tuple[str, tuple[str, ...]] | None:
+        """Get a cached answer and mark it as recently used.
+
+        Parameters
+        ----------
+        cache_key : str
+            The key of the code and the model parameters.
+
+        Returns
+        -------
+        tuple[str, tuple[str, ...]] | None
+            (response, names), where names are the identifiers of the
+            code the answer was generated for, or None on a cache miss.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            SELECT response, names FROM fixpy_cache WHERE cache_key = ?
+            """
+            cursor = await conn.execute(query, (cache_key,))
+            row = await cursor.fetchone()
+            if row is None:
+                return None
+            query = """
+            UPDATE fixpy_cache SET used_at = ? WHERE cache_key = ?
+            """
+            await conn.execute(query, (time.time(), cache_key))
+            await conn.commit()
+            return str(row[0]), tuple(json.loads(row[1]))
+        finally:
+            await conn.close()
+
+    async def put(
+        self,
+        cache_key: str,
+        response: str,
+        names: tuple[str, ...],
+        max_entries: int,
+    ) -> None:
+        """Store an answer, evicting the least recently used ones over the limit.
+
+        Parameters
+        ----------
+        cache_key : str
+            The key of the code and the model parameters.
+        response : str
+            The answer of the model.
+        names : tuple[str, ...]
+            The identifiers of the code, in the order of the fingerprint.
+        max_entries : int
+            The maximum number of answers kept.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            INSERT INTO fixpy_cache (cache_key, response, names, used_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(cache_key) DO UPDATE SET
+                response = excluded.response,
+                names = excluded.names,
+                used_at = excluded.used_at
+            """
+            await conn.execute(query, (cache_key, response, json.dumps(names), time.time()))
+            query = """
+            DELETE FROM fixpy_cache
+            WHERE cache_key IN (
+                SELECT cache_key FROM fixpy_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?
+            )
+            """
+            await conn.execute(query, (max_entries,))
+            await conn.commit()
+        finally:
+            await conn.close()
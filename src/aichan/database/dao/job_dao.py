@@ -0,0 +1,60 @@
+import aiosqlite
+
+from src.aichan.database._dao_base import SQLiteDaoBase
+
+
+class JobRunDAO(SQLiteDaoBase):
+    """Data Access Object for persisting the last run of scheduled jobs.
+
+    Attributes
+    ----------
+    _table_name : str
+        Name of the database table for job runs.
+    """
+
+    _table_name = "job_runs"
+
+    async def set_last_run(self, job_name: str, run_at: float, duration: float) -> None:
+        """Record the latest run of a job.
+
+        Parameters
+        ----------
+        job_name : str
+            Name of the scheduled job.
+        run_at : float
+            UNIX timestamp at which the run started.
+        duration : float
+            Duration of the run in seconds.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            INSERT INTO job_runs (job_name, last_run_at, last_duration)
+            VALUES (?, ?, ?)
+            ON CONFLICT(job_name) DO UPDATE SET
+                last_run_at = ?,
+                last_duration = ?
+            """
+            await conn.execute(query, (job_name, run_at, duration, run_at, duration))
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def get_last_runs(self) -> dict[str, float]:
+        """Get the latest run time of every job.
+
+        Returns
+        -------
+        dict[str, float]
+            Mapping of job names to the UNIX timestamp of their last run.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            SELECT job_name, last_run_at FROM job_runs
+            """
+            cursor = await conn.execute(query)
+            rows = await cursor.fetchall()
+            return {row[0]: row[1] for row in rows}
+        finally:
+            await conn.close()
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 from typing import cast
 
@@ -18,62 +19,6 @@ class UsageLimitDAO(SQLiteDaoBase):
 
     _table_name = "usage_limit"
 
-    async def create_table(self) -> None:
-        """Create table if it doesn't exist.
-
-        Raises
-        ------
-        ValueError
-            If the table name contains invalid characters
-        """
-        if not self.validate_table_name(self._table_name):
-            msg = "Invalid table name: Only alphanumeric characters and underscores are allowed."
-            raise ValueError(msg)
-
-        conn = await aiosqlite.connect(super().DB_NAME)
-        try:
-            query = f"""
-            CREATE TABLE IF NOT EXISTS {self._table_name} (
-                id           INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id      INTEGER NOT NULL UNIQUE,
-                daily_limit  INTEGER NOT NULL DEFAULT 10,
-                last_updated TIMESTAMP NOT NULL
-            );
-            """
-            await conn.execute(query)
-            await conn.commit()
-        finally:
-            await conn.close()
-
-    async def create_usage_tracking_table(self) -> None:
-        """Create table for tracking API usage if it doesn't exist.
-
-        Raises
-        ------
-        ValueError
-            If the table name contains invalid characters
-        """
-        table_name = "api_usage"
-        if not self.validate_table_name(table_name):
-            msg = "Invalid table name: Only alphanumeric characters and underscores are allowed."
-            raise ValueError(msg)
-
-        conn = await aiosqlite.connect(super().DB_NAME)
-        try:
-            query = f"""
-            CREATE TABLE IF NOT EXISTS {table_name} (
-                id          INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id     INTEGER NOT NULL,
-                usage_date  DATE NOT NULL,
-                usage_count INTEGER NOT NULL DEFAULT 0,
-                UNIQUE(user_id, usage_date)
-            );
-            """
-            await conn.execute(query)
-            await conn.commit()
-        finally:
-            await conn.close()
-
     async def set_user_daily_limit(self, user_id: int, daily_limit: int) -> None:
         """Set or update daily usage limit for a user.
 
@@ -173,24 +118,26 @@ class UsageLimitDAO(SQLiteDaoBase):
         finally:
             await conn.close()
 
-    async def increment_usage_count(self, user_id: int) -> None:
+    async def increment_usage_count(self, user_id: int, count: int = 1) -> None:
         """Increment the usage count for a user on the current day.
 
         Parameters
         ----------
         user_id : int
             ID of the user to increment usage for.
+        count : int
+            Number of API calls to add, e.g. one per function of a /fixpy_batch upload.
         """
         conn = await aiosqlite.connect(super().DB_NAME)
         today = datetime.datetime.now(TIMEZONE).date()
         try:
             query = """
             INSERT INTO api_usage (user_id, usage_date, usage_count)
-            VALUES (?, ?, 1)
+            VALUES (?, ?, ?)
             ON CONFLICT(user_id, usage_date) DO UPDATE SET
-                usage_count = usage_count + 1
+                usage_count = usage_count + excluded.usage_count
             """
-            await conn.execute(query, (user_id, today))
+            await conn.execute(query, (user_id, today, count))
             await conn.commit()
         finally:
             await conn.close()
@@ -221,20 +168,45 @@ class UsageLimitDAO(SQLiteDaoBase):
         finally:
             await conn.close()
 
-    async def reset_all_usage_counts(self) -> None:
-        """Reset all usage counts by removing records from current day.
+    async def sweep_expired_usage(self, batch_size: int = 500, pause: float = 0.1) -> int:
+        """Delete usage records older than yesterday in small batches.
+
+        Usage reads are keyed by the current date, so old records never
+        affect the daily quota and can be removed lazily at any time.
+        Each batch runs in its own short transaction so that concurrent
+        writers are never blocked for long.
+
+        Parameters
+        ----------
+        batch_size : int
+            Maximum number of rows deleted per transaction.
+        pause : float
+            Seconds to sleep between batches.
 
-        This is meant to be called at midnight.
+        Returns
+        -------
+        int
+            Total number of deleted rows.
         """
-        conn = await aiosqlite.connect(super().DB_NAME)
         yesterday = (datetime.datetime.now(TIMEZONE) - datetime.timedelta(days=1)).date()
+        deleted = 0
+        conn = await aiosqlite.connect(super().DB_NAME)
         try:
-            # Delete data older than yesterday
             query = """
             DELETE FROM api_usage
-            WHERE usage_date < ?
+            WHERE id IN (
+                SELECT id FROM api_usage WHERE usage_date < ? LIMIT ?
+            )
             """
-            await conn.execute(query, (yesterday,))
-            await conn.commit()
+            while True:
+                cursor = await conn.execute(query, (yesterday, batch_size))
+                await conn.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+                await asyncio.sleep(pause)
         finally:
             await conn.close()
+
+        await self.incremental_vacuum()
+        return deleted
@@ -0,0 +1,165 @@
+import time
+from typing import NamedTuple
+
+import aiosqlite
+
+from src.aichan.database._dao_base import SQLiteDaoBase
+
+
+class RoutingSummary(NamedTuple):
+    """The routing decisions of one pair of requested and routed models.
+
+    Attributes
+    ----------
+    requested_model : str
+        The model the turn was meant for.
+    routed_model : str
+        The model that answered it.
+    decisions : int
+        The number of decisions.
+    avg_latency : float
+        The mean latency of the answers, in seconds.
+    saved_latency : float
+        The total latency saved, in seconds, over the decisions where it
+        could be estimated.
+    saved_cost : float
+        The total cost saved, in USD, over the decisions where it could
+        be computed.
+    """
+
+    requested_model: str
+    routed_model: str
+    decisions: int
+    avg_latency: float
+    saved_latency: float
+    saved_cost: float
+
+
+class ModelRoutingDAO(SQLiteDaoBase):
+    """Data Access Object for the routing decisions of /talk and /chat.
+
+    Attributes
+    ----------
+    _table_name : str
+        Name of the database table for routing decisions.
+    """
+
+    _table_name = "model_routing"
+
+    async def record(  # noqa: PLR0913
+        self,
+        command: str,
+        *,
+        requested_model: str,
+        routed_model: str,
+        score: float,
+        latency: float,
+        saved_latency: float | None,
+        saved_cost: float | None,
+    ) -> None:
+        """Record a routing decision.
+
+        Parameters
+        ----------
+        command : str
+            The command the turn belongs to, e.g. 'talk'.
+        requested_model : str
+            The model the turn was meant for.
+        routed_model : str
+            The model that answered it.
+        score : float
+            The complexity score of the turn, between 0 and 1.
+        latency : float
+            The latency of the answer, in seconds.
+        saved_latency : float | None
+            The latency saved, in seconds, if it could be estimated.
+        saved_cost : float | None
+            The cost saved, in USD, if the prices are known.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            INSERT INTO model_routing (
+                created_at, command, requested_model, routed_model,
+                score, latency, saved_latency, saved_cost
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """
+            await conn.execute(
+                query,
+                (
+                    time.time(),
+                    command,
+                    requested_model,
+                    routed_model,
+                    score,
+                    latency,
+                    saved_latency,
+                    saved_cost,
+                ),
+            )
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def summarize(self, created_after: float) -> list[RoutingSummary]:
+        """Sum up the decisions made since a given time.
+
+        Parameters
+        ----------
+        created_after : float
+            UNIX timestamp; older decisions are ignored.
+
+        Returns
+        -------
+        list[RoutingSummary]
+            One summary per pair of requested and routed models, the most
+            frequent first.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            SELECT requested_model, routed_model, COUNT(*), AVG(latency),
+                   TOTAL(saved_latency), TOTAL(saved_cost)
+            FROM model_routing
+            WHERE created_at >= ?
+            GROUP BY requested_model, routed_model
+            ORDER BY COUNT(*) DESC
+            """
+            cursor = await conn.execute(query, (created_after,))
+            rows = await cursor.fetchall()
+            return [RoutingSummary(*row) for row in rows]
+        finally:
+            await conn.close()
+
+    async def delete_older_than(self, created_before: float, batch_size: int = 500) -> int:
+        """Delete decisions made before a given time.
+
+        Parameters
+        ----------
+        created_before : float
+            UNIX timestamp; older decisions are deleted.
+        batch_size : int
+            Maximum number of rows deleted per transaction.
+
+        Returns
+        -------
+        int
+            Total number of deleted rows.
+        """
+        deleted = 0
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            DELETE FROM model_routing
+            WHERE id IN (
+                SELECT id FROM model_routing WHERE created_at < ? LIMIT ?
+            )
+            """
+            while True:
+                cursor = await conn.execute(query, (created_before, batch_size))
+                await conn.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    return deleted
+        finally:
+            await conn.close()
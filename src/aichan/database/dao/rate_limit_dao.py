@@ -0,0 +1,72 @@
+import aiosqlite
+
+from src.aichan.database._dao_base import SQLiteDaoBase
+
+
+class RateLimitDAO(SQLiteDaoBase):
+    """Data Access Object for persisting rate limiter snapshots.
+
+    Attributes
+    ----------
+    _table_name : str
+        Name of the database table for rate limiter buckets.
+    """
+
+    _table_name = "rate_limit_snapshot"
+
+    async def save_snapshot(
+        self,
+        rows: list[tuple[str, float, float]],
+        stale_before: float,
+    ) -> None:
+        """Store the given bucket states and drop old ones.
+
+        Buckets of other processes sharing the database are kept unless
+        they are older than `stale_before`.
+
+        Parameters
+        ----------
+        rows : list[tuple[str, float, float]]
+            Tuples of (bucket_key, tokens, saved_at) where saved_at is a
+            UNIX timestamp.
+        stale_before : float
+            UNIX timestamp; buckets saved earlier are deleted.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            await conn.execute(
+                "DELETE FROM rate_limit_snapshot WHERE saved_at < ?",
+                (stale_before,),
+            )
+            await conn.executemany(
+                """
+                INSERT INTO rate_limit_snapshot (bucket_key, tokens, saved_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(bucket_key) DO UPDATE SET
+                    tokens = excluded.tokens,
+                    saved_at = excluded.saved_at
+                """,
+                rows,
+            )
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def load_snapshot(self) -> list[tuple[str, float, float]]:
+        """Load the stored bucket states.
+
+        Returns
+        -------
+        list[tuple[str, float, float]]
+            Tuples of (bucket_key, tokens, saved_at).
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            SELECT bucket_key, tokens, saved_at FROM rate_limit_snapshot
+            """
+            cursor = await conn.execute(query)
+            rows = await cursor.fetchall()
+            return [(row[0], row[1], row[2]) for row in rows]
+        finally:
+            await conn.close()
@@ -0,0 +1,191 @@
+import time
+
+import aiosqlite
+
+from src.aichan.database._dao_base import SQLiteDaoBase
+
+
+class ThreadSessionDAO(SQLiteDaoBase):
+    """Data Access Object for persisting chat sessions of threads.
+
+    Attributes
+    ----------
+    _table_name : str
+        Name of the database table for thread sessions.
+    """
+
+    _table_name = "thread_sessions"
+
+    async def upsert(  # noqa: PLR0913
+        self,
+        thread_id: int,
+        *,
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        prompt_key: str,
+    ) -> None:
+        """Insert or update the session of a thread.
+
+        Parameters
+        ----------
+        thread_id : int
+            ID of the Discord thread.
+        model : str
+            The model used in the thread.
+        max_tokens : int
+            The maximum number of tokens to generate.
+        temperature : float
+            The sampling temperature.
+        top_p : float
+            The nucleus sampling parameter.
+        prompt_key : str
+            Name of the system prompt used in the thread.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        now = time.time()
+        try:
+            query = """
+            INSERT INTO thread_sessions
+                (thread_id, model, max_tokens, temperature, top_p, prompt_key, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(thread_id) DO UPDATE SET
+                model = excluded.model,
+                max_tokens = excluded.max_tokens,
+                temperature = excluded.temperature,
+                top_p = excluded.top_p,
+                prompt_key = excluded.prompt_key,
+                updated_at = excluded.updated_at
+            """
+            await conn.execute(
+                query,
+                (thread_id, model, max_tokens, temperature, top_p, prompt_key, now),
+            )
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def get(
+        self,
+        thread_id: int,
+    ) -> tuple[str, int, float, float, str, str | None, int | None] | None:
+        """Get the session of a thread.
+
+        Parameters
+        ----------
+        thread_id : int
+            ID of the Discord thread.
+
+        Returns
+        -------
+        tuple[str, int, float, float, str, str | None, int | None] | None
+            (model, max_tokens, temperature, top_p, prompt_key, summary,
+            summary_until), or None if the thread has no session.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            SELECT model, max_tokens, temperature, top_p, prompt_key, summary, summary_until
+            FROM thread_sessions WHERE thread_id = ?
+            """
+            cursor = await conn.execute(query, (thread_id,))
+            row = await cursor.fetchone()
+            if row is None:
+                return None
+            return (row[0], row[1], row[2], row[3], row[4], row[5], row[6])
+        finally:
+            await conn.close()
+
+    async def set_summary(self, thread_id: int, summary: str, summary_until: int) -> None:
+        """Store the summary of the older messages of a thread.
+
+        Parameters
+        ----------
+        thread_id : int
+            ID of the Discord thread.
+        summary : str
+            Summary of the messages up to `summary_until`.
+        summary_until : int
+            ID of the last Discord message covered by the summary.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            UPDATE thread_sessions
+            SET summary = ?, summary_until = ?, updated_at = ?
+            WHERE thread_id = ?
+            """
+            await conn.execute(query, (summary, summary_until, time.time(), thread_id))
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def touch(self, thread_id: int) -> None:
+        """Mark the session of a thread as recently used.
+
+        Parameters
+        ----------
+        thread_id : int
+            ID of the Discord thread.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            UPDATE thread_sessions SET updated_at = ? WHERE thread_id = ?
+            """
+            await conn.execute(query, (time.time(), thread_id))
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def delete(self, thread_id: int) -> None:
+        """Delete the session of a thread.
+
+        Parameters
+        ----------
+        thread_id : int
+            ID of the Discord thread.
+        """
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            DELETE FROM thread_sessions WHERE thread_id = ?
+            """
+            await conn.execute(query, (thread_id,))
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def delete_older_than(self, updated_before: float, batch_size: int = 500) -> int:
+        """Delete sessions that have not been updated since a given time.
+
+        Parameters
+        ----------
+        updated_before : float
+            UNIX timestamp; older sessions are deleted.
+        batch_size : int
+            Maximum number of rows deleted per transaction.
+
+        Returns
+        -------
+        int
+            Total number of deleted rows.
+        """
+        deleted = 0
+        conn = await aiosqlite.connect(super().DB_NAME)
+        try:
+            query = """
+            DELETE FROM thread_sessions
+            WHERE thread_id IN (
+                SELECT thread_id FROM thread_sessions WHERE updated_at < ? LIMIT ?
+            )
+            """
+            while True:
+                cursor = await conn.execute(query, (updated_before, batch_size))
+                await conn.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    return deleted
+        finally:
+            await conn.close()
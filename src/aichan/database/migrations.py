@@ -0,0 +1,285 @@
+import aiosqlite
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.database._dao_base import SQLiteDaoBase
+
+logger = parse_args_and_setup_logging()
+
+# Schema migrations, applied in order. The index of a migration plus one
+# is the schema version stored in `PRAGMA user_version` once applied.
+# Never edit a released migration; append a new one instead.
+MIGRATIONS: tuple[tuple[str, ...], ...] = (
+    # 1: initial tables (IF NOT EXISTS, as they predate versioning)
+    (
+        """
+        CREATE TABLE IF NOT EXISTS access (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id     INTEGER NOT NULL,
+            access_type TEXT NOT NULL,
+            granted_at  DATE NOT NULL,
+            disabled_at DATE DEFAULT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS allowed_channels (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id INTEGER NOT NULL UNIQUE,
+            guild_id   INTEGER NOT NULL,
+            added_at   TIMESTAMP NOT NULL,
+            added_by   INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS usage_limit (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id      INTEGER NOT NULL UNIQUE,
+            daily_limit  INTEGER NOT NULL DEFAULT 10,
+            last_updated TIMESTAMP NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS api_usage (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id     INTEGER NOT NULL,
+            usage_date  DATE NOT NULL,
+            usage_count INTEGER NOT NULL DEFAULT 0,
+            UNIQUE(user_id, usage_date)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_api_usage_usage_date ON api_usage (usage_date)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rate_limit_snapshot (
+            bucket_key TEXT PRIMARY KEY,
+            tokens     REAL NOT NULL,
+            saved_at   REAL NOT NULL
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS job_runs (
+            job_name      TEXT PRIMARY KEY,
+            last_run_at   REAL NOT NULL,
+            last_duration REAL NOT NULL
+        ) WITHOUT ROWID
+        """,
+    ),
+    # 2: indexes for the access type and guild channel lookups
+    (
+        """
+        CREATE INDEX idx_access_type ON access (access_type, disabled_at, user_id)
+        """,
+        """
+        CREATE INDEX idx_allowed_channels_guild ON allowed_channels (guild_id)
+        """,
+    ),
+    # 3: covering index for the per-user access type lookup
+    (
+        """
+        CREATE INDEX idx_access_user ON access (user_id, disabled_at, access_type)
+        """,
+    ),
+    # 4: per-thread chat sessions of /talk
+    (
+        """
+        CREATE TABLE thread_sessions (
+            thread_id   INTEGER PRIMARY KEY,
+            model       TEXT NOT NULL,
+            max_tokens  INTEGER NOT NULL,
+            temperature REAL NOT NULL,
+            top_p       REAL NOT NULL,
+            prompt_key  TEXT NOT NULL,
+            updated_at  REAL NOT NULL
+        )
+        """,
+        """
+        CREATE INDEX idx_thread_sessions_updated_at ON thread_sessions (updated_at)
+        """,
+    ),
+    # 5: rolling summaries of long /talk threads
+    (
+        """
+        ALTER TABLE thread_sessions ADD COLUMN summary TEXT DEFAULT NULL
+        """,
+        """
+        ALTER TABLE thread_sessions ADD COLUMN summary_until INTEGER DEFAULT NULL
+        """,
+    ),
+    # 6: key-value application state, e.g. the synced command fingerprint
+    (
+        """
+        CREATE TABLE app_state (
+            key   TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        ) WITHOUT ROWID
+        """,
+    ),
+    # 7: answers of /fixpy keyed by a fingerprint of the code, evicted least recently used
+    (
+        """
+        CREATE TABLE fixpy_cache (
+            cache_key TEXT PRIMARY KEY,
+            response  TEXT NOT NULL,
+            names     TEXT NOT NULL,
+            used_at   REAL NOT NULL
+        )
+        """,
+        """
+        CREATE INDEX idx_fixpy_cache_used_at ON fixpy_cache (used_at)
+        """,
+    ),
+    # 8: answers of /chat, looked up by the similarity index of SemanticCache
+    (
+        """
+        CREATE TABLE chat_cache (
+            entry_key  TEXT PRIMARY KEY,
+            response   TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """,
+    ),
+    # 9: model routing decisions of /talk and /chat, with the latency and cost saved
+    (
+        """
+        CREATE TABLE model_routing (
+            id                INTEGER PRIMARY KEY,
+            created_at        REAL NOT NULL,
+            command           TEXT NOT NULL,
+            requested_model   TEXT NOT NULL,
+            routed_model      TEXT NOT NULL,
+            score             REAL NOT NULL,
+            latency           REAL NOT NULL,
+            saved_latency     REAL,
+            saved_cost        REAL
+        )
+        """,
+        """
+        CREATE INDEX idx_model_routing_created_at ON model_routing (created_at)
+        """,
+    ),
+    # 10: deferred requests sent through the batch APIs of the providers, in groups
+    # delivered together once every request of the group has a result
+    (
+        """
+        CREATE TABLE batch_groups (
+            group_id   TEXT PRIMARY KEY,
+            kind       TEXT NOT NULL,
+            owner      TEXT NOT NULL,
+            context    TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE batch_requests (
+            custom_id TEXT PRIMARY KEY,
+            group_id  TEXT NOT NULL,
+            provider  TEXT NOT NULL,
+            params    TEXT NOT NULL,
+            batch_id  TEXT,
+            result    TEXT
+        )
+        """,
+        """
+        CREATE INDEX idx_batch_requests_group_id ON batch_requests (group_id)
+        """,
+        """
+        CREATE INDEX idx_batch_requests_batch_id ON batch_requests (batch_id)
+        """,
+    ),
+    # 11: indexes for the stale snapshot delete and the groups of a process
+    (
+        """
+        CREATE INDEX idx_rate_limit_snapshot_saved_at ON rate_limit_snapshot (saved_at)
+        """,
+        """
+        CREATE INDEX idx_batch_groups_owner ON batch_groups (owner, created_at)
+        """,
+    ),
+    # 12: index for the sweep of old /chat answers
+    (
+        """
+        CREATE INDEX idx_chat_cache_created_at ON chat_cache (created_at)
+        """,
+    ),
+    # 13: index for the sweep of batch groups that were never delivered
+    (
+        """
+        CREATE INDEX idx_batch_groups_created_at ON batch_groups (created_at)
+        """,
+    ),
+)
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+async def migrate() -> int:
+    """Bring the database schema up to `SCHEMA_VERSION`.
+
+    The current version is read from `PRAGMA user_version`, so an
+    up-to-date database costs a single read. Pending migrations are
+    applied together in one transaction, so a failure leaves the schema
+    untouched. The version is read again under the write lock, so that
+    processes starting at the same time apply each migration once.
+
+    Returns
+    -------
+    int
+        The number of migrations applied.
+
+    Raises
+    ------
+    RuntimeError
+        If the database was created by a newer version of the bot.
+    """
+    # Manage the transaction explicitly so that DDL is not auto-committed
+    conn = await aiosqlite.connect(SQLiteDaoBase.DB_NAME, isolation_level=None)
+    try:
+        current = await _schema_version(conn)
+        if current == SCHEMA_VERSION:
+            return 0
+
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while this one waited for the lock
+            current = await _schema_version(conn)
+            if current == SCHEMA_VERSION:
+                await conn.execute("COMMIT")
+                return 0
+            for version, statements in enumerate(MIGRATIONS[current:], start=current + 1):
+                for statement in statements:
+                    await conn.execute(statement)
+                logger.info("Applied database migration %d", version)
+            # PRAGMA does not accept bound parameters; the value is an int
+            await conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION:d}")
+            await conn.execute("COMMIT")
+        except Exception:
+            await conn.execute("ROLLBACK")
+            raise
+        return SCHEMA_VERSION - current
+    finally:
+        await conn.close()
+
+
+async def _schema_version(conn: aiosqlite.Connection) -> int:
+    cursor = await conn.execute("PRAGMA user_version")
+    row = await cursor.fetchone()
+    current = row[0] if row else 0
+    if current > SCHEMA_VERSION:
+        msg = f"Database schema version {current} is newer than {SCHEMA_VERSION}"
+        raise RuntimeError(msg)
+    return current
+
+
+async def prepare_database() -> None:
+    """Configure the database file and bring its schema up to date.
+
+    Safe to run from several processes at once. The vacuum and journal
+    modes are no-ops once set, and `migrate` checks the schema version
+    again under the write lock, so each migration is applied once.
+    """
+    # Let the usage sweep return freed pages without a full VACUUM
+    await SQLiteDaoBase.enable_incremental_vacuum()
+    # Let processes sharing the database read while another one writes
+    await SQLiteDaoBase.enable_wal()
+    # Create or upgrade the database schema
+    await migrate()
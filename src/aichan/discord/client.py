@@ -1,17 +1,33 @@
-from discord import Client, Intents, app_commands
+import hashlib
+import json
+import sys
+
+from discord import AutoShardedClient, Intents, MemberCacheFlags, app_commands
 
 from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.config.store import get_settings
+from src.aichan.database.channel_cache import AllowedChannelCache
+from src.aichan.database.dao.app_state_dao import AppStateDAO
+
+if sys.platform != "win32":
+    import resource
 
 logger = parse_args_and_setup_logging()
 
+# Key of the fingerprint of the last synced command tree in `app_state`
+_COMMAND_FINGERPRINT_KEY = "command_fingerprint"
+
 intents = Intents.default()
 intents.message_content = True
-intents.members = True
+intents.members = get_settings().discord_members_intent
 
 
-class BotClient(Client):
+class BotClient(AutoShardedClient):
     """A singleton bot client for Discord applications.
 
+    The client runs the shards in `discord_shard_ids`, or all shards if
+    it is not set.
+
     Attributes
     ----------
     _instance : BotClient
@@ -24,7 +40,17 @@ class BotClient(Client):
     tree: app_commands.CommandTree
 
     def __init__(self) -> None:
-        super().__init__(intents=intents)
+        settings = get_settings()
+        super().__init__(
+            intents=intents,
+            member_cache_flags=MemberCacheFlags.from_intents(intents),
+            chunk_guilds_at_startup=settings.discord_members_intent
+            and settings.discord_chunk_guilds,
+            max_messages=settings.discord_message_cache_size or None,
+            shard_count=settings.discord_shard_count or None,
+            # mypy(arg-type): None runs every shard, but the stub only accepts a list
+            shard_ids=list(settings.discord_shard_ids) or None,  # type: ignore
+        )
         self.tree = app_commands.CommandTree(self)
 
     @classmethod
@@ -40,11 +66,88 @@ class BotClient(Client):
             cls._instance = cls()
         return cls._instance
 
+    @property
+    def is_primary(self) -> bool:
+        """Whether this process runs shard 0 and owns the process-wide tasks.
+
+        Only one of the processes started by the launcher syncs the
+        command tree and runs the scheduled jobs.
+        """
+        shard_ids = get_settings().discord_shard_ids
+        return not shard_ids or 0 in shard_ids
+
+    def memory_report(self) -> dict[str, int]:
+        """Report the sizes of the gateway caches.
+
+        Returns
+        -------
+        dict[str, int]
+            The number of cached guilds, members, users and messages, and
+            the peak resident set size of the process in KiB where the
+            platform reports it.
+        """
+        report = {
+            "guilds": len(self.guilds),
+            "members": sum(len(guild.members) for guild in self.guilds),
+            "users": len(self.users),
+            "messages": len(self.cached_messages),
+        }
+        if sys.platform != "win32":
+            # ru_maxrss is in KiB on Linux
+            report["max_rss_kib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return report
+
+    def command_fingerprint(self) -> str:
+        """Compute a fingerprint of the registered slash commands.
+
+        The fingerprint covers the payload sent to Discord on sync (names,
+        descriptions, options and choices such as the available models)
+        and the application ID.
+
+        Returns
+        -------
+        str
+            SHA-256 hex digest of the command tree.
+        """
+        payload = sorted(
+            (command.to_dict(self.tree) for command in self.tree.get_commands()),
+            key=lambda command: str(command["name"]),
+        )
+        data = json.dumps([self.application_id, payload], sort_keys=True, default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    async def sync_commands(self, *, force: bool = False) -> int | None:
+        """Sync the slash commands with Discord if they changed.
+
+        Global syncs are slow and heavily rate limited, so the command
+        tree is only sent when its fingerprint differs from the last
+        synced one.
+
+        Parameters
+        ----------
+        force : bool
+            Sync even if the commands have not changed.
+
+        Returns
+        -------
+        int | None
+            The number of synced commands, or None if the sync was skipped.
+        """
+        fingerprint = self.command_fingerprint()
+        dao = AppStateDAO()
+        if not force and await dao.get(_COMMAND_FINGERPRINT_KEY) == fingerprint:
+            logger.info("Commands are unchanged, skipped syncing")
+            return None
+        synced_cmds = await self.tree.sync()
+        await dao.set(_COMMAND_FINGERPRINT_KEY, fingerprint)
+        logger.info("Synced %d commands", len(synced_cmds))
+        return len(synced_cmds)
+
     async def setup_hook(self) -> None:
         """Set up the bot before connecting to the Discord gateway."""
-        synced_cmds = await self.tree.sync()
+        if self.is_primary:
+            await self.sync_commands(force=get_settings().force_command_sync)
         logger.info("Setup hook completed")
-        logger.info("Synced %d commands", len(synced_cmds))
 
     async def on_ready(self) -> None:
         """Handle the bot's ready event."""
@@ -52,6 +155,16 @@ class BotClient(Client):
         for cmd in self.tree.walk_commands():
             logger.info("Command Name: %s", cmd.name)
 
+        logger.info("Gateway caches: %s", self.memory_report())
+
+        settings = get_settings()
+        if settings.channel_cache_warmup:
+            await AllowedChannelCache().warmup(list(settings.authorized_server_ids))
+            logger.info(
+                "Loaded allowed channels of %d guilds",
+                len(settings.authorized_server_ids),
+            )
+
     async def cleanup_hook(self) -> None:
         """Clean up resources when the bot is shutting down."""
         logger.info("Start cleanup ...")
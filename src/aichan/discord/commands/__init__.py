@@ -1,6 +1,8 @@
 from .access_commands import *
+from .admin_commands import *
 from .channel_commands import *
 from .chat_command import *
+from .fixpy_batch_command import *
 from .fixpy_command import *
 from .limit_commands import *
 from .talk_command import *
@@ -1,4 +1,4 @@
-from discord import Interaction, SelectOption, User
+from discord import Guild, Interaction, Member, NotFound, SelectOption, User
 from discord.ui import Select, View
 
 from src.aichan._cli import parse_args_and_setup_logging
@@ -11,6 +11,34 @@ client = BotClient.get_instance()
 logger = parse_args_and_setup_logging()
 
 
+async def _get_member(guild: Guild, user: User | Member) -> Member | None:
+    """Get a user as a member of a guild.
+
+    Parameters
+    ----------
+    guild : Guild
+        The Discord guild.
+    user : User | Member
+        The user given as a command option.
+
+    Returns
+    -------
+    Member | None
+        The member, or None if the user is not in the guild.
+    """
+    # The option resolves to a Member if the user is in the guild,
+    # so the member cache and the API are only needed as a fallback
+    if isinstance(user, Member):
+        return user
+    member = guild.get_member(user.id)
+    if member is not None:
+        return member
+    try:
+        return await guild.fetch_member(user.id)
+    except NotFound:
+        return None
+
+
 class AccessGrantSelector(Select):
     """Discord UI selector for granting access privileges to users.
 
@@ -140,7 +168,7 @@ async def grant_access_command(interaction: Interaction, user: User) -> None:
         )
         return
 
-    target_user = interaction.guild.get_member(target_user_id)
+    target_user = await _get_member(interaction.guild, user)
     if target_user is None:
         await interaction.response.send_message(
             "The user does not exist in the guild",
@@ -191,7 +219,7 @@ async def check_access_command(interaction: Interaction, user: User) -> None:
         )
         return
 
-    target_user = interaction.guild.get_member(target_user_id)
+    target_user = await _get_member(interaction.guild, user)
     if target_user is None:
         await interaction.response.send_message(
             "The user does not exist in the guild",
@@ -199,22 +227,23 @@ async def check_access_command(interaction: Interaction, user: User) -> None:
         )
         return
 
-    advanced_user_ids = await access_dao.fetch_user_ids_by_access_type("advanced")
-    blocked_user_ids = await access_dao.fetch_user_ids_by_access_type("blocked")
+    access_types = await access_dao.fetch_access_types(target_user_id)
+    is_advanced = "advanced" in access_types
+    is_blocked = "blocked" in access_types
 
-    if advanced_user_ids and blocked_user_ids:
+    if is_advanced and is_blocked:
         await interaction.response.send_message(
             f"The user (ID: `{target_user_id}`) has the access type `advanced` and `blocked`",
             ephemeral=True,
         )
         return
-    if advanced_user_ids:
+    if is_advanced:
         await interaction.response.send_message(
             f"The user (ID: `{target_user_id}`) has the access type `advanced`",
             ephemeral=True,
         )
         return
-    if blocked_user_ids:
+    if is_blocked:
         await interaction.response.send_message(
             f"The user (ID: `{target_user_id}`) has the access type `blocked`",
             ephemeral=True,
@@ -253,7 +282,7 @@ async def disable_access_command(interaction: Interaction, user: User) -> None:
         )
         return
 
-    target_user = interaction.guild.get_member(target_user_id)
+    target_user = await _get_member(interaction.guild, user)
     if target_user is None:
         await interaction.response.send_message(
             "The user does not exist in the guild",
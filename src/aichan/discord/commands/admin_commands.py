@@ -0,0 +1,157 @@
+import time
+
+from discord import Interaction
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.config.store import ConfigStore
+from src.aichan.database.dao.model_routing_dao import ModelRoutingDAO
+from src.aichan.discord.client import BotClient
+from src.aichan.discord.outbound import OutboundDispatcher
+from src.aichan.utils.decorators import *
+from src.aichan.utils.scheduler import JobScheduler
+
+client = BotClient.get_instance()
+dispatcher = OutboundDispatcher()
+logger = parse_args_and_setup_logging()
+
+
+@client.tree.command(name="memory", description="Show the sizes of the bot's caches")
+# mypy(name-defined): defined in a wildcard import
+@is_authorized_server()  # type: ignore # noqa: F405
+# mypy(name-defined): defined in a wildcard import
+@is_admin_user()  # type: ignore # noqa: F405
+async def memory_command(interaction: Interaction) -> None:
+    """Show the sizes of the gateway caches and the memory usage.
+
+    Parameters
+    ----------
+    interaction : Interaction
+        The interaction object from the command.
+    """
+    report = client.memory_report()
+    lines = "\n".join(f"{name}: {value:,}" for name, value in report.items())
+    await interaction.response.send_message(f"```\n{lines}\n```", ephemeral=True)
+    logger.info("%s checked the memory report", interaction.user)
+
+
+@client.tree.command(name="sync", description="Sync the slash commands with Discord")
+# mypy(name-defined): defined in a wildcard import
+@is_authorized_server()  # type: ignore # noqa: F405
+# mypy(name-defined): defined in a wildcard import
+@is_admin_user()  # type: ignore # noqa: F405
+async def sync_command(interaction: Interaction) -> None:
+    """Sync the slash commands even if they have not changed.
+
+    Parameters
+    ----------
+    interaction : Interaction
+        The interaction object from the command.
+    """
+    # Syncing can take longer than the response deadline
+    await interaction.response.defer(ephemeral=True)
+    try:
+        synced = await client.sync_commands(force=True)
+        await dispatcher.followup(interaction, f"Synced {synced} commands", ephemeral=True)
+        logger.info("%s synced the commands", interaction.user)
+    except Exception:
+        await dispatcher.followup(
+            interaction,
+            "**Error**: コマンドの同期中にエラーが発生しました。",
+            ephemeral=True,
+        )
+        logger.exception("An error occurred in the sync command")
+
+
+@client.tree.command(name="reload", description="Reload .env and .prompt.yml")
+# mypy(name-defined): defined in a wildcard import
+@is_authorized_server()  # type: ignore # noqa: F405
+# mypy(name-defined): defined in a wildcard import
+@is_admin_user()  # type: ignore # noqa: F405
+async def reload_command(interaction: Interaction) -> None:
+    """Reload the configuration without waiting for the file watcher.
+
+    Parameters
+    ----------
+    interaction : Interaction
+        The interaction object from the command.
+    """
+    try:
+        result = ConfigStore().reload()
+    except Exception as err:
+        await interaction.response.send_message(
+            f"**Error**: 設定を読み込めませんでした。現在の設定を維持します。\n```\n{err!s}\n```",
+            ephemeral=True,
+        )
+        logger.exception("An error occurred in the reload command")
+        return
+
+    lines = [f"Changed: {', '.join(result.changed) or 'nothing'}"]
+    if result.needs_restart:
+        lines.append(f"Needs a restart: {', '.join(result.needs_restart)}")
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
+    logger.info("%s reloaded the configuration", interaction.user)
+
+
+@client.tree.command(name="routing", description="Show what model routing has saved")
+# mypy(name-defined): defined in a wildcard import
+@is_authorized_server()  # type: ignore # noqa: F405
+# mypy(name-defined): defined in a wildcard import
+@is_admin_user()  # type: ignore # noqa: F405
+async def routing_command(interaction: Interaction, days: int = 7) -> None:
+    """Show the routing decisions of /talk and /chat and what they saved.
+
+    Parameters
+    ----------
+    interaction : Interaction
+        The interaction object from the command.
+    days : int
+        The number of past days to sum up.
+    """
+    created_after = time.time() - days * 24 * 60 * 60
+    summaries = await ModelRoutingDAO().summarize(created_after)
+    if not summaries:
+        await interaction.response.send_message(
+            f"No routing decisions in the last {days} days",
+            ephemeral=True,
+        )
+        return
+
+    lines = [
+        f"{s.requested_model} -> {s.routed_model}: {s.decisions:,} turns, "
+        f"avg {s.avg_latency:.2f}s, saved {s.saved_latency:,.1f}s / ${s.saved_cost:,.4f}"
+        for s in summaries
+    ]
+    total_latency = sum(s.saved_latency for s in summaries)
+    total_cost = sum(s.saved_cost for s in summaries)
+    lines.append(f"Total saved: {total_latency:,.1f}s / ${total_cost:,.4f}")
+    report = "\n".join(lines)
+    await interaction.response.send_message(f"```\n{report}\n```", ephemeral=True)
+    logger.info("%s checked the routing report", interaction.user)
+
+
+@client.tree.command(name="jobs", description="Show the run statistics of the scheduled jobs")
+# mypy(name-defined): defined in a wildcard import
+@is_authorized_server()  # type: ignore # noqa: F405
+# mypy(name-defined): defined in a wildcard import
+@is_admin_user()  # type: ignore # noqa: F405
+async def jobs_command(interaction: Interaction) -> None:
+    """Show the runs and durations of the jobs of the scheduler of this process.
+
+    Parameters
+    ----------
+    interaction : Interaction
+        The interaction object from the command.
+    """
+    metrics = JobScheduler().metrics()
+    if not metrics:
+        await interaction.response.send_message("No scheduled jobs", ephemeral=True)
+        return
+
+    lines = [
+        f"{name}: {m.runs:,} runs, {m.failures:,} failed, {m.skipped:,} skipped, "
+        f"last {m.last_duration:.3f}s, avg {m.average_duration:.3f}s, max {m.max_duration:.3f}s"
+        for name, m in sorted(metrics.items())
+    ]
+    report = "\n".join(lines)
+    await interaction.response.send_message(f"```\n{report}\n```", ephemeral=True)
+    logger.info("%s checked the job report", interaction.user)
@@ -1,13 +1,13 @@
 from discord import Colour, Embed, Interaction, TextChannel
 
 from src.aichan._cli import parse_args_and_setup_logging
-from src.aichan.database.dao.channel_dao import ChannelDAO
+from src.aichan.database.channel_cache import AllowedChannelCache
 from src.aichan.discord.client import BotClient
 from src.aichan.utils.decorators import *
 
 client = BotClient.get_instance()
 logger = parse_args_and_setup_logging()
-channel_dao = ChannelDAO()
+channel_cache = AllowedChannelCache()
 
 
 @client.tree.command(
@@ -39,7 +39,7 @@ async def add_channel_command(
             )
             return
 
-        await channel_dao.add_allowed_channel(
+        await channel_cache.add_allowed_channel(
             channel_id=channel.id,
             guild_id=interaction.guild_id,
             added_by=interaction.user.id,
@@ -96,7 +96,7 @@ async def remove_channel_command(
             )
             return
 
-        removed = await channel_dao.remove_allowed_channel(channel_id=channel.id)
+        removed = await channel_cache.remove_allowed_channel(channel_id=channel.id)
 
         if removed:
             # ------ Define discord embed style ------
@@ -152,7 +152,7 @@ async def list_channels_command(
             )
             return
 
-        allowed_channels = await channel_dao.get_allowed_channels(guild_id=interaction.guild_id)
+        allowed_channels = await channel_cache.get_allowed_channels(guild_id=interaction.guild_id)
 
         if not allowed_channels:
             await interaction.response.send_message(
@@ -169,7 +169,7 @@ async def list_channels_command(
             color=0xF4B3C2,
         )
 
-        channels_text = "\n".join([f"<#{channel_id}>" for channel_id in allowed_channels])
+        channels_text = "\n".join([f"<#{channel_id}>" for channel_id in sorted(allowed_channels)])
         embed.add_field(name="チャンネル", value=channels_text)
         # ----------------------------------------
 
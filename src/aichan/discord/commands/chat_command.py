@@ -1,24 +1,49 @@
+import time
+
 from discord import Interaction
 
 from src.aichan._cli import parse_args_and_setup_logging
-from src.aichan.adapters.chat import ChatMessage
+from src.aichan.adapters.chat import ChatMessage, Conversation
+from src.aichan.adapters.response import MODERATION_FLAGGED_MESSAGE, ResponseStatus
 from src.aichan.ai.models.gpt_model import GptModelParams
 from src.aichan.ai.services.openai_text import generate_openai_response
-from src.aichan.config.env import (
-    CHAT_MODEL,
-    GPT_DEFAULT_MAX_TOKENS,
-    GPT_DEFAULT_TEMPERATURE,
-    GPT_DEFAULT_TOP_P,
-)
-from src.aichan.config.prompt import CHAT_SYSTEM
+from src.aichan.config.store import get_config, get_settings
 from src.aichan.database.dao.limit_dao import UsageLimitDAO
 from src.aichan.discord.client import BotClient
+from src.aichan.discord.outbound import OutboundDispatcher
 from src.aichan.utils.decorators import *
-from src.aichan.utils.model_params_store import ModelParamsStore
+from src.aichan.utils.model_router import ModelRouter
+from src.aichan.utils.moderation import screen_prompt
+from src.aichan.utils.rate_limiter import RateLimiter
+from src.aichan.utils.semantic_cache import SemanticCache, context_id
 
 client = BotClient.get_instance()
+dispatcher = OutboundDispatcher()
 logger = parse_args_and_setup_logging()
-model_params = ModelParamsStore()
+
+# Shown below answers reused from the cache, which may be for a slightly different prompt
+_CACHED_NOTE = "(似た質問への過去の回答です)"
+_ELLIPSIS = "…"
+
+
+def _with_cached_note(response: str) -> str:
+    """Add the cached note to an answer, trimming the answer to fit one message.
+
+    Parameters
+    ----------
+    response : str
+        The answer reused from the cache.
+
+    Returns
+    -------
+    str
+        The answer and the note, within the character limit of a message.
+    """
+    note = f"\n\n{_CACHED_NOTE}"
+    limit = get_settings().max_chars_per_message - len(note)
+    if len(response) > limit:
+        response = response[: limit - len(_ELLIPSIS)] + _ELLIPSIS
+    return f"{response}{note}"
 
 
 @client.tree.command(
@@ -26,6 +51,8 @@ model_params = ModelParamsStore()
     description="AIちゃんとチャットをします",
 )
 # mypy(name-defined): defined in a wildcard import
+@is_within_rate_limit()  # type: ignore # noqa: F405
+# mypy(name-defined): defined in a wildcard import
 @is_authorized_server()  # type: ignore # noqa: F405
 # mypy(name-defined): defined in a wildcard import
 @is_not_blocked_user()  # type: ignore # noqa: F405
@@ -40,39 +67,77 @@ async def chat_command(
         user = interaction.user
         logger.info("%s executed 'chat' command: %s", user, prompt[:20])
 
+        # Flagged prompts never reach the model and are not counted as usage
+        if screen_prompt(prompt) is not None:
+            await interaction.response.send_message(MODERATION_FLAGGED_MESSAGE, ephemeral=True)
+            return
+
         await interaction.response.defer()
+        config = get_config()
+        settings = config.settings
 
-        if CHAT_MODEL is None:
-            await interaction.followup.send(
+        if settings.chat_model is None:
+            await dispatcher.followup(
+                interaction,
                 "利用可能なモデルがありません。管理者に連絡してください。",
                 ephemeral=True,
             )
             return
 
         params = GptModelParams(
-            model=CHAT_MODEL,
-            max_tokens=GPT_DEFAULT_MAX_TOKENS,
-            temperature=GPT_DEFAULT_TEMPERATURE,
-            top_p=GPT_DEFAULT_TOP_P,
+            model=settings.chat_model,
+            max_tokens=settings.gpt_default_max_tokens,
+            temperature=settings.gpt_default_temperature,
+            top_p=settings.gpt_default_top_p,
         )
 
-        message = [ChatMessage(role="user", content=prompt)]
+        message = Conversation([ChatMessage(role="user", content=prompt).to_turn()])
+
+        # Simple prompts may be answered by a cheaper model than CHAT_MODEL
+        route = ModelRouter().route(message, params, settings.gpt_models)
+        model_params = params if route is None else route.params
+
+        # Prompts similar to an earlier one get its answer without calling the model.
+        # Answers are kept by the model that gave them, so that the answer of a
+        # cheaper model is never reused for a prompt routed to a more capable one
+        cache = SemanticCache()
+        context = context_id(
+            config.prompts.chat_system,
+            model_params.model,
+            model_params.max_tokens,
+            model_params.temperature,
+            model_params.top_p,
+        )
+        hit = await cache.lookup(prompt, context)
+        if hit is not None:
+            RateLimiter().release(user.id, interaction.guild_id)
+            await dispatcher.followup(interaction, _with_cached_note(hit.response))
+            logger.info("Answered the prompt of %s from the cache (%.3f)", user, hit.similarity)
+            return
 
+        started = time.perf_counter()
         response_result = await generate_openai_response(
-            system_prompt=CHAT_SYSTEM,
+            system_prompt=config.prompts.chat_system,
             prompt=message,
-            model_params=params,
+            model_params=model_params,
         )
+        latency = time.perf_counter() - started
 
-        await interaction.followup.send(
+        await dispatcher.followup(
+            interaction,
             f"{response_result.result}",
         )
+        if response_result.status is ResponseStatus.SUCCESS and response_result.result:
+            await cache.store(prompt, context, response_result.result)
+        if route is not None:
+            await ModelRouter().record("chat", route, response_result, latency)
 
         await UsageLimitDAO().increment_usage_count(user.id)
     except Exception as err:
         msg = f"Error in chat command: {err!s}"
         logger.exception(msg)
-        await interaction.followup.send(
+        await dispatcher.followup(
+            interaction,
             "エラーが発生しました。解決しない場合は管理者に連絡してください。",
             ephemeral=True,
         )
@@ -0,0 +1,353 @@
+import asyncio
+import io
+import tempfile
+import time
+import uuid
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import Any
+
+import aiohttp
+from discord import Attachment, File, Forbidden, Interaction
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.adapters.chat import ChatMessage, Conversation
+from src.aichan.adapters.response import ResponseResult, ResponseStatus
+from src.aichan.ai.models.claude_model import ClaudeModelParams
+from src.aichan.ai.services.anthropic_batch import anthropic_batch_params
+from src.aichan.ai.services.anthropic_text import generate_anthropic_response
+from src.aichan.config.store import ConfigSnapshot, get_config
+from src.aichan.database.dao.limit_dao import UsageLimitDAO
+from src.aichan.discord.client import BotClient
+from src.aichan.discord.outbound import OutboundDispatcher
+from src.aichan.utils.batch_queue import BatchQueue
+from src.aichan.utils.code_sandbox import extract_code
+from src.aichan.utils.code_units import CodeUnit, apply_fixes, make_patch, split_units
+from src.aichan.utils.decorators import *
+
+client = BotClient.get_instance()
+dispatcher = OutboundDispatcher()
+logger = parse_args_and_setup_logging()
+
+_PATCH_FILENAME = "fixpy.patch"
+_BATCH_KIND = "fixpy_batch"
+# Size of the chunks in which attachments are written to disk
+_DOWNLOAD_CHUNK_BYTES = 64 * 1024
+# Minimum seconds between progress updates, as each one is a Discord request
+_PROGRESS_INTERVAL_SECONDS = 2.0
+_UNIT_REQUEST = (
+    "File `{path}`, lines {start}-{end} (`{name}`):\n"
+    "```python\n{source}```\n"
+    "Reply with the whole fixed code of this part in one ```python code block, "
+    "followed by a short explanation. If it has no bugs, reply with the code unchanged."
+)
+
+
+class _BatchError(Exception):
+    """An attachment that cannot be processed, with a message for the user."""
+
+
+async def _download(attachment: Attachment, path: Path, max_bytes: int) -> None:
+    # Streamed in chunks, so that a large upload is never held in memory
+    size = 0
+    async with aiohttp.ClientSession() as session, session.get(attachment.url) as response:
+        response.raise_for_status()
+        with path.open("wb") as file:
+            async for chunk in response.content.iter_chunked(_DOWNLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    msg = f"ファイルが大きすぎます (上限: {max_bytes:,}バイト)"
+                    raise _BatchError(msg)
+                file.write(chunk)
+
+
+def _read_sources(path: Path, filename: str, max_bytes: int) -> dict[str, str]:
+    # Returns the Python files of an upload by their relative paths
+    if not zipfile.is_zipfile(path):
+        if not filename.endswith(".py"):
+            msg = ".pyファイルか.zipファイルを添付してください"
+            raise _BatchError(msg)
+        return {filename: _decode(path.read_bytes(), filename)}
+
+    sources: dict[str, str] = {}
+    total = 0
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            member = PurePosixPath(info.filename)
+            if info.is_dir() or member.suffix != ".py" or ".." in member.parts:
+                continue
+            # The sizes in the archive may lie, so the read is limited as well
+            with archive.open(info) as file:
+                data = file.read(max_bytes - total + 1)
+            total += len(data)
+            if total > max_bytes:
+                msg = f"展開後のファイルが大きすぎます (上限: {max_bytes:,}バイト)"
+                raise _BatchError(msg)
+            sources[member.as_posix().lstrip("/")] = _decode(data, info.filename)
+    if not sources:
+        msg = "zipファイルに.pyファイルがありません"
+        raise _BatchError(msg)
+    return sources
+
+
+def _decode(data: bytes, filename: str) -> str:
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError as err:
+        msg = f"{filename} はUTF-8のテキストではありません"
+        raise _BatchError(msg) from err
+
+
+def _unit_prompt(unit: CodeUnit) -> Conversation:
+    prompt = _UNIT_REQUEST.format(
+        path=unit.path,
+        start=unit.start,
+        end=unit.end,
+        name=unit.name,
+        source=unit.source,
+    )
+    return Conversation([ChatMessage(role="user", content=prompt).to_turn()])
+
+
+def _extract_fix(response_result: ResponseResult) -> str | None:
+    # Returns the fixed code, or None if the model failed or gave no code
+    if response_result.status is not ResponseStatus.SUCCESS:
+        return None
+    return extract_code(response_result.result or "")
+
+
+async def _fix_unit(
+    unit: CodeUnit,
+    config: ConfigSnapshot,
+    params: ClaudeModelParams,
+    semaphore: asyncio.Semaphore,
+) -> tuple[CodeUnit, str | None]:
+    async with semaphore:
+        response_result = await generate_anthropic_response(
+            system_prompt=config.prompts.fixpy_system,
+            prompt=_unit_prompt(unit),
+            model_params=params,
+        )
+    return unit, _extract_fix(response_result)
+
+
+class _Progress:
+    """Throttled updates of the deferred response of an interaction."""
+
+    def __init__(self, interaction: Interaction, total: int) -> None:
+        self.interaction = interaction
+        self.total = total
+        self.done = 0
+        self.updated_at = 0.0
+
+    async def advance(self) -> None:
+        """Count a finished unit and show the progress if it is due."""
+        self.done += 1
+        now = time.monotonic()
+        if now - self.updated_at < _PROGRESS_INTERVAL_SECONDS and self.done < self.total:
+            return
+        self.updated_at = now
+        await dispatcher.edit_response(
+            self.interaction,
+            f"修正中... {self.done}/{self.total} 個の関数を確認しました",
+        )
+
+
+def _split_sources(sources: dict[str, str]) -> list[CodeUnit]:
+    return [unit for path, source in sources.items() for unit in split_units(path, source)]
+
+
+async def _fix_sources(
+    interaction: Interaction,
+    units: list[CodeUnit],
+    config: ConfigSnapshot,
+    params: ClaudeModelParams,
+) -> list[tuple[CodeUnit, str | None]]:
+    semaphore = asyncio.Semaphore(config.settings.fixpy_batch_concurrency)
+    progress = _Progress(interaction, len(units))
+    fixed_units: list[tuple[CodeUnit, str | None]] = []
+    tasks = [_fix_unit(unit, config, params, semaphore) for unit in units]
+    for task in asyncio.as_completed(tasks):
+        fixed_units.append(await task)
+        await progress.advance()
+    return fixed_units
+
+
+def _make_report(
+    sources: dict[str, str],
+    fixed_units: list[tuple[CodeUnit, str | None]],
+    skipped: int,
+) -> tuple[str, str]:
+    # Returns the patch and a summary of the results
+    fixes: dict[str, list[tuple[CodeUnit, str]]] = {}
+    failed = 0
+    for unit, fixed in fixed_units:
+        if fixed is None:
+            failed += 1
+        elif fixed.strip() != unit.source.strip():
+            fixes.setdefault(unit.path, []).append((unit, fixed))
+
+    patch = "".join(
+        make_patch(path, sources[path], apply_fixes(sources[path], unit_fixes))
+        for path, unit_fixes in sorted(fixes.items())
+    )
+    changed = sum(len(unit_fixes) for unit_fixes in fixes.values())
+    summary = f"{len(fixed_units)}個の関数のうち{changed}個を修正しました"
+    if failed:
+        summary += f" (失敗: {failed}個)"
+    if skipped:
+        summary += f"\n上限を超えた{skipped}個の関数は確認していません"
+    return patch, summary
+
+
+async def _enqueue_sources(
+    interaction: Interaction,
+    sources: dict[str, str],
+    units: list[CodeUnit],
+    config: ConfigSnapshot,
+    params: ClaudeModelParams,
+) -> None:
+    # The units are split again on delivery, so only their count is kept
+    context = {
+        "user_id": interaction.user.id,
+        "sources": sources,
+        "unit_count": len(units),
+    }
+    requests = {
+        str(index): anthropic_batch_params(config.prompts.fixpy_system, _unit_prompt(unit), params)
+        for index, unit in enumerate(units)
+    }
+    await BatchQueue().enqueue(_BATCH_KIND, uuid.uuid4().hex, context, requests)
+
+
+async def _deliver_batch(context: dict[str, Any], results: dict[str, ResponseResult]) -> None:
+    sources: dict[str, str] = context["sources"]
+    units = _split_sources(sources)
+    skipped = len(units) - context["unit_count"]
+    units = units[: context["unit_count"]]
+    fixed_units = [(unit, _extract_fix(results[str(index)])) for index, unit in enumerate(units)]
+    patch, summary = _make_report(sources, fixed_units, skipped)
+    # The code and the patch are only shown to the user, as in the immediate mode
+    user_id = context["user_id"]
+    user = client.get_user(user_id) or await client.fetch_user(user_id)
+    channel = user.dm_channel or await user.create_dm()
+    content = f"/fixpy_batch の結果です\n{summary}"
+    try:
+        if not patch:
+            await dispatcher.send(channel, content)
+        else:
+            await dispatcher.send(
+                channel,
+                content,
+                file=File(io.BytesIO(patch.encode()), filename=_PATCH_FILENAME),
+            )
+    except Forbidden:
+        logger.warning("Cannot send the /fixpy_batch result to %s, who does not accept DMs", user)
+
+
+BatchQueue().register(_BATCH_KIND, _deliver_batch)
+
+
+@client.tree.command(
+    name="fixpy_batch",
+    description="添付した.pyファイルまたは.zipファイルのPythonコードを関数ごとに修正します",
+)
+# mypy(name-defined): defined in a wildcard import
+@is_within_rate_limit()  # type: ignore # noqa: F405
+# mypy(name-defined): defined in a wildcard import
+@is_authorized_server()  # type: ignore # noqa: F405
+# mypy(name-defined): defined in a wildcard import
+@is_not_blocked_user()  # type: ignore # noqa: F405
+# mypy(name-defined): defined in a wildcard import
+@has_daily_usage_left()  # type: ignore # noqa: F405
+async def fix_batch_command(interaction: Interaction, file: Attachment) -> None:
+    """Handle the /fixpy_batch slash command.
+
+    Parameters
+    ----------
+    interaction : Interaction
+        The interaction instance.
+    file : Attachment
+        A Python file, or a zip archive of Python files.
+    """
+    try:
+        user = interaction.user
+        logger.info("%s executed 'fixpy_batch' command: %s", user, file.filename)
+        await interaction.response.defer(thinking=True, ephemeral=True)
+        config = get_config()
+        settings = config.settings
+
+        if file.size > settings.fixpy_batch_max_bytes:
+            await dispatcher.followup(
+                interaction,
+                f"ファイルが大きすぎます (上限: {settings.fixpy_batch_max_bytes:,}バイト)",
+                ephemeral=True,
+            )
+            return
+
+        params = ClaudeModelParams(
+            model=settings.fixpy_model,
+            max_tokens=settings.claude_default_max_tokens,
+            temperature=settings.claude_default_temperature,
+            top_p=settings.claude_default_top_p,
+        )
+        with tempfile.TemporaryDirectory(prefix="fixpy-batch-") as workdir:
+            path = Path(workdir, "upload")
+            await _download(file, path, settings.fixpy_batch_max_bytes)
+            sources = await asyncio.to_thread(
+                _read_sources,
+                path,
+                file.filename,
+                settings.fixpy_batch_max_bytes,
+            )
+        units = _split_sources(sources)
+        # Each function is one model request and counts as one use
+        # mypy(name-defined): defined in a wildcard import
+        remaining = await get_remaining_daily_usage(user.id)  # type: ignore # noqa: F405
+        max_units = settings.fixpy_batch_max_units
+        if remaining is not None and remaining < max_units:
+            max_units = remaining
+        skipped = max(0, len(units) - max_units)
+        units = units[:max_units]
+        limit_note = (
+            f"\n本日の残り使用回数 ({remaining}回) を超える関数は修正しません"
+            if remaining is not None and skipped and max_units == remaining
+            else ""
+        )
+
+        if settings.fixpy_batch_deferred and units:
+            await _enqueue_sources(interaction, sources, units, config, params)
+            await dispatcher.followup(
+                interaction,
+                f"{len(units)}個の関数の修正を受け付けました。"
+                f"完了したらDMでお知らせします (最大24時間){limit_note}",
+                ephemeral=True,
+            )
+            await UsageLimitDAO().increment_usage_count(user.id, len(units))
+            return
+
+        fixed_units = await _fix_sources(interaction, units, config, params)
+        patch, summary = _make_report(sources, fixed_units, skipped)
+        summary += limit_note
+
+        if not patch:
+            await dispatcher.followup(interaction, summary, ephemeral=True)
+        else:
+            await dispatcher.followup(
+                interaction,
+                summary,
+                file=File(io.BytesIO(patch.encode()), filename=_PATCH_FILENAME),
+                ephemeral=True,
+            )
+        await UsageLimitDAO().increment_usage_count(user.id, len(units))
+
+    except _BatchError as err:
+        await dispatcher.followup(interaction, f"エラー: {err}", ephemeral=True)
+    except Exception as err:
+        msg = f"Error processing fixpy_batch request: {err!s}"
+        logger.exception(msg)
+        await dispatcher.followup(
+            interaction,
+            "コードの修正中にエラーが発生しました。",
+            ephemeral=True,
+        )
@@ -1,29 +1,67 @@
+import hashlib
+import io
+import re
+from collections.abc import Awaitable, Callable
+
 from discord import (
+    File,
     Interaction,
     TextStyle,
 )
 from discord.ui import Modal, TextInput
 
 from src.aichan._cli import parse_args_and_setup_logging
-from src.aichan.adapters.chat import ChatMessage
+from src.aichan.adapters.chat import ChatMessage, ChatTurn, Conversation
+from src.aichan.adapters.response import (
+    MODERATION_FLAGGED_MESSAGE,
+    ResponseResult,
+    ResponseStatus,
+)
 from src.aichan.ai.models.claude_model import ClaudeModelParams
 from src.aichan.ai.services.anthropic_text import generate_anthropic_response
-from src.aichan.config.env import (
-    CLAUDE_DEFAULT_MAX_TOKENS,
-    CLAUDE_DEFAULT_TEMPERATURE,
-    CLAUDE_DEFAULT_TOP_P,
-    FIXPY_MODEL,
-)
-from src.aichan.config.prompt import FIXPY_SYSTEM
+from src.aichan.config.store import ConfigSnapshot, get_config
 from src.aichan.database.dao.access_dao import AccessDAO
+from src.aichan.database.dao.fixpy_cache_dao import FixpyCacheDAO
 from src.aichan.discord.client import BotClient
+from src.aichan.discord.outbound import OutboundDispatcher
+from src.aichan.utils.code_analysis import CodeReport, analyze_code_in_pool
+from src.aichan.utils.code_sandbox import SandboxPool, VerificationResult, extract_code
 from src.aichan.utils.decorators import *
-from src.aichan.utils.model_params_store import ModelParamsStore
+from src.aichan.utils.moderation import screen_prompt
+from src.aichan.utils.rate_limiter import RateLimiter
 
 access_dao = AccessDAO()
+fixpy_cache_dao = FixpyCacheDAO()
 client = BotClient.get_instance()
+dispatcher = OutboundDispatcher()
 logger = parse_args_and_setup_logging()
-model_params = ModelParamsStore()
+
+# Name of the attachment of locally fixed code that does not fit in a message
+_FIXED_CODE_FILENAME = "fixed.py"
+# Follow-up sent to the model once when its fixed code fails verification
+_REPAIR_REQUEST = (
+    "The fixed code failed when it was run with the doctests:\n"
+    "<verification>\n{failure}\n</verification>\n"
+    "Fix the code again so that it runs and the doctests pass."
+)
+_MARKDOWN_CODE = re.compile(r"```.*?```|`[^`\n]+`", re.DOTALL)
+_CACHED_NOTE = "(同じ内容のコードへの過去の回答です)"
+
+
+async def _send_local_fix(interaction: Interaction, report: CodeReport, limit: int) -> None:
+    fixes = "\n".join(f"- {fix}" for fix in report.fixes)
+    header = f"**ローカル解析で修正しました** (AIは使用していません)\n{fixes}"
+    message = f"{header}\n```python\n{report.fixed_code}\n```"
+    if len(message) <= limit:
+        await dispatcher.followup(interaction, message, ephemeral=True)
+        return
+    fixed_code = str(report.fixed_code).encode()
+    await dispatcher.followup(
+        interaction,
+        header[:limit],
+        file=File(io.BytesIO(fixed_code), filename=_FIXED_CODE_FILENAME),
+        ephemeral=True,
+    )
 
 
 class CodeModal(Modal):
@@ -63,58 +101,201 @@ class CodeModal(Modal):
         interaction : Interaction
             The interaction object from Discord.
         """
+        # Flagged code never reaches the model and is not counted as usage
+        if screen_prompt(self.code_input.value) is not None:
+            await interaction.response.send_message(MODERATION_FLAGGED_MESSAGE, ephemeral=True)
+            return
+
         await interaction.response.defer(thinking=True)
 
         try:
             code = self.code_input.value
+            config = get_config()
+            settings = config.settings
 
             # Claude AIに修正を依頼
-            if FIXPY_MODEL is None:
-                await interaction.followup.send(
+            if settings.fixpy_model is None:
+                await dispatcher.followup(
+                    interaction,
                     "エラー: 利用可能なClaudeモデルがありません。管理者に連絡してください。",
                     ephemeral=True,
                 )
                 return
 
+            # Syntax errors with an obvious fix are answered without the model
+            report = await analyze_code_in_pool(code)
+            if report.is_trivially_fixed:
+                await _send_local_fix(interaction, report, settings.max_chars_per_message)
+                logger.info("Fixed the code of %s locally", interaction.user)
+                return
+            findings = report.render()
+            if findings:
+                code = f"{code}\n\n{findings}"
+
             params = ClaudeModelParams(
-                model=FIXPY_MODEL,
-                max_tokens=CLAUDE_DEFAULT_MAX_TOKENS,
+                model=settings.fixpy_model,
+                max_tokens=settings.claude_default_max_tokens,
                 temperature=self.temperature,
                 top_p=self.top_p,
             )
 
-            message = [ChatMessage(role="user", content=code)]
+            # Code equivalent to an earlier submission gets the earlier answer
+            cache_key = _cache_key(report, config, params)
+            cached = await _cached_answer(cache_key, report)
+            if cached is not None:
+                # Cache hits do not count against the rate limit
+                RateLimiter().release(interaction.user.id, interaction.guild_id)
+                await dispatcher.followup(interaction, cached, ephemeral=True)
+                logger.info("Answered the code of %s from the cache", interaction.user)
+                return
+
+            message = Conversation([ChatMessage(role="user", content=code).to_turn()])
+
+            async def generate(conversation: Conversation) -> ResponseResult:
+                return await generate_anthropic_response(
+                    system_prompt=config.prompts.fixpy_system,
+                    prompt=conversation,
+                    model_params=params,
+                )
+
+            response_result = await generate(message)
+            verification = None
+            if response_result.status is ResponseStatus.SUCCESS:
+                response_result, verification = await _verify_and_repair(
+                    message,
+                    response_result,
+                    generate,
+                    tests=self.code_input.value,
+                )
 
-            response_result = await generate_anthropic_response(
-                system_prompt=FIXPY_SYSTEM,
-                prompt=message,
-                model_params=params,
+            await _store_answer(
+                cache_key,
+                report,
+                response_result,
+                verification,
+                settings.fixpy_cache_size,
             )
 
             # レスポンスを送信
-            await interaction.followup.send(
-                f"{response_result.result}",
-                ephemeral=True,
-            )
+            content = f"{response_result.result}"
+            if verification is not None:
+                content = f"{content}\n\n{verification.summary()}"
+            await dispatcher.followup(interaction, content, ephemeral=True)
 
         except Exception as err:
             msg = f"Error processing fixpy request: {err!s}"
             logger.exception(msg)
-            await interaction.followup.send(
+            await dispatcher.followup(
+                interaction,
                 "コードの修正中にエラーが発生しました。",
                 ephemeral=True,
             )
 
 
+def _cache_key(
+    report: CodeReport,
+    config: ConfigSnapshot,
+    params: ClaudeModelParams,
+) -> str | None:
+    # The answer depends on the code, the system prompt and the sampling parameters
+    if report.fingerprint is None or config.settings.fixpy_cache_size <= 0:
+        return None
+    key = "\0".join(
+        (
+            report.fingerprint.digest,
+            config.prompts.fixpy_system,
+            str(params.model),
+            str(params.max_tokens),
+            repr(params.temperature),
+            repr(params.top_p),
+        ),
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+async def _cached_answer(cache_key: str | None, report: CodeReport) -> str | None:
+    if cache_key is None or report.fingerprint is None:
+        return None
+    cached = await fixpy_cache_dao.get(cache_key)
+    if cached is None:
+        return None
+    response, cached_names = cached
+    # Use the names of the submitted code in the answer given for other names
+    renames = {
+        old: new
+        for old, new in zip(cached_names, report.fingerprint.names, strict=False)
+        if old != new
+    }
+    if renames:
+        pattern = re.compile(
+            r"\b(?:" + "|".join(map(re.escape, sorted(renames, key=len, reverse=True))) + r")\b",
+        )
+        # Only in code, as short names such as `a` are also words of the explanation
+        response = _MARKDOWN_CODE.sub(
+            lambda code: pattern.sub(lambda name: renames[name[0]], code[0]),
+            response,
+        )
+    return f"{response}\n\n{_CACHED_NOTE}"
+
+
+async def _store_answer(
+    cache_key: str | None,
+    report: CodeReport,
+    response_result: ResponseResult,
+    verification: VerificationResult | None,
+    max_entries: int,
+) -> None:
+    if cache_key is None or report.fingerprint is None:
+        return
+    # Answers that failed verification are not worth repeating
+    if response_result.status is not ResponseStatus.SUCCESS or not response_result.result:
+        return
+    if verification is not None and not verification.ok:
+        return
+    await fixpy_cache_dao.put(
+        cache_key,
+        response_result.result,
+        report.fingerprint.names,
+        max_entries,
+    )
+
+
+async def _verify_and_repair(
+    conversation: Conversation,
+    response_result: ResponseResult,
+    generate: Callable[[Conversation], Awaitable[ResponseResult]],
+    tests: str,
+) -> tuple[ResponseResult, VerificationResult | None]:
+    # Run the fixed code in the sandbox, and ask the model once more if it fails
+    code = extract_code(response_result.result or "")
+    if code is None:
+        return response_result, None
+    sandbox = SandboxPool()
+    verification = await sandbox.verify(code, tests=tests)
+    if verification is None or verification.ok:
+        return response_result, verification
+
+    logger.info("The fixed code failed verification, asking for a repair")
+    conversation.append(ChatTurn("assistant", response_result.result or ""))
+    conversation.append(ChatTurn("user", _REPAIR_REQUEST.format(failure=verification.failure)))
+    repaired = await generate(conversation)
+    repaired_code = extract_code(repaired.result or "")
+    if repaired.status is not ResponseStatus.SUCCESS or repaired_code is None:
+        return response_result, verification
+    return repaired, await sandbox.verify(repaired_code, tests=tests)
+
+
 @client.tree.command(name="fixpy", description="Pythonコードのバグやエラーを検出して修正します")
 # mypy(name-defined): defined in a wildcard import
+@is_within_rate_limit()  # type: ignore # noqa: F405
+# mypy(name-defined): defined in a wildcard import
 @is_authorized_server()  # type: ignore # noqa: F405
 # mypy(name-defined): defined in a wildcard import
 @is_not_blocked_user()  # type: ignore # noqa: F405
 async def fix_command(
     interaction: Interaction,
-    temperature: float = CLAUDE_DEFAULT_TEMPERATURE,
-    top_p: float = CLAUDE_DEFAULT_TOP_P,
+    temperature: float | None = None,
+    top_p: float | None = None,
 ) -> None:
     """Handle the /fixpy slash command.
 
@@ -122,14 +303,19 @@ async def fix_command(
     ----------
     interaction : Interaction
         The interaction instance.
-    temperature : float, optional
-        The temperature parameter for Claude, by default CLAUDE_DEFAULT_TEMPERATURE.
-    top_p : float, optional
-        The top-p parameter for Claude, by default CLAUDE_DEFAULT_TOP_P.
+    temperature : float | None, optional
+        The temperature parameter for Claude, by default `claude_default_temperature`.
+    top_p : float | None, optional
+        The top-p parameter for Claude, by default `claude_default_top_p`.
     """
     try:
         user = interaction.user
         logger.info("%s executed 'fixpy' command", user)
+        settings = get_config().settings
+        if temperature is None:
+            temperature = settings.claude_default_temperature
+        if top_p is None:
+            top_p = settings.claude_default_top_p
 
         if temperature < 0.0 or temperature > 1.0:
             await interaction.response.send_message(
@@ -145,7 +331,7 @@ async def fix_command(
             return
 
         # 利用可能なモデルがない場合はエラーを返す
-        if FIXPY_MODEL is None:
+        if settings.fixpy_model is None:
             await interaction.response.send_message(
                 "利用可能なモデルがありません。管理者に連絡してください。",
                 ephemeral=True,
@@ -1,7 +1,7 @@
 from discord import Colour, Embed, Interaction
 
 from src.aichan._cli import parse_args_and_setup_logging
-from src.aichan.config.env import ADMIN_USER_IDS
+from src.aichan.config.store import get_settings
 from src.aichan.database.dao.access_dao import AccessDAO
 from src.aichan.database.dao.limit_dao import UsageLimitDAO
 from src.aichan.discord.client import BotClient
@@ -86,9 +86,8 @@ async def check_limit_command(
         access_dao = AccessDAO()
 
         # advancedユーザーか管理者かどうかを確認
-        is_admin = user.id in ADMIN_USER_IDS
-        advanced_user_ids = await access_dao.fetch_user_ids_by_access_type(access_type="advanced")
-        is_advanced = user.id in advanced_user_ids
+        is_admin = user.id in get_settings().admin_user_ids
+        is_advanced = await access_dao.has_access_type(user.id, access_type="advanced")
 
         user_limit = await dao.get_user_daily_limit(user.id)
         current_usage = await dao.get_user_daily_usage(user.id)
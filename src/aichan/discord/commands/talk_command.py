@@ -1,3 +1,4 @@
+import time
 from typing import Literal
 
 from discord import (
@@ -8,37 +9,47 @@ from discord import (
 )
 
 from src.aichan._cli import parse_args_and_setup_logging
-from src.aichan.adapters.chat import ChatMessage
-from src.aichan.adapters.response import send_response_result
+from src.aichan.adapters.chat import ChatMessage, Conversation
+from src.aichan.adapters.response import MODERATION_FLAGGED_MESSAGE, send_response_result
 from src.aichan.ai.models.claude_model import ClaudeModelParams
 from src.aichan.ai.services.anthropic_text import generate_anthropic_response
-from src.aichan.config.env import (
-    CLAUDE_DEFAULT_MAX_TOKENS,
-    CLAUDE_DEFAULT_TEMPERATURE,
-    CLAUDE_DEFAULT_TOP_P,
-    CLAUDE_MODELS,
-)
-from src.aichan.config.prompt import CLAUDE_SYSTEM
+from src.aichan.config.store import get_config, get_settings
 from src.aichan.database.dao.limit_dao import UsageLimitDAO
 from src.aichan.discord.client import BotClient
 from src.aichan.utils.decorators import *
-from src.aichan.utils.model_params_store import ModelParamsStore
+from src.aichan.utils.model_router import ModelRouter
+from src.aichan.utils.moderation import screen_prompt
+from src.aichan.utils.thread_session_store import ThreadSession, ThreadSessionStore
 
 client = BotClient.get_instance()
 logger = parse_args_and_setup_logging()
-model_params = ModelParamsStore()
+thread_sessions = ThreadSessionStore()
 
 CLAUDE_THREAD_PREFIX: Literal[">>>"] = ">>>"
-system_prompt_dict: dict[int, str] = {}
+# Discord shows at most 25 autocomplete choices
+_MAX_MODEL_CHOICES = 25
+
+
+async def _model_autocomplete(
+    _interaction: Interaction,
+    current: str,
+) -> list[app_commands.Choice[str]]:
+    # Read on every request, so that a reloaded model list applies without a command sync
+    current = current.lower()
+    return [
+        app_commands.Choice(name=model.name, value=model.name)
+        for model in get_settings().claude_models
+        if current in model.name.lower()
+    ][:_MAX_MODEL_CHOICES]
 
 
 @client.tree.command(
     name="talk",
     description="スレッドを作成し、AIちゃんとの会話を開始します",
 )
-@app_commands.choices(
-    model=[app_commands.Choice(name=model.name, value=model.value) for model in CLAUDE_MODELS],
-)
+@app_commands.autocomplete(model=_model_autocomplete)
+# mypy(name-defined): defined in a wildcard import
+@is_within_rate_limit()  # type: ignore # noqa: F405
 # mypy(name-defined): defined in a wildcard import
 @is_authorized_server()  # type: ignore # noqa: F405
 # mypy(name-defined): defined in a wildcard import
@@ -50,9 +61,9 @@ system_prompt_dict: dict[int, str] = {}
 async def talk_command(
     interaction: Interaction,
     prompt: str,
-    model: app_commands.Choice[int],
-    temperature: float = CLAUDE_DEFAULT_TEMPERATURE,
-    top_p: float = CLAUDE_DEFAULT_TOP_P,
+    model: str,
+    temperature: float | None = None,
+    top_p: float | None = None,
 ) -> None:
     """Create a new thread and start a chat with the assistant.
 
@@ -62,18 +73,25 @@ async def talk_command(
         The interaction object from the command.
     prompt : str
         The initial message to send to the AI assistant.
-    model : app_commands.Choice[int]
-        The AI model to use for the conversation.
-    temperature : float
+    model : str
+        The AI model to use for the conversation, one of `claude_models`.
+    temperature : float | None
         Controls randomness in response generation. Lower values make responses more deterministic.
         Must be between 0.0 and 1.0. Defaults to predefined temperature value.
-    top_p : float
+    top_p : float | None
         Controls diversity of responses by limiting token selection to a cumulative probability.
         Must be between 0.0 and 1.0. Defaults to predefined top_p value.
     """
     try:
         user = interaction.user
         logger.info("%s executed 'chat' command: %s", user, prompt[:20])
+        # One snapshot for the whole turn, even if the configuration is reloaded meanwhile
+        config = get_config()
+        settings = config.settings
+        if temperature is None:
+            temperature = settings.claude_default_temperature
+        if top_p is None:
+            top_p = settings.claude_default_top_p
 
         if temperature < 0.0 or temperature > 1.0:
             await interaction.response.send_message(
@@ -87,13 +105,24 @@ async def talk_command(
                 ephemeral=True,
             )
             return
+        # Autocomplete only suggests models, any text can be submitted
+        if model not in {choice.name for choice in settings.claude_models}:
+            await interaction.response.send_message(
+                "**model**は候補から選択してください",
+                ephemeral=True,
+            )
+            return
+        # Flagged prompts never reach the model and are not counted as usage
+        if screen_prompt(prompt) is not None:
+            await interaction.response.send_message(MODERATION_FLAGGED_MESSAGE, ephemeral=True)
+            return
 
         # ------ Define discord embed style ------
         embed = Embed(
             description=f"<@{user.id}> **initiated the chat!**",
             color=0xF4B3C2,
         )
-        embed.add_field(name="model", value=model.name, inline=True)
+        embed.add_field(name="model", value=model, inline=True)
         embed.add_field(name="temperature", value=temperature, inline=True)
         embed.add_field(name="top_p", value=top_p, inline=True)
         embed.add_field(name="message", value=prompt)
@@ -108,28 +137,35 @@ async def talk_command(
             auto_archive_duration=60,
             slowmode_delay=1,
         )
-        system_prompt_dict[thread.id] = CLAUDE_SYSTEM
-        model_params.set_model_params(
-            thread.id,
-            ClaudeModelParams(
-                model=model.name,
-                max_tokens=CLAUDE_DEFAULT_MAX_TOKENS,
+        session = ThreadSession(
+            thread_id=thread.id,
+            model_params=ClaudeModelParams(
+                model=model,
+                max_tokens=settings.claude_default_max_tokens,
                 temperature=temperature,
                 top_p=top_p,
             ),
+            prompt_key="claude_system",
         )
+        await thread_sessions.set_session(session)
         async with thread.typing():
-            messages = [ChatMessage(role=user.name, content=prompt)]
+            messages = Conversation([ChatMessage(role=user.name, content=prompt).to_turn()])
+            # Simple turns may be answered by a cheaper model than the one chosen
+            route = ModelRouter().route(messages, session.model_params, settings.claude_models)
+            started = time.perf_counter()
             response = await generate_anthropic_response(
-                system_prompt=CLAUDE_SYSTEM,
+                system_prompt=session.system_prompt(config.prompts),
                 prompt=messages,
-                model_params=model_params.get_model_params(thread.id),  # type: ignore
+                model_params=session.model_params if route is None else route.params,
             )
+            latency = time.perf_counter() - started
 
         # Increment the usage count for the user
         await UsageLimitDAO().increment_usage_count(user.id)
 
         await send_response_result(thread=thread, result=response)
+        if route is not None:
+            await ModelRouter().record("talk", route, response, latency)
     except HTTPException as err:
         msg = f"HTTPException occurred in the chat command: {err!s}"
         logger.exception(msg)
@@ -1,38 +1,88 @@
-from discord import Colour, Embed, Interaction, Thread, app_commands
+import time
+
+from discord import (
+    Colour,
+    Embed,
+    Interaction,
+    Object,
+    RawMessageDeleteEvent,
+    RawMessageUpdateEvent,
+    Thread,
+    app_commands,
+)
 from discord import Message as DiscordMessage
 
 from src.aichan._cli import parse_args_and_setup_logging
-from src.aichan.adapters.chat import ChatMessage
-from src.aichan.adapters.response import send_response_result
+from src.aichan.adapters.chat import ChatTurn
+from src.aichan.adapters.response import RESPONSE_FILENAME, send_response_result
 from src.aichan.ai.services.anthropic_text import generate_anthropic_response
-from src.aichan.config.env import CLAUDE_DEFAULT_CONTEXT_WINDOW
+from src.aichan.config.store import get_config
 from src.aichan.database.dao.access_dao import AccessDAO
 from src.aichan.database.dao.limit_dao import UsageLimitDAO
 from src.aichan.discord.client import BotClient
 from src.aichan.discord.commands import *
+from src.aichan.discord.outbound import OutboundDispatcher
+from src.aichan.utils.model_router import ModelRouter
+from src.aichan.utils.moderation import screen_prompt
+from src.aichan.utils.thread_compaction import schedule_compaction
+from src.aichan.utils.thread_session_store import ThreadSession, ThreadSessionStore
 
 client = BotClient.get_instance()
+dispatcher = OutboundDispatcher()
 logger = parse_args_and_setup_logging()
 
 
 async def _close_thread(thread: Thread) -> None:
-    await thread.send(
+    await dispatcher.send(
+        thread,
         embed=Embed(
             description="context reached limit, closing thread",
             color=Colour.light_grey(),
         ),
     )
     await thread.edit(archived=False, locked=True)
+    # A locked thread never continues, so its session is no longer needed
+    await ThreadSessionStore().delete_session(thread.id)
+
 
+async def _sync_conversation(thread: Thread, session: ThreadSession, history_limit: int) -> None:
+    conversation = session.conversation
+    # Messages covered by the summary are never fetched again
+    after = conversation.last_message_id or session.summary_until
+    if after is None:
+        messages = [message async for message in thread.history(limit=history_limit)]
+        messages.reverse()
+    else:
+        # Only the messages sent since the last turn need to be rendered
+        messages = [
+            message async for message in thread.history(limit=None, after=Object(id=after))
+        ]
 
-async def _get_conversation_history(thread: Thread, limit: int) -> list:
-    convo_history = [
-        await ChatMessage.from_discord_message(message)
-        async for message in thread.history(limit=limit)
-    ]
-    convo_history = [msg for msg in convo_history if msg is not None]
-    convo_history.reverse()
-    return convo_history
+    for message in messages:
+        # Another turn of the same thread may have appended them meanwhile
+        last_message_id = conversation.last_message_id or session.summary_until
+        if last_message_id is not None and message.id <= last_message_id:
+            continue
+        turn = ChatTurn.from_discord_message(message)
+        if (
+            message.author == client.user
+            and message.attachments
+            and message.attachments[0].filename == RESPONSE_FILENAME
+        ):
+            # Long responses are sent as a file instead of message content
+            content = await message.attachments[0].read()
+            turn = ChatTurn("assistant", content.decode())
+        elif (
+            turn is not None
+            and message.author != client.user
+            and screen_prompt(turn.content) is not None
+        ):
+            # Flagged messages were never answered and stay out of the context;
+            # the replies of the bot are its own and are not screened
+            turn = None
+        if turn is not None:
+            conversation.append(turn, message.id)
+        conversation.last_message_id = message.id
 
 
 async def _handle_claude_thread(discord_msg: DiscordMessage) -> None:
@@ -40,14 +90,27 @@ async def _handle_claude_thread(discord_msg: DiscordMessage) -> None:
         return
 
     thread: Thread = discord_msg.channel
+    # One snapshot for the whole turn, even if the configuration is reloaded meanwhile
+    config = get_config()
+    settings = config.settings
+
+    flagged = screen_prompt(discord_msg.content)
+    if flagged is not None:
+        await send_response_result(thread=thread, result=flagged)
+        return
 
-    if thread.message_count > CLAUDE_DEFAULT_CONTEXT_WINDOW:
+    # Without summarization, the history is bounded by locking long threads
+    if (
+        not settings.thread_summary_model
+        and thread.message_count > settings.claude_default_context_window
+    ):
         await _close_thread(thread)
         return
 
     # mypy(name-defined): defined in a wildcard import
     if not await check_user_daily_limit(discord_msg.author.id):  # type: ignore # noqa: F405
-        await thread.send(
+        await dispatcher.send(
+            thread,
             embed=Embed(
                 description="**本日のAI使用回数の上限に達しました。明日0時にリセットされます。**",
                 color=Colour.red(),
@@ -55,32 +118,67 @@ async def _handle_claude_thread(discord_msg: DiscordMessage) -> None:
         )
         return
 
+    # Checked last, as the token would not be given back if a later check failed
+    # mypy(name-defined): defined in a wildcard import
+    retry_after = check_user_rate_limit(discord_msg.author.id, thread.guild.id)  # type: ignore # noqa: F405
+    if retry_after > 0:
+        await dispatcher.send(
+            thread,
+            embed=Embed(
+                description=f"**リクエストが多すぎます。{retry_after:.1f}秒後に再試行してください。**",
+                color=Colour.yellow(),
+            ),
+        )
+        return
+
     try:
-        convo_history = await _get_conversation_history(thread, CLAUDE_DEFAULT_CONTEXT_WINDOW)
+        session = await ThreadSessionStore().get_session(thread.id)
+        if session is None:
+            await dispatcher.send(
+                thread,
+                embed=Embed(
+                    description="**この会話の設定が見つかりません。`/talk`で新しい会話を始めてください。**",
+                    color=Colour.red(),
+                ),
+            )
+            return
 
+        await _sync_conversation(thread, session, settings.claude_default_context_window)
+
+        # Simple turns may be answered by a cheaper model than the one of the thread
+        route = ModelRouter().route(
+            session.conversation,
+            session.model_params,
+            settings.claude_models,
+        )
         async with thread.typing():
-            # mypy(name-defined): defined in a wildcard import
-            response = await generate_anthropic_response(  # type: ignore
-                # mypy(name-defined): defined in a wildcard import
-                system_prompt=system_prompt_dict.get(  # type: ignore # noqa: F405
-                    thread.id,
-                ),
-                prompt=convo_history,
-                # mypy(name-defined): defined in a wildcard import
-                model_params=model_params.get_model_params(  # type: ignore # noqa: F405
-                    thread.id,
-                ),
+            started = time.perf_counter()
+            response = await generate_anthropic_response(
+                system_prompt=session.system_prompt(config.prompts),
+                prompt=session.conversation,
+                model_params=session.model_params if route is None else route.params,
             )
+            latency = time.perf_counter() - started
 
         # Increment usage count
         await UsageLimitDAO().increment_usage_count(discord_msg.author.id)
 
         await send_response_result(thread=discord_msg.channel, result=response)
+        if route is not None:
+            await ModelRouter().record("talk", route, response, latency)
+
+        if (
+            settings.thread_summary_model
+            and response.input_tokens is not None
+            and response.input_tokens > settings.thread_summary_threshold
+        ):
+            schedule_compaction(session)
     except Exception as err:
         error_msg = f"Error occurred while processing message: {err!s}"
         logger.exception(error_msg)
 
-        await thread.send(
+        await dispatcher.send(
+            thread,
             embed=Embed(
                 description="**Error:** 応答の生成中にエラーが発生しました",
                 color=Colour.red(),
@@ -89,9 +187,6 @@ async def _handle_claude_thread(discord_msg: DiscordMessage) -> None:
 
 
 async def _is_valid_message(discord_msg: DiscordMessage) -> bool:
-    # Get the user id that has access type "blocked"
-    blocked_user_ids = await AccessDAO().fetch_user_ids_by_access_type(access_type="blocked")
-
     return not (
         # Ignore messages from the bot
         # Blocked user can't use the bot
@@ -100,12 +195,13 @@ async def _is_valid_message(discord_msg: DiscordMessage) -> bool:
         # Ignore threads that are archived, locked or title is not what we expected
         # Ignore threads that have too many messages
         discord_msg.author == client.user
-        or discord_msg.author.id in blocked_user_ids
         or not isinstance(discord_msg.channel, Thread)
         or client.user is None
         or discord_msg.channel.owner_id != client.user.id
         or discord_msg.channel.archived
         or discord_msg.channel.locked
+        # Look up the database only for messages that passed the checks above
+        or await AccessDAO().has_access_type(discord_msg.author.id, access_type="blocked")
     )
 
 
@@ -130,7 +226,8 @@ async def on_message(user_msg: DiscordMessage) -> None:
             await _handle_claude_thread(user_msg)
     except Exception:
         logger.exception("An error occurred in the on_message event")
-        await user_msg.channel.send(
+        await dispatcher.send(
+            user_msg.channel,
             embed=Embed(
                 description="An error occurred. Please try again later.",
                 color=Colour.red(),
@@ -138,6 +235,49 @@ async def on_message(user_msg: DiscordMessage) -> None:
         )
 
 
+@client.event
+async def on_thread_update(before: Thread, after: Thread) -> None:
+    """Event handler for Discord thread update events.
+
+    Parameters
+    ----------
+    before : Thread
+        The thread before the update.
+    after : Thread
+        The thread after the update.
+    """
+    # Archived threads are idle, so free their session from memory.
+    # It is loaded again from the database if the thread is reopened.
+    if after.archived and not before.archived:
+        ThreadSessionStore().evict(after.id)
+
+
+@client.event
+async def on_raw_message_edit(payload: RawMessageUpdateEvent) -> None:
+    """Event handler for Discord message edit events.
+
+    Parameters
+    ----------
+    payload : RawMessageUpdateEvent
+        The payload of the edited message.
+    """
+    # The rendered messages of the thread no longer match its history
+    ThreadSessionStore().reset_conversation(payload.channel_id)
+
+
+@client.event
+async def on_raw_message_delete(payload: RawMessageDeleteEvent) -> None:
+    """Event handler for Discord message delete events.
+
+    Parameters
+    ----------
+    payload : RawMessageDeleteEvent
+        The payload of the deleted message.
+    """
+    # The rendered messages of the thread no longer match its history
+    ThreadSessionStore().reset_conversation(payload.channel_id)
+
+
 @client.tree.error
 async def on_app_command_error(
     interaction: Interaction,
@@ -153,6 +293,12 @@ async def on_app_command_error(
     error : app_commands.AppCommandError
         The error object that was raised
     """
+    if isinstance(error, app_commands.CommandOnCooldown):
+        await interaction.response.send_message(
+            f"**CommandOnCooldown:** {error.retry_after:.1f}秒後に再試行してください",
+            ephemeral=True,
+        )
+        return
     if isinstance(error, app_commands.CheckFailure):
         await interaction.response.send_message(
             "**CheckFailure:** このコマンドを実行する権限がありません",
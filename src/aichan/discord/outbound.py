@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Self
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.config.store import get_settings
+from src.aichan.utils.rate_limiter import TokenBucket
+
+if TYPE_CHECKING:
+    from discord import Embed, File, Interaction, Message
+    from discord.abc import MessageableChannel
+
+logger = parse_args_and_setup_logging()
+
+# Discord allows 5 messages per 5 seconds per channel and 50 requests
+# per second per bot. Staying below them avoids waiting on 429 retries.
+_CHANNEL_BURST = 5
+_CHANNEL_RATE = 1.0
+_GLOBAL_BURST = 50
+_GLOBAL_RATE = 50.0
+# How long thread messages wait while interaction followups are pending
+_FOLLOWUP_YIELD_SECONDS = 0.05
+
+
+class _Outgoing:
+    """A message waiting to be sent to a channel."""
+
+    __slots__ = ("content", "embed", "file", "future")
+
+    def __init__(
+        self,
+        content: str | None,
+        embed: Embed | None,
+        file: File | None,
+        future: asyncio.Future[Message],
+    ) -> None:
+        self.content = content
+        self.embed = embed
+        self.file = file
+        self.future = future
+
+    @property
+    def is_text(self) -> bool:
+        """Whether the message only has text content."""
+        return self.content is not None and self.embed is None and self.file is None
+
+
+class _ChannelQueue:
+    """The pending messages and the rate limit of a channel."""
+
+    __slots__ = ("bucket", "channel", "pending", "worker")
+
+    def __init__(self, channel: MessageableChannel) -> None:
+        self.channel = channel
+        self.pending: deque[_Outgoing] = deque()
+        self.bucket = TokenBucket(capacity=_CHANNEL_BURST, rate=_CHANNEL_RATE)
+        self.worker: asyncio.Task[None] | None = None
+
+
+class OutboundDispatcher:
+    """A singleton dispatcher of outgoing Discord messages.
+
+    Messages are queued per channel and sent in order by one worker per
+    channel, which waits for the channel's and the global rate limits
+    instead of running into them. Consecutive text messages to the same
+    channel are merged while they fit into one message. Interaction
+    followups skip the queues and take precedence over channel messages,
+    as interactions expire.
+    """
+
+    _instance = None
+    channels: dict[int, _ChannelQueue]
+    global_bucket: TokenBucket
+    followups_waiting: int
+
+    def __new__(cls) -> Self:
+        """Create a new instance of OutboundDispatcher or return the existing one.
+
+        Returns
+        -------
+        Self
+            The singleton instance of OutboundDispatcher.
+        """
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.channels = {}
+            cls._instance.global_bucket = TokenBucket(capacity=_GLOBAL_BURST, rate=_GLOBAL_RATE)
+            cls._instance.followups_waiting = 0
+        return cls._instance
+
+    def enqueue(
+        self,
+        channel: MessageableChannel,
+        content: str | None = None,
+        *,
+        embed: Embed | None = None,
+        file: File | None = None,
+    ) -> asyncio.Future[Message]:
+        """Queue a message to a channel without waiting for it to be sent.
+
+        Parameters
+        ----------
+        channel : MessageableChannel
+            The channel or thread to send the message to.
+        content : str | None
+            The text of the message.
+        embed : Embed | None
+            An embed to send.
+        file : File | None
+            A file to attach.
+
+        Returns
+        -------
+        asyncio.Future[Message]
+            Resolves to the sent message. Merged messages resolve to the
+            same message.
+        """
+        future: asyncio.Future[Message] = asyncio.get_running_loop().create_future()
+        queue = self.channels.get(channel.id)
+        if queue is None:
+            queue = self.channels[channel.id] = _ChannelQueue(channel)
+        queue.pending.append(_Outgoing(content, embed, file, future))
+        if queue.worker is None:
+            queue.worker = asyncio.create_task(self._run(channel.id, queue))
+        return future
+
+    async def send(
+        self,
+        channel: MessageableChannel,
+        content: str | None = None,
+        *,
+        embed: Embed | None = None,
+        file: File | None = None,
+    ) -> Message:
+        """Send a message to a channel through its queue.
+
+        Parameters
+        ----------
+        channel : MessageableChannel
+            The channel or thread to send the message to.
+        content : str | None
+            The text of the message.
+        embed : Embed | None
+            An embed to send.
+        file : File | None
+            A file to attach.
+
+        Returns
+        -------
+        Message
+            The sent message.
+        """
+        return await self.enqueue(channel, content, embed=embed, file=file)
+
+    async def followup(
+        self,
+        interaction: Interaction,
+        content: str | None = None,
+        *,
+        embed: Embed | None = None,
+        file: File | None = None,
+        ephemeral: bool = False,
+    ) -> None:
+        """Send an interaction followup ahead of queued channel messages.
+
+        Parameters
+        ----------
+        interaction : Interaction
+            The interaction to follow up.
+        content : str | None
+            The text of the message.
+        embed : Embed | None
+            An embed to send.
+        file : File | None
+            A file to attach.
+        ephemeral : bool
+            Whether only the user of the interaction can see the message.
+        """
+        # Only pass what is set; the webhook treats None as a value
+        kwargs: dict[str, Any] = {"ephemeral": ephemeral}
+        if content is not None:
+            kwargs["content"] = content
+        if embed is not None:
+            kwargs["embed"] = embed
+        if file is not None:
+            kwargs["file"] = file
+
+        self.followups_waiting += 1
+        try:
+            await self._acquire_global(urgent=True)
+        finally:
+            self.followups_waiting -= 1
+        await interaction.followup.send(**kwargs)
+
+    async def edit_response(self, interaction: Interaction, content: str) -> None:
+        """Edit the original response of an interaction, e.g. to show progress.
+
+        Parameters
+        ----------
+        interaction : Interaction
+            The interaction whose response is edited.
+        content : str
+            The new text of the response.
+        """
+        self.followups_waiting += 1
+        try:
+            await self._acquire_global(urgent=True)
+        finally:
+            self.followups_waiting -= 1
+        await interaction.edit_original_response(content=content)
+
+    async def _run(self, channel_id: int, queue: _ChannelQueue) -> None:
+        try:
+            while queue.pending:
+                batch = self._take_batch(queue.pending)
+                await self._acquire_channel(queue.bucket)
+                await self._acquire_global(urgent=False)
+                try:
+                    message = await queue.channel.send(**self._merge(batch))
+                # The error is raised to the callers awaiting the messages
+                except Exception as err:  # noqa: BLE001
+                    for item in batch:
+                        if not item.future.done():
+                            item.future.set_exception(err)
+                    continue
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_result(message)
+        finally:
+            queue.worker = None
+            if not queue.pending:
+                self.channels.pop(channel_id, None)
+
+    @staticmethod
+    def _merge(batch: list[_Outgoing]) -> dict[str, Any]:
+        first = batch[0]
+        kwargs: dict[str, Any] = {}
+        if len(batch) > 1:
+            content = ""
+            for item in batch:
+                if content and not content.endswith("\n"):
+                    content += "\n"
+                content += str(item.content)
+            kwargs["content"] = content
+        elif first.content is not None:
+            kwargs["content"] = first.content
+        if first.embed is not None:
+            kwargs["embed"] = first.embed
+        if first.file is not None:
+            kwargs["file"] = first.file
+        return kwargs
+
+    @staticmethod
+    def _take_batch(pending: deque[_Outgoing]) -> list[_Outgoing]:
+        batch = [pending.popleft()]
+        if not batch[0].is_text:
+            return batch
+        size = len(str(batch[0].content))
+        limit = get_settings().max_chars_per_message
+        # Merge the following text messages while the result fits in one message
+        while pending and pending[0].is_text:
+            size += len(str(pending[0].content)) + 1
+            if size > limit:
+                break
+            batch.append(pending.popleft())
+        return batch
+
+    @staticmethod
+    async def _acquire_channel(bucket: TokenBucket) -> None:
+        bucket.refill(time.monotonic())
+        while (wait := bucket.retry_after()) > 0:
+            await asyncio.sleep(wait)
+            bucket.refill(time.monotonic())
+        bucket.tokens -= 1
+
+    async def _acquire_global(self, *, urgent: bool) -> None:
+        bucket = self.global_bucket
+        while True:
+            bucket.refill(time.monotonic())
+            if urgent or not self.followups_waiting:
+                wait = bucket.retry_after()
+                if wait == 0:
+                    bucket.tokens -= 1
+                    return
+            else:
+                wait = _FOLLOWUP_YIELD_SECONDS
+            await asyncio.sleep(wait)
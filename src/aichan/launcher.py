@@ -0,0 +1,137 @@
+"""Run the bot as several processes, each connecting a group of shards.
+
+Usage: ``python -m src.aichan.launcher [--log <log_level>]``
+
+The processes share the SQLite database, which holds the state that
+must stay consistent between them (access types, usage counts, allowed
+channels and thread sessions). In-memory caches stay consistent as they
+are keyed by guild, and every guild belongs to exactly one shard.
+"""
+
+import asyncio
+import signal
+import subprocess
+import sys
+import time
+from types import FrameType
+
+from discord.http import HTTPClient
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.config.store import ConfigStore, get_settings
+from src.aichan.database.migrations import prepare_database
+
+logger = parse_args_and_setup_logging()
+
+# Seconds between checks of the child processes
+_POLL_INTERVAL_SECONDS = 1.0
+
+
+async def _resolve_shard_count(token: str) -> int:
+    """Return the configured shard count, or the one recommended by Discord.
+
+    Parameters
+    ----------
+    token : str
+        The bot token.
+
+    Returns
+    -------
+    int
+        The total number of shards.
+    """
+    shard_count = get_settings().discord_shard_count
+    if shard_count > 0:
+        return shard_count
+    http = HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(token)
+        shard_count, _, _ = await http.get_bot_gateway()
+    finally:
+        await http.close()
+    return shard_count
+
+
+def split_shards(shard_count: int, processes: int) -> list[list[int]]:
+    """Split shards into contiguous groups, one per process.
+
+    Parameters
+    ----------
+    shard_count : int
+        The total number of shards.
+    processes : int
+        The number of processes.
+
+    Returns
+    -------
+    list[list[int]]
+        The shard IDs of each process. Shard 0 is in the first group.
+    """
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    groups = []
+    start = 0
+    for index in range(processes):
+        end = start + size + (1 if index < extra else 0)
+        groups.append(list(range(start, end)))
+        start = end
+    return groups
+
+
+async def _prepare(token: str) -> int:
+    # Migrate once before the processes start, instead of all at once
+    await prepare_database()
+    return await _resolve_shard_count(token)
+
+
+def main() -> int:
+    """Start one bot process per shard group and wait for them.
+
+    If a process exits, the others are stopped as well, so that a
+    process supervisor can restart the whole group.
+
+    Returns
+    -------
+    int
+        The exit code of the first process that exited.
+    """
+    settings = get_settings()
+    shard_count = asyncio.run(_prepare(settings.discord_bot_token))
+    groups = split_shards(shard_count, settings.discord_shard_processes)
+
+    children: list[subprocess.Popen[bytes]] = []
+    for shard_ids in groups:
+        # Without the variables loaded from .env, so that each process can reload them
+        env = {
+            **ConfigStore().process_env,
+            "DISCORD_SHARD_COUNT": str(shard_count),
+            "DISCORD_SHARD_IDS": ",".join(map(str, shard_ids)),
+        }
+        args = [sys.executable, "-m", "src.aichan", *sys.argv[1:]]
+        # The arguments are this interpreter, our own module and our own arguments
+        children.append(subprocess.Popen(args, env=env))  # noqa: S603
+        logger.info("Started process %d with shards %s", children[-1].pid, shard_ids)
+
+    def stop(signum: int, _frame: FrameType | None) -> None:
+        for child in children:
+            if child.poll() is None:
+                child.send_signal(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    exit_code = None
+    while exit_code is None:
+        time.sleep(_POLL_INTERVAL_SECONDS)
+        exited = [child.returncode for child in children if child.poll() is not None]
+        exit_code = exited[0] if exited else None
+
+    logger.info("A bot process exited with code %d, stopping the others", exit_code)
+    stop(signal.SIGTERM, None)
+    for child in children:
+        child.wait()
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
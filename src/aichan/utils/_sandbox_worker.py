@@ -0,0 +1,385 @@
+"""A sandbox worker that runs `/fixpy` code and its doctests.
+
+Started by `code_sandbox.SandboxPool` as ``python -I _sandbox_worker.py``
+and kept running, so that a job only costs a `fork` of a warm, small
+interpreter. Jobs and results are exchanged as one JSON object per line
+on stdin and stdout.
+
+Each job runs in a forked child that cannot create processes, write
+large files, use much CPU time or memory, or open network connections.
+Its filesystem is confined to a temporary directory in new user, mount
+and network namespaces, with only the standard library mounted read-only,
+so the code cannot read the files of the bot such as `.env`. Jobs are
+refused when the confinement is not available, which the child reports
+on a pipe it closes before the code runs. The code shares its process
+with the report of its result, so the result is validated but can only
+be trusted as far as the code itself; the report only names the failing
+doctest example and the type of the exception, never what the code
+printed or returned. This module only uses the standard
+library, as it runs in isolated mode.
+"""
+
+from __future__ import annotations
+
+import ast
+import contextlib
+import ctypes
+import doctest
+import inspect
+import io
+import json
+import os
+import resource
+import select
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import tokenize
+import types
+from pathlib import Path
+from typing import Any
+
+# Linux clone flags for new user, mount and network namespaces
+_CLONE_NEWUSER = 0x10000000
+_CLONE_NEWNS = 0x00020000
+_CLONE_NEWNET = 0x40000000
+# Linux mount(2) and umount2(2) flags
+_MS_RDONLY = 0x1
+_MS_NOSUID = 0x2
+_MS_NODEV = 0x4
+_MS_NOEXEC = 0x8
+_MS_REMOUNT = 0x20
+_MS_NOATIME = 0x400
+_MS_NODIRATIME = 0x800
+_MS_BIND = 0x1000
+_MS_REC = 0x4000
+_MS_PRIVATE = 0x40000
+_MS_RELATIME = 0x200000
+_MNT_DETACH = 0x2
+# Flags of a mount that a user namespace may not clear, by statvfs flag
+_LOCKED_FLAGS = (
+    (os.ST_NOEXEC, _MS_NOEXEC),
+    (os.ST_NOATIME, _MS_NOATIME),
+    (os.ST_NODIRATIME, _MS_NODIRATIME),
+    (os.ST_RELATIME, _MS_RELATIME),
+)
+# Where the dynamic loader finds the shared libraries of extension modules
+_SYSTEM_LIBRARIES = ("/lib", "/lib64", "/usr/lib", "/usr/lib64")
+# pivot_root(2) has no libc wrapper; its system call number by machine
+_SYS_PIVOT_ROOT = {"x86_64": 155, "aarch64": 41}
+# Largest file the code may write
+_MAX_FILE_BYTES = 1024 * 1024
+# Longest source of a failing example kept for the report
+_MAX_EXAMPLE_CHARS = 500
+# Longest failure and result accepted from the child
+_MAX_FAILURE_CHARS = 1500
+_MAX_RESULT_BYTES = 64 * 1024
+# Audit events of operations the code may not perform
+_BLOCKED_EVENTS = (
+    "socket.",
+    "subprocess.",
+    "ctypes.",
+    "os.system",
+    "os.exec",
+    "os.spawn",
+    "os.posix_spawn",
+    "os.fork",
+    "os.forkpty",
+    "os.kill",
+    "os.killpg",
+    "pty.spawn",
+    "shutil.rmtree",
+    "webbrowser.open",
+)
+
+
+class _InputRequiredError(Exception):
+    """Raised by `input`, as no user can answer it."""
+
+
+def _no_input(*_args: object) -> str:
+    raise _InputRequiredError
+
+
+def _audit(event: str, _args: tuple[Any, ...]) -> None:
+    if event.startswith(_BLOCKED_EVENTS):
+        msg = f"{event} is not allowed in the sandbox"
+        raise PermissionError(msg)
+
+
+class _ConfinementError(Exception):
+    """The filesystem of the code cannot be confined, so it must not run."""
+
+
+def _library_paths() -> list[Path]:
+    # The import path inside the installation of Python, which leaves out the
+    # directory of this script and editable installs, and the shared
+    # libraries of extension modules; outermost first
+    prefixes = {Path(prefix).resolve() for prefix in (sys.prefix, sys.base_prefix)}
+    entries = {
+        path
+        for path in (Path(entry).resolve() for entry in sys.path if entry)
+        if any(path.is_relative_to(prefix) for prefix in prefixes)
+    }
+    entries.update((prefix / "lib").resolve() for prefix in prefixes)
+    entries.update(Path(path).resolve() for path in _SYSTEM_LIBRARIES)
+    paths: list[Path] = []
+    for entry in sorted(entries):
+        if entry.is_dir() and not any(entry.is_relative_to(parent) for parent in paths):
+            paths.append(entry)
+    return paths
+
+
+def _confine(workdir: str) -> None:
+    # Make workdir the root of a private mount namespace, with the import
+    # path bound read-only at the same places, and detach the old root
+    machine = os.uname().machine
+    pivot_root = _SYS_PIVOT_ROOT.get(machine)
+    if pivot_root is None:
+        msg = f"pivot_root is not known on {machine}"
+        raise _ConfinementError(msg)
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError as err:
+        raise _ConfinementError(str(err)) from err
+
+    def check(result: int, action: str) -> None:
+        if result != 0:
+            msg = f"{action}: {os.strerror(ctypes.get_errno())}"
+            raise _ConfinementError(msg)
+
+    check(libc.unshare(_CLONE_NEWUSER | _CLONE_NEWNS | _CLONE_NEWNET), "unshare")
+    check(libc.mount(None, b"/", None, _MS_REC | _MS_PRIVATE, None), "make / private")
+    root = workdir.encode()
+    check(libc.mount(root, root, None, _MS_BIND, None), "bind the root")
+    for path in _library_paths():
+        target = Path(workdir, *path.parts[1:])
+        target.mkdir(parents=True, exist_ok=True)
+        check(libc.mount(bytes(path), bytes(target), None, _MS_BIND, None), f"bind {path}")
+        flags = _MS_REMOUNT | _MS_BIND | _MS_RDONLY | _MS_NOSUID | _MS_NODEV
+        statvfs_flags = os.statvfs(path).f_flag
+        for statvfs_flag, mount_flag in _LOCKED_FLAGS:
+            if statvfs_flags & statvfs_flag:
+                flags |= mount_flag
+        check(libc.mount(None, bytes(target), None, flags, None), f"remount {path}")
+    os.chdir(workdir)
+    # With the same new and old root, the old root is stacked below and detached
+    check(libc.syscall(pivot_root, b".", b"."), "pivot_root")
+    check(libc.umount2(b".", _MNT_DETACH), "detach the old root")
+    os.chdir("/")
+
+
+def _isolate(workdir: str, timeout: float, memory_bytes: int) -> None:
+    _confine(workdir)
+    cpu_seconds = int(timeout) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+    resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (_MAX_FILE_BYTES, _MAX_FILE_BYTES))
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    # Not a boundary on its own, but fails blocked operations with a clear error
+    sys.addaudithook(_audit)
+
+
+def _docstrings(source: str) -> list[str]:
+    # Tokens rather than the AST, as the original code sent to /fixpy often
+    # does not parse; the tokens before the first broken one are kept
+    strings: list[str] = []
+    with contextlib.suppress(tokenize.TokenError, SyntaxError):
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            if token.type == tokenize.STRING and ">>>" in token.string:
+                with contextlib.suppress(ValueError, SyntaxError):
+                    strings.append(inspect.cleandoc(ast.literal_eval(token.string)))
+    return strings
+
+
+def _collect_examples(code: str, tests: str) -> list[doctest.Example]:
+    # The examples of the fixed code, then those only found in the original code
+    parser = doctest.DocTestParser()
+    examples: list[doctest.Example] = []
+    seen: set[tuple[str, str]] = set()
+    for docstring in (*_docstrings(code), *_docstrings(tests)):
+        for example in parser.get_examples(docstring):
+            if (example.source, example.want) not in seen:
+                seen.add((example.source, example.want))
+                examples.append(example)
+    return examples
+
+
+class _FirstFailureRunner(doctest.DocTestRunner):
+    """A doctest runner that describes its first failure without the output."""
+
+    failure = ""
+
+    def report_failure(
+        self,
+        out: Any,  # noqa: ANN401
+        test: doctest.DocTest,
+        example: doctest.Example,
+        got: str,
+    ) -> None:
+        del out, test, got
+        if not self.failure:
+            self.failure = f"{_describe(example)}\nThe output differs from the expected one."
+
+    def report_unexpected_exception(
+        self,
+        out: Any,  # noqa: ANN401
+        test: doctest.DocTest,
+        example: doctest.Example,
+        exc_info: tuple[type[BaseException], BaseException, types.TracebackType],
+    ) -> None:
+        del out, test
+        if not self.failure:
+            self.failure = f"{_describe(example)}\nRaised {exc_info[0].__name__}."
+
+
+def _describe(example: doctest.Example) -> str:
+    source = example.source.rstrip()[:_MAX_EXAMPLE_CHARS]
+    want = example.want.rstrip()[:_MAX_EXAMPLE_CHARS]
+    return f"Failed example:\n>>> {source}\nExpected:\n{want or '(nothing)'}"
+
+
+def _result(failure: str, attempted: int = 0, failed: int = 0) -> dict[str, Any]:
+    return {"ok": not failure, "attempted": attempted, "failed": failed, "failure": failure}
+
+
+def _run(code: str, tests: str) -> dict[str, Any]:
+    module = types.ModuleType("__fixpy__")
+    module.__dict__["input"] = _no_input
+    try:
+        compiled = compile(code, "fixpy.py", "exec", dont_inherit=True)
+    except SyntaxError as err:
+        return _result(f"SyntaxError: {err.msg} (line {err.lineno})")
+
+    try:
+        # Running untrusted code is the purpose of this worker; it is isolated by _isolate
+        exec(compiled, module.__dict__)  # noqa: S102
+    except _InputRequiredError:
+        # The code waits for user input; the definitions before it can be tested
+        pass
+    # Whatever the code raises, including SystemExit, is a failed verification
+    except BaseException as err:  # noqa: BLE001
+        return _result(f"Running the code raised {type(err).__name__}.")
+
+    examples = _collect_examples(code, tests)
+    if not examples:
+        return _result("")
+
+    test = doctest.DocTest(examples, module.__dict__, "fixpy", None, None, None)
+    runner = _FirstFailureRunner(
+        optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE,
+        verbose=False,
+    )
+    result = runner.run(test, out=lambda _: None, clear_globs=False)
+    return _result(runner.failure, result.attempted, result.failed)
+
+
+def _child(status_fd: int, result_fd: int, workdir: str, job: dict[str, Any]) -> None:
+    # The code must never write to the protocol pipe
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    try:
+        _isolate(workdir, job["timeout"], job["memory_bytes"])
+    except (_ConfinementError, OSError) as err:
+        os.write(status_fd, str(err).encode() or b"unknown error")
+        os._exit(0)
+    # Closed before the code runs, so that only the worker can report the confinement
+    os.close(status_fd)
+    try:
+        result = _run(job["code"], job["tests"])
+    except MemoryError:
+        result = _result("MemoryError")
+    # The child must always report, or the job looks like a crash
+    except BaseException as err:  # noqa: BLE001
+        result = _result(f"The sandbox failed with {type(err).__name__}.")
+    with os.fdopen(result_fd, "w", encoding="utf-8") as pipe:
+        json.dump(result, pipe)
+    os._exit(0)
+
+
+def _run_job(job: dict[str, Any]) -> dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="fixpy-")
+    try:
+        return _fork_job(workdir, job)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _read_all(fd: int, deadline: float) -> bytes | None:
+    # Read until the write end is closed, or None once the deadline passes
+    data = b""
+    while len(data) <= _MAX_RESULT_BYTES:
+        ready, _, _ = select.select([fd], [], [], max(0.0, deadline - time.monotonic()))
+        if not ready:
+            return None
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def _parse_result(data: bytes) -> dict[str, Any]:
+    # Written by the same process as the code, so it can be anything
+    try:
+        result = json.loads(data)
+    except ValueError:
+        return _result("The sandbox returned an invalid result.")
+    if not (
+        isinstance(result, dict)
+        and isinstance(result.get("failure"), str)
+        and isinstance(result.get("attempted"), int)
+        and isinstance(result.get("failed"), int)
+    ):
+        return _result("The sandbox returned an invalid result.")
+    return _result(result["failure"][:_MAX_FAILURE_CHARS], result["attempted"], result["failed"])
+
+
+def _fork_job(workdir: str, job: dict[str, Any]) -> dict[str, Any]:
+    status_read, status_write = os.pipe()
+    result_read, result_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(status_read)
+        os.close(result_read)
+        _child(status_write, result_write, workdir, job)
+    os.close(status_write)
+    os.close(result_write)
+
+    try:
+        deadline = time.monotonic() + job["timeout"]
+        status = _read_all(status_read, deadline)
+        if status:
+            return {"unconfined": status.decode(errors="replace")}
+        data = None if status is None else _read_all(result_read, deadline)
+        if data is None:
+            return _result(f"Timed out after {job['timeout']} seconds")
+    finally:
+        os.close(status_read)
+        os.close(result_read)
+        # The code may close the pipe and keep running; a child that exited is unaffected
+        os.kill(pid, signal.SIGKILL)
+        _, wait_status = os.waitpid(pid, 0)
+
+    if not data:
+        # Killed by a resource limit before it could report
+        code = os.waitstatus_to_exitcode(wait_status)
+        reason = f"signal {-code}" if code < 0 else f"exit code {code}"
+        return _result(f"Terminated by {reason}")
+    return _parse_result(data)
+
+
+def main() -> None:
+    """Run jobs from stdin until it is closed."""
+    for line in sys.stdin:
+        result = _run_job(json.loads(line))
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Deferred model requests sent through the batch APIs of the providers.
+
+Work that nobody waits for, such as deferred `/fixpy_batch` uploads and
+the summaries of `/talk` threads, is queued in the database as a group
+of requests. A scheduled job submits the queued requests of each
+provider as one batch, which costs half as much as real-time requests
+and does not count against their rate limits, and another job polls the
+running batches. Once every request of a group has a result, the group
+is passed to the handler registered for its kind, which delivers it.
+
+Each process submits and delivers the groups it queued, as only it has
+the shards of their channels. Groups left behind when the shards of the
+processes change are dropped by a daily job after 48 hours. The SDKs read `ANTHROPIC_BASE_URL` and
+`OPENAI_BASE_URL`, so a local stub can stand in for the batch endpoints.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING, Any, Literal, Self
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.adapters.response import ResponseResult, ResponseStatus
+from src.aichan.ai.services.anthropic_batch import fetch_anthropic_batch, submit_anthropic_batch
+from src.aichan.ai.services.openai_batch import fetch_openai_batch, submit_openai_batch
+from src.aichan.config.store import get_settings
+from src.aichan.database.dao.batch_dao import BatchDAO
+from src.aichan.utils.cron import CronSpec
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from src.aichan.utils.scheduler import JobScheduler
+
+    # Called with the context of a completed group and its results by key
+    BatchHandler = Callable[[dict[str, Any], dict[str, ResponseResult]], Awaitable[None]]
+
+logger = parse_args_and_setup_logging()
+
+Provider = Literal["anthropic", "openai"]
+
+# Submit and fetch functions of each provider
+_PROVIDERS: dict[
+    str,
+    tuple[
+        Callable[[dict[str, dict[str, Any]]], Awaitable[str]],
+        Callable[[str], Awaitable[dict[str, ResponseResult] | None]],
+    ],
+] = {
+    "anthropic": (submit_anthropic_batch, fetch_anthropic_batch),
+    "openai": (submit_openai_batch, fetch_openai_batch),
+}
+# Result of the requests a finished batch has no result for
+_MISSING_RESULT = ResponseResult(status=ResponseStatus.ERROR, result=None).model_dump_json()
+
+
+class BatchQueue:
+    """A singleton that queues, submits and delivers deferred requests.
+
+    Handlers are registered by kind when their modules are imported, and
+    are called with the context of the group and its results by key.
+    A handler that fails is logged and its group is dropped, so that it
+    is not delivered again on every poll.
+    """
+
+    _instance = None
+    handlers: dict[str, BatchHandler]
+    dao: BatchDAO
+
+    def __new__(cls) -> Self:
+        """Create a new instance of BatchQueue or return the existing one.
+
+        Returns
+        -------
+        Self
+            The singleton instance of BatchQueue.
+        """
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.handlers = {}
+            cls._instance.dao = BatchDAO()
+        return cls._instance
+
+    @staticmethod
+    def owner() -> str:
+        """Return the owner of the groups of this process, from its shards."""
+        return ",".join(str(shard_id) for shard_id in get_settings().discord_shard_ids)
+
+    def register(self, kind: str, handler: BatchHandler) -> None:
+        """Register the handler that delivers the groups of a kind.
+
+        Parameters
+        ----------
+        kind : str
+            The kind of the groups, e.g. 'thread_summary'.
+        handler : BatchHandler
+            Coroutine function called with the context of a completed
+            group and the results of its requests by key.
+        """
+        self.handlers[kind] = handler
+
+    async def enqueue(
+        self,
+        kind: str,
+        group_id: str,
+        context: dict[str, Any],
+        requests: dict[str, dict[str, Any]],
+        provider: Provider = "anthropic",
+    ) -> bool:
+        """Queue a group of requests for the next batch.
+
+        Parameters
+        ----------
+        kind : str
+            The kind of the group, which selects its handler.
+        group_id : str
+            Unique ID of the group, of letters, digits, '-' and '_'.
+            A group that is still pending is not queued again.
+        context : dict[str, Any]
+            What the handler needs to deliver the group. Must be JSON.
+        requests : dict[str, dict[str, Any]]
+            The parameters of each request by key, from
+            `anthropic_batch_params` or `openai_batch_params`.
+        provider : Provider
+            The provider of the requests.
+
+        Returns
+        -------
+        bool
+            True if the group was queued, False if it is already pending.
+        """
+        queued = await self.dao.add_group(
+            group_id,
+            kind,
+            self.owner(),
+            json.dumps(context),
+            [
+                (f"{group_id}-{key}", provider, json.dumps(params))
+                for key, params in requests.items()
+            ],
+        )
+        if queued:
+            logger.info("Queued %d %s requests as group %s", len(requests), kind, group_id)
+        return queued
+
+    async def submit(self) -> None:
+        """Submit the queued requests of each provider in batches.
+
+        Requests that fail to be submitted stay queued for the next run.
+        """
+        owner = self.owner()
+        max_requests = get_settings().batch_max_requests
+        for provider, (submit_batch, _) in _PROVIDERS.items():
+            while True:
+                rows = await self.dao.get_unsubmitted(owner, provider, max_requests)
+                if not rows:
+                    break
+                try:
+                    batch_id = await submit_batch(
+                        {custom_id: json.loads(params) for custom_id, params in rows},
+                    )
+                except Exception:
+                    logger.exception("Failed to submit a %s batch", provider)
+                    break
+                await self.dao.set_batch_id([custom_id for custom_id, _ in rows], batch_id)
+                logger.info("Submitted %d requests as %s batch %s", len(rows), provider, batch_id)
+                if len(rows) < max_requests:
+                    break
+
+    async def poll(self) -> None:
+        """Store the results of finished batches and deliver completed groups."""
+        owner = self.owner()
+        for provider, batch_id in await self.dao.get_running_batches(owner):
+            _, fetch_batch = _PROVIDERS[provider]
+            try:
+                results = await fetch_batch(batch_id)
+            except Exception:
+                logger.exception("Failed to check %s batch %s", provider, batch_id)
+                continue
+            if results is None:
+                continue
+            await self.dao.set_results(
+                batch_id,
+                {custom_id: result.model_dump_json() for custom_id, result in results.items()},
+                _MISSING_RESULT,
+            )
+            logger.info("Received %d results of %s batch %s", len(results), provider, batch_id)
+
+        for group_id, kind, context in await self.dao.get_completed_groups(owner):
+            handler = self.handlers.get(kind)
+            if handler is None:
+                logger.error("No handler for group %s of kind %s", group_id, kind)
+                continue
+            prefix = f"{group_id}-"
+            group_results = {
+                custom_id.removeprefix(prefix): ResponseResult.model_validate_json(result)
+                for custom_id, result in (await self.dao.get_results(group_id)).items()
+            }
+            try:
+                await handler(json.loads(context), group_results)
+            except Exception:
+                logger.exception("Failed to deliver group %s of kind %s", group_id, kind)
+            await self.dao.delete_group(group_id)
+
+    def register_jobs(self, scheduler: JobScheduler) -> None:
+        """Register the jobs that submit and poll the batches of this process.
+
+        Parameters
+        ----------
+        scheduler : JobScheduler
+            The scheduler to register the jobs with.
+        """
+        settings = get_settings()
+        # Job names are per process, as each one records its own last run
+        suffix = f":{self.owner()}" if settings.discord_shard_ids else ""
+        scheduler.add_job(
+            f"batch_submit{suffix}",
+            CronSpec(settings.batch_submit_cron),
+            self.submit,
+        )
+        scheduler.add_job(
+            f"batch_poll{suffix}",
+            CronSpec(settings.batch_poll_cron),
+            self.poll,
+        )
@@ -0,0 +1,467 @@
+"""Local analysis of Python snippets submitted to `/fixpy`.
+
+The analysis runs in a process pool, so that parsing large or deeply
+nested code never blocks the event loop, and a crash of the parser only
+takes a worker down.
+"""
+
+from __future__ import annotations
+
+import ast
+import asyncio
+import builtins
+import hashlib
+import io
+import keyword
+import re
+import textwrap
+import tokenize
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import cache
+from typing import NamedTuple
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.config.store import get_settings
+
+logger = parse_args_and_setup_logging()
+
+# Seconds to wait for a worker before giving up on the analysis
+_ANALYSIS_TIMEOUT_SECONDS = 5.0
+# Syntax errors fixed locally before the code is handed to the model
+_MAX_LOCAL_FIXES = 5
+# Tab width assumed when replacing tabs mixed with spaces
+_TAB_SIZE = 4
+
+_PRINT_STATEMENT = re.compile(r"^(?P<indent>\s*)print\s+(?P<args>[^#]*?)\s*$")
+# Names that are defined in every module without an assignment
+_MODULE_NAMES = frozenset(dir(builtins)) | {"__file__", "__builtins__", "__annotations__"}
+_MUTABLE_LITERALS = (ast.List, ast.Dict, ast.Set, ast.ListComp, ast.DictComp, ast.SetComp)
+_MUTABLE_CALLS = frozenset({"list", "dict", "set", "bytearray"})
+
+
+class Diagnostic(NamedTuple):
+    """A problem found in the code.
+
+    Attributes
+    ----------
+    line : int | None
+        The line number, starting at 1.
+    column : int | None
+        The column number, starting at 1.
+    code : str
+        A short identifier of the kind of problem.
+    message : str
+        A description of the problem.
+    """
+
+    line: int | None
+    column: int | None
+    code: str
+    message: str
+
+    def __str__(self) -> str:
+        """Format the diagnostic as `line L, column C: code: message`."""
+        location = []
+        if self.line is not None:
+            location.append(f"line {self.line}")
+        if self.column is not None:
+            location.append(f"column {self.column}")
+        prefix = f"{', '.join(location)}: " if location else ""
+        return f"{prefix}{self.code}: {self.message}"
+
+
+class CodeFingerprint(NamedTuple):
+    """A hash of the code that ignores formatting, comments and names.
+
+    Attributes
+    ----------
+    digest : str
+        The SHA-256 of the normalized code.
+    names : tuple[str, ...]
+        The identifiers replaced by placeholders, in placeholder order,
+        so that names in an answer for equivalent code can be mapped.
+    """
+
+    digest: str
+    names: tuple[str, ...]
+
+
+class CodeReport(NamedTuple):
+    """The result of the local analysis.
+
+    Attributes
+    ----------
+    fixes : tuple[Diagnostic, ...]
+        Syntax errors that were fixed locally.
+    diagnostics : tuple[Diagnostic, ...]
+        Problems that remain, in the fixed code if there is one.
+    fixed_code : str | None
+        The code after the local fixes, or None if nothing was fixed or
+        the syntax errors could not be fixed.
+    fingerprint : CodeFingerprint | None
+        The fingerprint of the submitted code, or None if it could not
+        even be tokenized.
+    """
+
+    fixes: tuple[Diagnostic, ...] = ()
+    diagnostics: tuple[Diagnostic, ...] = ()
+    fixed_code: str | None = None
+    fingerprint: CodeFingerprint | None = None
+
+    @property
+    def is_trivially_fixed(self) -> bool:
+        """Whether the local fixes leave no known problems to ask the model about."""
+        return self.fixed_code is not None and not self.diagnostics
+
+    def render(self) -> str:
+        """Render the findings to be attached to the model prompt.
+
+        Returns
+        -------
+        str
+            The findings, or an empty string if there are none.
+        """
+        findings = [f"- {fix} (a local fix is known)" for fix in self.fixes]
+        findings.extend(f"- {diagnostic}" for diagnostic in self.diagnostics)
+        if not findings:
+            return ""
+        return (
+            "<diagnostics>\n"
+            "Found by compiling and statically checking the code above:\n"
+            + "\n".join(findings)
+            + "\n</diagnostics>"
+        )
+
+
+def analyze_code(code: str) -> CodeReport:
+    """Compile the code, fix trivial syntax errors and run static checks.
+
+    Parameters
+    ----------
+    code : str
+        The Python source code.
+
+    Returns
+    -------
+    CodeReport
+        The findings.
+    """
+    fingerprint = fingerprint_code(code)
+    fixes: list[Diagnostic] = []
+    source = code
+    while True:
+        try:
+            tree, warned = _compile(source)
+        except SyntaxError as err:
+            diagnostic = _syntax_diagnostic(err)
+            fixed = _fix_syntax_error(source, err)
+            if fixed is None or len(fixes) == _MAX_LOCAL_FIXES:
+                return CodeReport(diagnostics=(*fixes, diagnostic), fingerprint=fingerprint)
+            fixes.append(diagnostic)
+            source = fixed
+            continue
+        except (ValueError, RecursionError, MemoryError) as err:
+            # Null bytes, or nesting too deep for the parser
+            diagnostic = Diagnostic(None, None, "invalid-source", str(err))
+            return CodeReport(diagnostics=(diagnostic,), fingerprint=fingerprint)
+        diagnostics = sorted(
+            [*warned, *_check_tree(tree)],
+            key=lambda diagnostic: (diagnostic.line or 0, diagnostic.column or 0),
+        )
+        return CodeReport(
+            fixes=tuple(fixes),
+            diagnostics=tuple(diagnostics),
+            fixed_code=source if fixes else None,
+            fingerprint=fingerprint,
+        )
+
+
+def fingerprint_code(code: str) -> CodeFingerprint | None:
+    """Hash the code so that equivalent submissions get the same hash.
+
+    Code that parses is hashed by its AST, with local names replaced by
+    placeholders in order of appearance. Code with syntax errors, which
+    is what `/fixpy` usually gets, is hashed by its tokens in the same way.
+    Builtins, imported names and attributes are kept, as they change
+    what the code does.
+
+    Parameters
+    ----------
+    code : str
+        The Python source code.
+
+    Returns
+    -------
+    CodeFingerprint | None
+        The fingerprint, or None if the code cannot be tokenized.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return _fingerprint_tokens(code)
+    except (ValueError, RecursionError, MemoryError):
+        return None
+    normalizer = _NameNormalizer(_imported_names(tree))
+    try:
+        normalized = ast.dump(normalizer.visit(tree))
+    except RecursionError:
+        return None
+    return CodeFingerprint(_digest("ast", normalized), tuple(normalizer.names))
+
+
+class _NameNormalizer(ast.NodeTransformer):
+    def __init__(self, kept: set[str]) -> None:
+        self.kept = kept
+        self.names: dict[str, str] = {}
+
+    def rename(self, name: str) -> str:
+        if name in self.kept or name in _MODULE_NAMES:
+            return name
+        return self.names.setdefault(name, f"_{len(self.names)}")
+
+    def visit_Name(self, node: ast.Name) -> ast.Name:
+        node.id = self.rename(node.id)
+        return node
+
+    def visit_arg(self, node: ast.arg) -> ast.arg:
+        node.arg = self.rename(node.arg)
+        self.generic_visit(node)
+        return node
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> ast.FunctionDef:
+        node.name = self.rename(node.name)
+        self.generic_visit(node)
+        return node
+
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> ast.AsyncFunctionDef:
+        node.name = self.rename(node.name)
+        self.generic_visit(node)
+        return node
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> ast.ClassDef:
+        node.name = self.rename(node.name)
+        self.generic_visit(node)
+        return node
+
+
+def _imported_names(tree: ast.Module) -> set[str]:
+    return {
+        name
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Import | ast.ImportFrom)
+        for name in _bound_names(node)
+    }
+
+
+def _fingerprint_tokens(code: str) -> CodeFingerprint | None:
+    parts: list[str] = []
+    names: dict[str, str] = {}
+    kept: set[str] = set()
+    in_import = False
+    previous = ""
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type in {tokenize.COMMENT, tokenize.NL, tokenize.ENDMARKER}:
+                continue
+            if token.type in {tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT}:
+                in_import = False
+                parts.append(tokenize.tok_name[token.type])
+                continue
+            text = token.string
+            if token.type == tokenize.NAME and not keyword.iskeyword(text):
+                if in_import:
+                    kept.add(text)
+                elif previous != "." and text not in kept and text not in _MODULE_NAMES:
+                    text = names.setdefault(text, f"_{len(names)}")
+            in_import |= token.string in {"import", "from"}
+            previous = token.string
+            parts.append(text)
+    except tokenize.TokenError:
+        # Raised at the end of the code on unclosed brackets, so every token was seen
+        pass
+    except SyntaxError:
+        # The tokens after the error would be ignored, so different code could collide
+        return None
+    return CodeFingerprint(_digest("tokens", " ".join(parts)), tuple(names))
+
+
+def _digest(kind: str, normalized: str) -> str:
+    return hashlib.sha256(f"{kind}\n{normalized}".encode()).hexdigest()
+
+
+def _compile(source: str) -> tuple[ast.Module, list[Diagnostic]]:
+    # SyntaxWarnings flag likely bugs, such as `is` with a literal
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        tree = ast.parse(source)
+        compile(tree, "<fixpy>", "exec", dont_inherit=True)
+    warned = [
+        Diagnostic(warning.lineno or None, None, "syntax-warning", str(warning.message))
+        for warning in caught
+        if issubclass(warning.category, SyntaxWarning)
+    ]
+    return tree, warned
+
+
+def _syntax_diagnostic(err: SyntaxError) -> Diagnostic:
+    code = "indentation-error" if isinstance(err, IndentationError) else "syntax-error"
+    return Diagnostic(err.lineno, err.offset, code, str(err.msg))
+
+
+def _fix_syntax_error(source: str, err: SyntaxError) -> str | None:
+    if isinstance(err, TabError):
+        return source.expandtabs(_TAB_SIZE)
+    if err.msg == "unexpected indent":
+        # Snippets copied out of a larger block share a leading indent
+        dedented = textwrap.dedent(source)
+        return dedented if dedented != source else None
+
+    lines = source.splitlines()
+    if err.lineno is None or not 0 < err.lineno <= len(lines):
+        return None
+    index = err.lineno - 1
+    line = lines[index]
+    if err.msg == "expected ':'" and "#" not in line:
+        lines[index] = line.rstrip() + ":"
+    elif err.msg.startswith("Missing parentheses in call to 'print'"):
+        match = _PRINT_STATEMENT.match(line)
+        if match is None or match["args"].endswith(","):
+            return None
+        lines[index] = f"{match['indent']}print({match['args']})"
+    else:
+        return None
+    return "\n".join(lines) + ("\n" if source.endswith("\n") else "")
+
+
+def _check_tree(tree: ast.Module) -> list[Diagnostic]:
+    diagnostics: list[Diagnostic] = []
+    bound: set[str] = set()
+    loaded: list[ast.Name] = []
+    star_import = False
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            loaded.append(node)
+            continue
+        bound.update(_bound_names(node))
+        if isinstance(node, ast.ImportFrom):
+            star_import |= any(alias.name == "*" for alias in node.names)
+        elif isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef):
+            diagnostics.extend(_check_defaults(node))
+        elif isinstance(node, ast.ExceptHandler) and node.type is None:
+            diagnostics.append(
+                Diagnostic(
+                    node.lineno,
+                    node.col_offset + 1,
+                    "bare-except",
+                    "`except:` also catches KeyboardInterrupt and SystemExit",
+                ),
+            )
+
+    if star_import:
+        return diagnostics
+    # Scopes are ignored, so only names that are never bound anywhere are reported
+    reported: set[str] = set()
+    for name in loaded:
+        if name.id in bound or name.id in _MODULE_NAMES or name.id in reported:
+            continue
+        reported.add(name.id)
+        diagnostics.append(
+            Diagnostic(
+                name.lineno,
+                name.col_offset + 1,
+                "undefined-name",
+                f"`{name.id}` is not defined",
+            ),
+        )
+    return diagnostics
+
+
+def _bound_names(node: ast.AST) -> list[str]:
+    # Names that the node assigns, defines or imports
+    names: list[str | None] = []
+    if isinstance(node, ast.Name):
+        names.append(node.id)
+    elif isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef):
+        names.append(node.name)
+    elif isinstance(node, ast.arg):
+        names.append(node.arg)
+    elif isinstance(node, ast.Import | ast.ImportFrom):
+        names.extend(alias.asname or alias.name.split(".")[0] for alias in node.names)
+    elif isinstance(node, ast.ExceptHandler | ast.MatchAs | ast.MatchStar):
+        names.append(node.name)
+    elif isinstance(node, ast.MatchMapping):
+        names.append(node.rest)
+    elif isinstance(node, ast.Global | ast.Nonlocal):
+        names.extend(node.names)
+    return [name for name in names if name]
+
+
+def _check_defaults(node: ast.FunctionDef | ast.AsyncFunctionDef) -> list[Diagnostic]:
+    diagnostics = []
+    for default in (*node.args.defaults, *node.args.kw_defaults):
+        mutable = isinstance(default, _MUTABLE_LITERALS) or (
+            isinstance(default, ast.Call)
+            and isinstance(default.func, ast.Name)
+            and default.func.id in _MUTABLE_CALLS
+        )
+        if default is not None and mutable:
+            diagnostics.append(
+                Diagnostic(
+                    default.lineno,
+                    default.col_offset + 1,
+                    "mutable-default",
+                    f"the default value of `{node.name}` is shared between calls",
+                ),
+            )
+    return diagnostics
+
+
+@cache
+def _get_executor() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=get_settings().fixpy_analysis_workers)
+
+
+async def analyze_code_in_pool(code: str) -> CodeReport:
+    """Analyze the code in a worker process.
+
+    Parameters
+    ----------
+    code : str
+        The Python source code.
+
+    Returns
+    -------
+    CodeReport
+        The findings. Empty if local analysis is disabled, or if the
+        worker failed or timed out, so that the model sees the code as is.
+    """
+    if get_settings().fixpy_analysis_workers <= 0:
+        return CodeReport()
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(_get_executor(), analyze_code, code),
+            timeout=_ANALYSIS_TIMEOUT_SECONDS,
+        )
+    except BrokenProcessPool:
+        # A worker crashed, e.g. on code nested too deep for the C parser
+        logger.warning("A code analysis worker crashed, restarting the pool")
+        _restart_executor()
+    except TimeoutError:
+        # The worker would keep running, and later analyses would queue behind it
+        logger.warning("Code analysis timed out, restarting the pool")
+        _restart_executor()
+    return CodeReport()
+
+
+def _restart_executor() -> None:
+    executor = _get_executor()
+    _get_executor.cache_clear()
+    # ruff(SLF001): the pool has no public way to stop its workers before Python 3.14
+    processes = list((executor._processes or {}).values())  # noqa: SLF001
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
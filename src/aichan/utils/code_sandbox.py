@@ -0,0 +1,236 @@
+"""Verification of `/fixpy` answers in sandboxed worker processes.
+
+The workers run `_sandbox_worker.py` in isolated mode and are started
+once, so that verifying an answer only costs a fork of a warm worker.
+Verification needs user and mount namespaces to confine the files the
+code can read, and is only available on Linux. It is disabled when the
+workers cannot confine the code, rather than running it unconfined.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Any, NamedTuple, Self
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.config.store import get_settings
+
+logger = parse_args_and_setup_logging()
+
+_WORKER_PATH = Path(__file__).with_name("_sandbox_worker.py")
+# Seconds on top of the job timeout before a worker is considered stuck
+_WORKER_GRACE_SECONDS = 2.0
+_CODE_BLOCK = re.compile(r"```[ \t]*(?P<lang>[\w+-]*)[^\n]*\n(?P<code>.*?)```", re.DOTALL)
+
+
+class VerificationResult(NamedTuple):
+    """The outcome of running fixed code and its doctests.
+
+    Attributes
+    ----------
+    ok : bool
+        Whether the code ran and every doctest passed.
+    attempted : int
+        The number of doctest examples that were run.
+    failed : int
+        The number of doctest examples that failed.
+    failure : str
+        The first failing doctest example and the type of its exception,
+        or the type of the error. Never includes the output of the code,
+        so that it can be sent to the model.
+    """
+
+    ok: bool
+    attempted: int
+    failed: int
+    failure: str
+
+    def summary(self) -> str:
+        """Summarize the result for the user.
+
+        Returns
+        -------
+        str
+            One line describing the result.
+        """
+        if not self.ok:
+            if self.attempted:
+                return f"検証: doctest {self.attempted}件中{self.failed}件が失敗しました"
+            return "検証: コードの実行に失敗しました"
+        if self.attempted:
+            return f"検証: doctest {self.attempted}件に合格しました"
+        return "検証: コードのコンパイルと実行に成功しました (doctestなし)"
+
+
+def extract_code(text: str) -> str | None:
+    """Extract the Python code from a model answer.
+
+    Parameters
+    ----------
+    text : str
+        The answer, in Markdown.
+
+    Returns
+    -------
+    str | None
+        The longest Python code block, or the longest code block without
+        a language, or None if there is none.
+    """
+    python_blocks: list[str] = []
+    plain_blocks: list[str] = []
+    for match in _CODE_BLOCK.finditer(text):
+        lang = match["lang"].lower()
+        if lang in {"python", "py", "python3"}:
+            python_blocks.append(match["code"])
+        elif not lang:
+            plain_blocks.append(match["code"])
+    blocks = python_blocks or plain_blocks
+    return max(blocks, key=len) if blocks else None
+
+
+class SandboxPool:
+    """A singleton pool of pre-started sandbox workers.
+
+    Each worker handles one job at a time. A worker that dies or stops
+    responding is replaced by a new one.
+    """
+
+    _instance = None
+    idle: asyncio.Queue[asyncio.subprocess.Process]
+    size: int
+
+    def __new__(cls) -> Self:
+        """Create a new instance of SandboxPool or return the existing one.
+
+        Returns
+        -------
+        Self
+            The singleton instance of SandboxPool.
+        """
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.idle = asyncio.Queue()
+            cls._instance.size = 0
+        return cls._instance
+
+    @property
+    def is_available(self) -> bool:
+        """Whether the pool has been started."""
+        return self.size > 0
+
+    async def start(self) -> None:
+        """Start `fixpy_verify_workers` workers, unless unavailable or disabled."""
+        workers = get_settings().fixpy_verify_workers
+        if workers <= 0:
+            return
+        if sys.platform != "linux":
+            logger.warning("Verification of /fixpy answers is only supported on Linux")
+            return
+        for _ in range(workers):
+            self.idle.put_nowait(await self._spawn())
+        self.size = workers
+        # An empty job checks that the workers can confine the code
+        await self.verify("")
+        if self.is_available:
+            logger.info("Started %d sandbox workers", workers)
+
+    async def close(self) -> None:
+        """Stop the idle workers; busy workers stop when their job ends."""
+        self.size = 0
+        while not self.idle.empty():
+            process = self.idle.get_nowait()
+            if process.stdin is not None:
+                process.stdin.close()
+            await process.wait()
+
+    async def verify(self, code: str, tests: str = "") -> VerificationResult | None:
+        """Run code and its doctests in a sandbox.
+
+        Parameters
+        ----------
+        code : str
+            The Python code. Doctests in its docstrings are run.
+        tests : str
+            Source code whose doctests are run as well, e.g. the submitted code.
+
+        Returns
+        -------
+        VerificationResult | None
+            The outcome, or None if the code could not be verified
+            because the pool is not started or a worker failed. If a
+            worker cannot confine the code, the code is not run and the
+            pool is closed.
+        """
+        if not self.is_available:
+            return None
+        settings = get_settings()
+        timeout = settings.fixpy_verify_timeout
+        job = {
+            "code": code,
+            "tests": tests,
+            "timeout": timeout,
+            "memory_bytes": settings.fixpy_verify_memory_mb * 1024 * 1024,
+        }
+        process = await self.idle.get()
+        try:
+            result = await asyncio.wait_for(
+                _exchange(process, job),
+                timeout=timeout + _WORKER_GRACE_SECONDS,
+            )
+        except (OSError, RuntimeError, TimeoutError, ValueError):
+            logger.exception("A sandbox worker failed, replacing it")
+            process.kill()
+            await process.wait()
+            process = await self._spawn()
+            return None
+        finally:
+            self._release(process)
+        if "unconfined" in result:
+            logger.error(
+                "The sandbox cannot confine the code, verification is disabled: %s",
+                result["unconfined"],
+            )
+            await self.close()
+            return None
+        return VerificationResult(
+            ok=bool(result["ok"]),
+            attempted=int(result["attempted"]),
+            failed=int(result["failed"]),
+            failure=str(result["failure"]),
+        )
+
+    def _release(self, process: asyncio.subprocess.Process) -> None:
+        if self.size > 0:
+            self.idle.put_nowait(process)
+        elif process.stdin is not None:
+            process.stdin.close()
+
+    @staticmethod
+    async def _spawn() -> asyncio.subprocess.Process:
+        # Isolated mode ignores the environment and the user's site-packages
+        return await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-I",
+            str(_WORKER_PATH),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            env={},
+        )
+
+
+async def _exchange(process: asyncio.subprocess.Process, job: dict[str, Any]) -> dict[str, Any]:
+    if process.stdin is None or process.stdout is None:
+        msg = "The sandbox worker has no pipes"
+        raise RuntimeError(msg)
+    process.stdin.write(json.dumps(job).encode() + b"\n")
+    await process.stdin.drain()
+    line = await process.stdout.readline()
+    if not line:
+        msg = "The sandbox worker exited"
+        raise RuntimeError(msg)
+    result: dict[str, Any] = json.loads(line)
+    return result
@@ -0,0 +1,140 @@
+"""Splitting of Python files into units fixed one at a time by `/fixpy_batch`.
+
+A unit is a top-level function, or a method of a top-level class, so
+that each model request stays small and the fixed units can be put back
+into the file to build a patch.
+"""
+
+from __future__ import annotations
+
+import ast
+import difflib
+import textwrap
+from typing import NamedTuple
+
+
+class CodeUnit(NamedTuple):
+    """A function-level part of a file.
+
+    Attributes
+    ----------
+    path : str
+        The path of the file, relative to the archive or upload.
+    name : str
+        The qualified name, e.g. `Parser.parse`, or `<module>` for a
+        file that does not parse.
+    start : int
+        The first line, including decorators, starting at 1.
+    end : int
+        The last line.
+    indent : str
+        The indentation of the first line.
+    source : str
+        The code of the unit, dedented.
+    """
+
+    path: str
+    name: str
+    start: int
+    end: int
+    indent: str
+    source: str
+
+
+def split_units(path: str, source: str) -> list[CodeUnit]:
+    """Split a file into function-level units.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file.
+    source : str
+        The content of the file.
+
+    Returns
+    -------
+    list[CodeUnit]
+        The top-level functions and the methods of top-level classes, in
+        file order. A file that does not parse is a single unit, as its
+        syntax errors are what needs fixing.
+    """
+    lines = source.splitlines(keepends=True)
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError, RecursionError):
+        return [CodeUnit(path, "<module>", 1, len(lines), "", source)] if lines else []
+
+    nodes: list[tuple[str, ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef]] = []
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef):
+            nodes.append((node.name, node))
+        elif isinstance(node, ast.ClassDef):
+            methods: list[tuple[str, ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef]] = [
+                (f"{node.name}.{child.name}", child)
+                for child in node.body
+                if isinstance(child, ast.FunctionDef | ast.AsyncFunctionDef)
+            ]
+            # A class without methods, such as a dataclass, is a unit of its own
+            nodes.extend(methods or [(node.name, node)])
+
+    units = []
+    for name, node in nodes:
+        start = min([node.lineno, *(decorator.lineno for decorator in node.decorator_list)])
+        end = node.end_lineno or node.lineno
+        text = "".join(lines[start - 1 : end])
+        indent = lines[start - 1][: len(lines[start - 1]) - len(lines[start - 1].lstrip())]
+        units.append(CodeUnit(path, name, start, end, indent, textwrap.dedent(text)))
+    return units
+
+
+def apply_fixes(source: str, fixes: list[tuple[CodeUnit, str]]) -> str:
+    """Replace units of a file with their fixed code.
+
+    Parameters
+    ----------
+    source : str
+        The content of the file.
+    fixes : list[tuple[CodeUnit, str]]
+        The units of the file and their fixed, dedented code.
+
+    Returns
+    -------
+    str
+        The fixed content.
+    """
+    lines = source.splitlines(keepends=True)
+    # From the bottom, so that the line numbers of the other units stay valid
+    for unit, fixed in sorted(fixes, key=lambda fix: fix[0].start, reverse=True):
+        code = textwrap.indent(fixed.rstrip("\n") + "\n", unit.indent)
+        lines[unit.start - 1 : unit.end] = code.splitlines(keepends=True)
+    return "".join(lines)
+
+
+def make_patch(path: str, original: str, fixed: str) -> str:
+    """Build a unified diff of a file, as accepted by `git apply` or `patch -p1`.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file.
+    original : str
+        The original content.
+    fixed : str
+        The fixed content.
+
+    Returns
+    -------
+    str
+        The diff, or an empty string if the contents are equal.
+    """
+    diff = difflib.unified_diff(
+        _with_final_newline(original).splitlines(keepends=True),
+        _with_final_newline(fixed).splitlines(keepends=True),
+        fromfile=f"a/{path}",
+        tofile=f"b/{path}",
+    )
+    return "".join(diff)
+
+
+def _with_final_newline(text: str) -> str:
+    return text if not text or text.endswith("\n") else f"{text}\n"
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import datetime
+from typing import cast
+
+from src.aichan.config.timezone import TIMEZONE
+
+# (min, max) of the minute, hour, day of month, month and day of week fields
+_FIELD_RANGES: tuple[tuple[int, int], ...] = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+_MACROS: dict[str, str] = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+}
+
+# Long enough to reach the next Feb 29 from any date
+_MAX_DAYS_AHEAD = 366 * 8
+
+
+def _parse_field(field: str, low: int, high: int) -> tuple[int, ...]:
+    values: set[int] = set()
+    for part in field.split(","):
+        expr, _, step_str = part.partition("/")
+        try:
+            step = int(step_str) if step_str else 1
+            if expr == "*":
+                start, end = low, high
+            elif "-" in expr:
+                start_str, end_str = expr.split("-")
+                start, end = int(start_str), int(end_str)
+            else:
+                start = int(expr)
+                end = high if step_str else start
+        except ValueError as err:
+            msg = f"Invalid cron field: {field!r}"
+            raise ValueError(msg) from err
+        if step < 1 or not low <= start <= end <= high:
+            msg = f"Cron field out of range: {field!r}"
+            raise ValueError(msg)
+        values.update(range(start, end + 1, step))
+    return tuple(sorted(values))
+
+
+class CronSpec:
+    """A cron expression evaluated in the configured `TIMEZONE`.
+
+    Supports the standard five fields (minute, hour, day of month, month
+    and day of week) with `*`, lists, ranges and steps, plus the macros
+    `@hourly`, `@daily`, `@weekly`, `@monthly` and `@yearly`. As in
+    cron, when both day fields are restricted a day matches either one.
+
+    Parameters
+    ----------
+    expression : str
+        The cron expression, e.g. "30 4 * * 1-5".
+
+    Raises
+    ------
+    ValueError
+        If the expression is malformed or never fires.
+
+    Examples
+    --------
+    >>> spec = CronSpec("0 4 * * *")
+    >>> spec.next_after(datetime.datetime.now(TIMEZONE))  # next 04:00
+    """
+
+    __slots__ = ("_day_or", "days", "expression", "hours", "minutes", "months", "weekdays")
+
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        fields = _MACROS.get(expression.strip(), expression).split()
+        if len(fields) != len(_FIELD_RANGES):
+            msg = f"Cron expression must have 5 fields: {expression!r}"
+            raise ValueError(msg)
+
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(field, low, high)
+            for field, (low, high) in zip(fields, _FIELD_RANGES, strict=True)
+        )
+        # Both 0 and 7 mean Sunday
+        self.weekdays = tuple(sorted({day % 7 for day in weekdays}))
+        self._day_or = not fields[2].startswith("*") and not fields[4].startswith("*")
+
+        # Fail fast on expressions such as "0 0 31 2 *"
+        self.next_after(datetime.datetime.now(TIMEZONE))
+
+    def __repr__(self) -> str:
+        """Return the expression the spec was built from."""
+        return f"CronSpec({self.expression!r})"
+
+    def _matches_day(self, day: datetime.date) -> bool:
+        if day.month not in self.months:
+            return False
+        # datetime counts weekdays from Monday, cron from Sunday
+        day_match = day.day in self.days
+        weekday_match = (day.weekday() + 1) % 7 in self.weekdays
+        if self._day_or:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+    def next_after(self, dt: datetime.datetime) -> datetime.datetime:
+        """Return the first fire time strictly after `dt`.
+
+        Parameters
+        ----------
+        dt : datetime.datetime
+            A timezone-aware datetime.
+
+        Returns
+        -------
+        datetime.datetime
+            The next fire time, aware in `TIMEZONE`.
+
+        Raises
+        ------
+        ValueError
+            If the expression does not fire within the search horizon.
+        """
+        local = dt.astimezone(TIMEZONE).replace(tzinfo=None, second=0, microsecond=0)
+        local += datetime.timedelta(minutes=1)
+        day, hour, minute = local.date(), local.hour, local.minute
+
+        for _ in range(_MAX_DAYS_AHEAD):
+            if self._matches_day(day):
+                for h in self.hours:
+                    if h < hour:
+                        continue
+                    start = minute if h == hour else 0
+                    m = next((m for m in self.minutes if m >= start), None)
+                    if m is not None:
+                        naive = datetime.datetime.combine(day, datetime.time(h, m))
+                        return cast("datetime.datetime", TIMEZONE.localize(naive))
+            day += datetime.timedelta(days=1)
+            hour = minute = 0
+
+        msg = f"Cron expression never fires: {self.expression!r}"
+        raise ValueError(msg)
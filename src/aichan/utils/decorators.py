@@ -3,10 +3,11 @@ from typing import TypeVar, cast
 
 from discord import Interaction, app_commands
 
-from src.aichan.config.env import ADMIN_USER_IDS, AUTHORIZED_SERVER_IDS
+from src.aichan.config.store import get_settings
+from src.aichan.database.channel_cache import AllowedChannelCache
 from src.aichan.database.dao.access_dao import AccessDAO
-from src.aichan.database.dao.channel_dao import ChannelDAO
 from src.aichan.database.dao.limit_dao import UsageLimitDAO
+from src.aichan.utils.rate_limiter import RateLimiter
 
 _T = TypeVar("_T")
 
@@ -22,7 +23,7 @@ def is_admin_user() -> Callable[[_T], _T]:
     """
 
     def predicate(interaction: Interaction) -> bool:
-        return interaction.user.id in ADMIN_USER_IDS
+        return interaction.user.id in get_settings().admin_user_ids
 
     return app_commands.check(predicate)
 
@@ -38,8 +39,7 @@ def is_advanced_user() -> Callable[[_T], _T]:
     """
 
     async def predicate(interaction: Interaction) -> bool:
-        advanced_user_ids = await AccessDAO().fetch_user_ids_by_access_type(access_type="advanced")
-        return interaction.user.id in advanced_user_ids
+        return await AccessDAO().has_access_type(interaction.user.id, access_type="advanced")
 
     return app_commands.check(predicate)
 
@@ -55,7 +55,7 @@ def is_authorized_server() -> Callable[[_T], _T]:
     """
 
     def predicate(interaction: Interaction) -> bool:
-        return interaction.guild_id in AUTHORIZED_SERVER_IDS
+        return interaction.guild_id in get_settings().authorized_server_ids
 
     return app_commands.check(predicate)
 
@@ -71,8 +71,7 @@ def is_not_blocked_user() -> Callable[[_T], _T]:
     """
 
     async def predicate(interaction: Interaction) -> bool:
-        blocked_user_ids = await AccessDAO().fetch_user_ids_by_access_type(access_type="blocked")
-        return interaction.user.id not in blocked_user_ids
+        return not await AccessDAO().has_access_type(interaction.user.id, access_type="blocked")
 
     return app_commands.check(predicate)
 
@@ -89,12 +88,11 @@ def has_daily_usage_left() -> Callable[[_T], _T]:
 
     async def predicate(interaction: Interaction) -> bool:
         # Admin users bypass usage limits
-        if interaction.user.id in ADMIN_USER_IDS:
+        if interaction.user.id in get_settings().admin_user_ids:
             return True
 
         # Advanced users bypass usage limits
-        advanced_user_ids = await AccessDAO().fetch_user_ids_by_access_type(access_type="advanced")
-        if interaction.user.id in advanced_user_ids:
+        if await AccessDAO().has_access_type(interaction.user.id, access_type="advanced"):
             return True
 
         # Check usage limits for regular users
@@ -107,6 +105,62 @@ def has_daily_usage_left() -> Callable[[_T], _T]:
     return app_commands.check(predicate)
 
 
+def is_within_rate_limit() -> Callable[[_T], _T]:
+    """Check if the user and the guild have not exceeded their request rate.
+
+    This check consumes a token that a later failing check would not
+    give back, so it should be placed as the top-most check decorator
+    in order to run after every other check.
+
+    Returns
+    -------
+    Callable[[_T], _T]
+        A decorator that checks the per-user and per-guild token buckets.
+        Admin users bypass the rate limit.
+
+    Raises
+    ------
+    app_commands.CommandOnCooldown
+        If no token is available. `retry_after` holds the number of
+        seconds to wait before retrying.
+    """
+
+    def predicate(interaction: Interaction) -> bool:
+        retry_after = check_user_rate_limit(interaction.user.id, interaction.guild_id)
+        if retry_after > 0:
+            raise app_commands.CommandOnCooldown(
+                app_commands.Cooldown(rate=1, per=retry_after),
+                retry_after,
+            )
+        return True
+
+    return app_commands.check(predicate)
+
+
+# This function is used in the on_message event handler for Discord messages
+def check_user_rate_limit(user_id: int, guild_id: int | None) -> float:
+    """Consume a rate limit token for a user and their guild.
+
+    Parameters
+    ----------
+    user_id : int
+        The Discord user ID to check
+    guild_id : int | None
+        The Discord guild ID the request comes from
+
+    Returns
+    -------
+    float
+        0.0 if the request is admitted, otherwise the number of seconds
+        to wait before retrying
+    """
+    # Admin users bypass rate limits
+    if user_id in get_settings().admin_user_ids:
+        return 0.0
+
+    return RateLimiter().acquire(user_id, guild_id)
+
+
 # This function is used in the on_message event handler for Discord messages
 async def check_user_daily_limit(user_id: int) -> bool:
     """Check if a user has reached their daily API usage limit.
@@ -121,21 +175,37 @@ async def check_user_daily_limit(user_id: int) -> bool:
     bool
         True if the user has not reached their limit, False if they have
     """
+    remaining = await get_remaining_daily_usage(user_id)
+    return remaining is None or remaining > 0
+
+
+async def get_remaining_daily_usage(user_id: int) -> int | None:
+    """Get the number of API calls a user has left today.
+
+    Parameters
+    ----------
+    user_id : int
+        The Discord user ID to check
+
+    Returns
+    -------
+    int | None
+        The number of calls left, or None if the user has no limit
+    """
     # Admin users bypass usage limits
-    if user_id in ADMIN_USER_IDS:
-        return True
+    if user_id in get_settings().admin_user_ids:
+        return None
 
     # Advanced users bypass usage limits
-    advanced_user_ids = await AccessDAO().fetch_user_ids_by_access_type(access_type="advanced")
-    if user_id in advanced_user_ids:
-        return True
+    if await AccessDAO().has_access_type(user_id, access_type="advanced"):
+        return None
 
     # Check usage limits for regular users
     dao = UsageLimitDAO()
     current_usage = await dao.get_user_daily_usage(user_id)
     user_limit = await dao.get_user_daily_limit(user_id)
 
-    return cast("bool", current_usage < user_limit)
+    return max(0, cast("int", user_limit - current_usage))
 
 
 def is_allowed_channel() -> Callable[[_T], _T]:
@@ -151,7 +221,7 @@ def is_allowed_channel() -> Callable[[_T], _T]:
 
     async def predicate(interaction: Interaction) -> bool:
         # Admin users bypass channel restrictions
-        if interaction.user.id in ADMIN_USER_IDS:
+        if interaction.user.id in get_settings().admin_user_ids:
             return True
 
         # Get the channel ID from the interaction
@@ -160,9 +230,8 @@ def is_allowed_channel() -> Callable[[_T], _T]:
             return False
 
         # Check if there are any allowed channels for this guild
-        channel_dao = ChannelDAO()
         if interaction.guild_id is not None:
-            allowed_channels = await channel_dao.get_allowed_channels(
+            allowed_channels = await AllowedChannelCache().get_allowed_channels(
                 guild_id=interaction.guild_id,
             )
 
@@ -0,0 +1,134 @@
+import time
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.config.store import get_settings
+from src.aichan.database.dao.batch_dao import BatchDAO
+from src.aichan.database.dao.chat_cache_dao import ChatCacheDAO
+from src.aichan.database.dao.limit_dao import UsageLimitDAO
+from src.aichan.database.dao.model_routing_dao import ModelRoutingDAO
+from src.aichan.database.dao.thread_session_dao import ThreadSessionDAO
+from src.aichan.utils.cron import CronSpec
+from src.aichan.utils.rate_limiter import RateLimiter
+from src.aichan.utils.scheduler import JobScheduler
+
+logger = parse_args_and_setup_logging()
+
+# Buckets refill within minutes, so in-memory state is pruned often
+_PRUNE_CRON = "*/10 * * * *"
+# Batches end within 24 hours, so older groups have no process delivering them
+_BATCH_GROUP_MAX_AGE_SECONDS = 48 * 60 * 60
+
+
+async def sweep_expired_usage() -> None:
+    """Delete expired API usage records in small batches."""
+    deleted = await UsageLimitDAO().sweep_expired_usage()
+    logger.info("Swept %d expired API usage records", deleted)
+
+
+async def sweep_thread_sessions() -> None:
+    """Delete thread sessions that have not been used for a long time."""
+    retention_days = get_settings().thread_session_retention_days
+    updated_before = time.time() - retention_days * 24 * 60 * 60
+    deleted = await ThreadSessionDAO().delete_older_than(updated_before)
+    logger.info("Swept %d expired thread sessions", deleted)
+
+
+async def sweep_model_routing() -> None:
+    """Delete routing decisions older than the retention period."""
+    retention_days = get_settings().model_routing_retention_days
+    created_before = time.time() - retention_days * 24 * 60 * 60
+    deleted = await ModelRoutingDAO().delete_older_than(created_before)
+    logger.info("Swept %d expired routing decisions", deleted)
+
+
+async def sweep_chat_cache() -> None:
+    """Delete cached /chat answers older than the retention period.
+
+    Answers are deleted when their entry is evicted from the index, but
+    not when the index file is recreated, and the table is shared by the
+    indexes of all processes, so those are only dropped by age.
+    """
+    retention_days = get_settings().chat_cache_retention_days
+    created_before = time.time() - retention_days * 24 * 60 * 60
+    deleted = await ChatCacheDAO().delete_older_than(created_before)
+    logger.info("Swept %d expired /chat answers", deleted)
+
+
+async def sweep_batch_groups() -> None:
+    """Delete batch groups that were never delivered.
+
+    Groups are delivered by the process with the shards that queued them,
+    so a group is left behind when the shards of the processes change.
+    """
+    created_before = time.time() - _BATCH_GROUP_MAX_AGE_SECONDS
+    deleted = await BatchDAO().delete_older_than(created_before)
+    if deleted:
+        logger.warning("Dropped %d batch groups that were not delivered in time", deleted)
+
+
+async def prune_rate_limits() -> None:
+    """Drop the rate limit buckets of this process that have refilled."""
+    dropped = RateLimiter().prune()
+    logger.debug("Pruned %d full rate limit buckets", dropped)
+
+
+def register_jobs(scheduler: JobScheduler) -> None:
+    """Register the application's periodic jobs.
+
+    Parameters
+    ----------
+    scheduler : JobScheduler
+        The scheduler to register the jobs with.
+    """
+    # Usage counts roll over lazily because reads are keyed by date,
+    # so the sweep only reclaims space and can run off-peak
+    sweep_cron = get_settings().usage_sweep_cron
+    scheduler.add_job(
+        "usage_sweep",
+        CronSpec(sweep_cron),
+        sweep_expired_usage,
+        jitter=300,
+    )
+    scheduler.add_job(
+        "thread_session_sweep",
+        CronSpec(sweep_cron),
+        sweep_thread_sessions,
+        jitter=300,
+    )
+    scheduler.add_job(
+        "model_routing_sweep",
+        CronSpec(sweep_cron),
+        sweep_model_routing,
+        jitter=300,
+    )
+    scheduler.add_job(
+        "chat_cache_sweep",
+        CronSpec(sweep_cron),
+        sweep_chat_cache,
+        jitter=300,
+    )
+    scheduler.add_job(
+        "batch_group_sweep",
+        CronSpec(sweep_cron),
+        sweep_batch_groups,
+        jitter=300,
+    )
+
+
+def register_process_jobs(scheduler: JobScheduler) -> None:
+    """Register the jobs that every process runs on its own in-memory state.
+
+    Parameters
+    ----------
+    scheduler : JobScheduler
+        The scheduler to register the jobs with.
+    """
+    # Job names are per process, as each one records its own last run
+    shard_ids = get_settings().discord_shard_ids
+    suffix = f":{','.join(str(shard_id) for shard_id in shard_ids)}" if shard_ids else ""
+    scheduler.add_job(
+        f"rate_limit_prune{suffix}",
+        CronSpec(_PRUNE_CRON),
+        prune_rate_limits,
+        catch_up=False,
+    )
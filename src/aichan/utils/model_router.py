@@ -0,0 +1,286 @@
+"""Routing of `/talk` and `/chat` turns to cheaper models when they are simple.
+
+A turn is classified locally, without a model request, by a complexity
+score between 0 and 1. The score is computed from the length of the
+latest message, whether it contains code, how deep its questions are and
+how long the conversation is. The models of `claude_models` and
+`gpt_models` are tiers listed from the cheapest to the most capable, and
+the score picks one of the tiers up to the requested model, never above.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING, Generic, NamedTuple, Self, TypeVar
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.adapters.response import ResponseResult, ResponseStatus
+from src.aichan.config.store import get_settings
+from src.aichan.database.dao.model_routing_dao import ModelRoutingDAO
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from discord import app_commands
+
+    from src.aichan.adapters.chat import Conversation
+    from src.aichan.ai.models._base import ModelParamsBase
+
+logger = parse_args_and_setup_logging()
+
+_P = TypeVar("_P", bound="ModelParamsBase")
+
+# A message of this many characters scores 1 for its length
+_LONG_MESSAGE_CHARS = 1200
+# A conversation of this many messages scores 1 for its history
+_LONG_HISTORY_MESSAGES = 30
+# Questions, reasoning words and list items for a message to score 1 for its depth
+_DEEP_QUESTION_SIGNALS = 3.0
+# Weights of the length, depth and history in the score
+_WEIGHTS = (0.4, 0.35, 0.25)
+# Code needs a capable model however short the message is
+_CODE_SCORE = 0.75
+# Weight of the latest latency in the running average of each model
+_LATENCY_SMOOTHING = 0.2
+_TOKENS_PER_PRICE_UNIT = 1_000_000
+
+_CODE = re.compile(
+    r"```|^(?: {4}|\t)\S|\b(?:def|class|import|return|function|const|SELECT)\b.*[(:{=]",
+    re.MULTILINE,
+)
+# ruff(RUF001): the full-width question mark of Japanese is intended
+_QUESTION = re.compile(r"[?？]")  # noqa: RUF001
+_REASONING = re.compile(
+    r"\b(?:why|how|explain|compare|difference|prove|design|analy[sz]e|step by step)\b"
+    r"|なぜ|どうして|どうやって|説明|比較|違い|理由|証明|設計|分析",
+    re.IGNORECASE,
+)
+_LIST_ITEM = re.compile(r"^\s*(?:[-*・]|\d+[.)])\s", re.MULTILINE)
+
+
+class TurnFeatures(NamedTuple):
+    """The features a turn is classified by.
+
+    Attributes
+    ----------
+    length : float
+        The length of the latest message, between 0 and 1.
+    has_code : bool
+        Whether the latest message contains code.
+    depth : float
+        How deep the questions of the latest message are, between 0 and 1.
+    history : float
+        The length of the conversation, between 0 and 1.
+    """
+
+    length: float
+    has_code: bool
+    depth: float
+    history: float
+
+    @property
+    def score(self) -> float:
+        """The complexity of the turn, between 0 and 1."""
+        length_weight, depth_weight, history_weight = _WEIGHTS
+        score = min(
+            1.0,
+            length_weight * self.length
+            + depth_weight * self.depth
+            + history_weight * self.history,
+        )
+        return max(score, _CODE_SCORE) if self.has_code else score
+
+
+def classify_turn(conversation: Conversation) -> TurnFeatures:
+    """Extract the features of the next turn of a conversation.
+
+    Parameters
+    ----------
+    conversation : Conversation
+        The conversation, ending with the message to answer.
+
+    Returns
+    -------
+    TurnFeatures
+        The features of the latest message and of the history.
+    """
+    message = conversation.messages[-1]["content"] if conversation.messages else ""
+    signals = (
+        len(_QUESTION.findall(message))
+        + len(_REASONING.findall(message))
+        + len(_LIST_ITEM.findall(message)) / 2
+    )
+    return TurnFeatures(
+        length=min(1.0, len(message) / _LONG_MESSAGE_CHARS),
+        has_code=_CODE.search(message) is not None,
+        depth=min(1.0, signals / _DEEP_QUESTION_SIGNALS),
+        history=min(1.0, (len(conversation.messages) - 1) / _LONG_HISTORY_MESSAGES),
+    )
+
+
+class Route(NamedTuple, Generic[_P]):
+    """A routing decision.
+
+    Attributes
+    ----------
+    requested : str
+        The model the turn was meant for.
+    model : str
+        The model chosen to answer it.
+    score : float
+        The complexity score of the turn.
+    params : _P
+        The model parameters to use, with the chosen model.
+    """
+
+    requested: str
+    model: str
+    score: float
+    params: _P
+
+
+class ModelRouter:
+    """A singleton that routes turns and records what routing saved.
+
+    The latency saved by a decision is estimated from a running average
+    of the seconds per output token of the requested model, so it is
+    only known once that model has answered at least once.
+    """
+
+    _instance = None
+    latencies: dict[str, float]
+    dao: ModelRoutingDAO
+
+    def __new__(cls) -> Self:
+        """Create a new instance of ModelRouter or return the existing one.
+
+        Returns
+        -------
+        Self
+            The singleton instance of ModelRouter.
+        """
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.latencies = {}
+            cls._instance.dao = ModelRoutingDAO()
+        return cls._instance
+
+    def route(
+        self,
+        conversation: Conversation,
+        params: _P,
+        tiers: Sequence[app_commands.Choice[int]],
+    ) -> Route[_P] | None:
+        """Choose the model of the next turn of a conversation.
+
+        Parameters
+        ----------
+        conversation : Conversation
+            The conversation, ending with the message to answer.
+        params : _P
+            The model parameters of the conversation.
+        tiers : Sequence[app_commands.Choice[int]]
+            The models, from the cheapest to the most capable.
+
+        Returns
+        -------
+        Route[_P] | None
+            The decision, or None if routing is disabled or the requested
+            model is not one of the tiers.
+        """
+        if not get_settings().model_routing:
+            return None
+        requested = str(params.model)
+        names = [choice.name for choice in tiers]
+        if requested not in names:
+            return None
+        highest = names.index(requested)
+        score = classify_turn(conversation).score
+        model = names[min(highest, int(score * (highest + 1)))]
+        if model != requested:
+            params = type(params)(
+                model=model,
+                max_tokens=params.max_tokens,
+                temperature=params.temperature,
+                top_p=params.top_p,
+            )
+        return Route(requested, model, score, params)
+
+    async def record(
+        self,
+        command: str,
+        route: Route[_P],
+        response: ResponseResult,
+        latency: float,
+    ) -> None:
+        """Record a routing decision with the latency and cost it saved.
+
+        Failed responses are not recorded. Errors are logged, so that
+        recording never fails the turn.
+
+        Parameters
+        ----------
+        command : str
+            The command the turn belongs to, e.g. 'talk'.
+        route : Route
+            The decision.
+        response : ResponseResult
+            The response of the chosen model.
+        latency : float
+            The seconds the chosen model took to respond.
+        """
+        if response.status is not ResponseStatus.SUCCESS:
+            return
+        saved_latency = saved_cost = None
+        output_tokens = response.output_tokens
+        if route.model == route.requested:
+            saved_latency = saved_cost = 0.0
+        else:
+            rate = self.latencies.get(route.requested)
+            if rate is not None and output_tokens:
+                saved_latency = rate * output_tokens - latency
+            saved_cost = _saved_cost(route, response)
+        if output_tokens:
+            rate = self.latencies.get(route.model)
+            observed = latency / output_tokens
+            self.latencies[route.model] = (
+                observed if rate is None else rate + _LATENCY_SMOOTHING * (observed - rate)
+            )
+
+        logger.info(
+            "Routed a %s turn from %s to %s (score %.2f, %.2fs, saved %s s, %s USD)",
+            command,
+            route.requested,
+            route.model,
+            route.score,
+            latency,
+            "?" if saved_latency is None else f"{saved_latency:.2f}",
+            "?" if saved_cost is None else f"{saved_cost:.6f}",
+        )
+        try:
+            await self.dao.record(
+                command,
+                requested_model=route.requested,
+                routed_model=route.model,
+                score=route.score,
+                latency=latency,
+                saved_latency=saved_latency,
+                saved_cost=saved_cost,
+            )
+        except Exception:
+            logger.exception("Failed to record a routing decision")
+
+
+def _saved_cost(route: Route[_P], response: ResponseResult) -> float | None:
+    # The requested model is assumed to have used as many tokens
+    if response.input_tokens is None or response.output_tokens is None:
+        return None
+    prices = {price.model: price for price in get_settings().model_prices}
+    requested = prices.get(route.requested)
+    routed = prices.get(route.model)
+    if requested is None or routed is None:
+        return None
+    saved = (requested.input - routed.input) * response.input_tokens + (
+        requested.output - routed.output
+    ) * response.output_tokens
+    return saved / _TOKENS_PER_PRICE_UNIT
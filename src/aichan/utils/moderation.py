@@ -0,0 +1,35 @@
+"""A local filter that stops abusive or spammy prompts before the model.
+
+The rules are compiled by `config.moderation` with each configuration
+snapshot.
+"""
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.adapters.response import ResponseResult, ResponseStatus
+from src.aichan.config.store import get_config
+
+logger = parse_args_and_setup_logging()
+
+
+def screen_prompt(text: str) -> ResponseResult | None:
+    """Run the filter of the current configuration snapshot on a prompt.
+
+    The filter is compiled when the configuration is loaded, so a reload
+    also picks up changes to the blocklist file.
+
+    Parameters
+    ----------
+    text : str
+        The prompt.
+
+    Returns
+    -------
+    ResponseResult | None
+        A result with status MODERATION_FLAGGED if the prompt must not be
+        sent to the model, otherwise None.
+    """
+    reason = get_config().moderation.check(text)
+    if reason is None:
+        return None
+    logger.info("A prompt was flagged by the moderation filter: %s", reason)
+    return ResponseResult(status=ResponseStatus.MODERATION_FLAGGED, result=reason)
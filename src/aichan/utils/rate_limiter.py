@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import time
+from typing import Self
+
+from src.aichan.config.store import get_settings
+from src.aichan.database.dao.rate_limit_dao import RateLimitDAO
+
+# Snapshots older than this are deleted, as their buckets have refilled
+_SNAPSHOT_TTL_SECONDS = 24 * 60 * 60
+
+
+class TokenBucket:
+    """A token bucket refilled continuously at a fixed rate.
+
+    Parameters
+    ----------
+    capacity : float
+        The maximum number of tokens (burst size).
+    rate : float
+        The number of tokens added per second.
+    tokens : float | None
+        The initial number of tokens. Defaults to a full bucket.
+    updated_at : float | None
+        The monotonic time of the last refill. Defaults to now.
+    """
+
+    __slots__ = ("capacity", "rate", "tokens", "updated_at")
+
+    def __init__(
+        self,
+        capacity: float,
+        rate: float,
+        tokens: float | None = None,
+        updated_at: float | None = None,
+    ) -> None:
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity if tokens is None else min(tokens, capacity)
+        self.updated_at = time.monotonic() if updated_at is None else updated_at
+
+    def refill(self, now: float) -> None:
+        """Add the tokens accumulated since the last refill.
+
+        Parameters
+        ----------
+        now : float
+            The current monotonic time.
+        """
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def retry_after(self) -> float:
+        """Return the seconds until one token is available.
+
+        Returns
+        -------
+        float
+            0.0 if a token is available now.
+        """
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    @property
+    def is_full(self) -> bool:
+        """Whether the bucket holds its full capacity."""
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """A singleton in-memory token-bucket rate limiter.
+
+    Every request consumes one token from the user's bucket and one from
+    the guild's bucket. A request is only admitted when both buckets have
+    a token, so a rejected request never consumes anything.
+
+    Buckets that have refilled completely carry no information, so they
+    are dropped when pruning and never written to the snapshot.
+    """
+
+    _instance = None
+    buckets: dict[str, TokenBucket]
+
+    def __new__(cls) -> Self:
+        """Create a new instance of RateLimiter or return the existing one.
+
+        Returns
+        -------
+        Self
+            The singleton instance of RateLimiter.
+        """
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.buckets = {}
+        return cls._instance
+
+    @staticmethod
+    def _limits(key: str) -> tuple[float, float]:
+        # Returns (capacity, tokens per second) for the scope of the key
+        settings = get_settings()
+        if key.startswith("g:"):
+            return (
+                float(settings.rate_limit_guild_burst),
+                settings.rate_limit_guild_per_minute / 60,
+            )
+        return float(settings.rate_limit_user_burst), settings.rate_limit_user_per_minute / 60
+
+    def _get_bucket(self, key: str, now: float) -> TokenBucket | None:
+        capacity, rate = self._limits(key)
+        if rate <= 0 or capacity <= 0:
+            return None
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(capacity=capacity, rate=rate, updated_at=now)
+            self.buckets[key] = bucket
+        else:
+            bucket.refill(now)
+            # Apply limits changed by a configuration reload
+            bucket.capacity = capacity
+            bucket.rate = rate
+            bucket.tokens = min(bucket.tokens, capacity)
+        return bucket
+
+    def acquire(self, user_id: int, guild_id: int | None) -> float:
+        """Try to consume a token for a request.
+
+        Parameters
+        ----------
+        user_id : int
+            The Discord user ID issuing the request.
+        guild_id : int | None
+            The Discord guild ID the request comes from, if any.
+
+        Returns
+        -------
+        float
+            0.0 if the request is admitted, otherwise the number of
+            seconds to wait before retrying.
+        """
+        now = time.monotonic()
+        keys = [f"u:{user_id}"] if guild_id is None else [f"u:{user_id}", f"g:{guild_id}"]
+        buckets = [bucket for key in keys if (bucket := self._get_bucket(key, now)) is not None]
+
+        retry_after = max((bucket.retry_after() for bucket in buckets), default=0.0)
+        if retry_after > 0:
+            return retry_after
+
+        for bucket in buckets:
+            bucket.tokens -= 1.0
+        return 0.0
+
+    def release(self, user_id: int, guild_id: int | None) -> None:
+        """Give back the tokens of an admitted request that cost nothing.
+
+        Parameters
+        ----------
+        user_id : int
+            The Discord user ID that issued the request.
+        guild_id : int | None
+            The Discord guild ID the request came from, if any.
+        """
+        now = time.monotonic()
+        keys = [f"u:{user_id}"] if guild_id is None else [f"u:{user_id}", f"g:{guild_id}"]
+        for key in keys:
+            # Buckets that are missing are full, e.g. for admins who bypass the limit
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.refill(now)
+                bucket.tokens = min(bucket.capacity, bucket.tokens + 1.0)
+
+    def prune(self) -> int:
+        """Drop buckets that have refilled completely.
+
+        Returns
+        -------
+        int
+            The number of buckets dropped.
+        """
+        now = time.monotonic()
+        dropped = 0
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.is_full:
+                del self.buckets[key]
+                dropped += 1
+        return dropped
+
+    async def load_snapshot(self) -> None:
+        """Restore bucket states saved by `save_snapshot`.
+
+        Tokens are refilled for the wall-clock time elapsed while the bot
+        was offline.
+        """
+        rows = await RateLimitDAO().load_snapshot()
+        now_wall = time.time()
+        now = time.monotonic()
+        for key, tokens, saved_at in rows:
+            capacity, rate = self._limits(key)
+            if rate <= 0 or capacity <= 0:
+                continue
+            bucket = TokenBucket(
+                capacity=capacity,
+                rate=rate,
+                tokens=tokens,
+                updated_at=now - max(0.0, now_wall - saved_at),
+            )
+            bucket.refill(now)
+            if not bucket.is_full:
+                self.buckets[key] = bucket
+
+    async def save_snapshot(self) -> None:
+        """Persist the states of all partially drained buckets."""
+        self.prune()
+        now_wall = time.time()
+        rows = [(key, bucket.tokens, now_wall) for key, bucket in self.buckets.items()]
+        # Every bucket is full again after this long
+        await RateLimitDAO().save_snapshot(rows, stale_before=now_wall - _SNAPSHOT_TTL_SECONDS)
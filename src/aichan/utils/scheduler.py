@@ -1,89 +1,323 @@
+from __future__ import annotations
+
 import asyncio
 import datetime
-from collections.abc import Callable, Coroutine
-from typing import TypeVar
+import random
+import time
+from typing import TYPE_CHECKING, Self
 
 from src.aichan._cli import parse_args_and_setup_logging
 from src.aichan.config.timezone import TIMEZONE
-from src.aichan.database.dao.limit_dao import UsageLimitDAO
+from src.aichan.database.dao.job_dao import JobRunDAO
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+    from src.aichan.utils.cron import CronSpec
 
-T = TypeVar("T")
 logger = parse_args_and_setup_logging()
 
+# Upper bound of a single sleep, so that wall clock jumps are noticed quickly
+_MAX_SLEEP_SECONDS = 60.0
 
-class TaskScheduler:
-    """Scheduler for running tasks at specific times.
 
-    This class provides functionality to schedule tasks to run at
-    specific times, such as daily at midnight.
+class JobMetrics:
+    """Run statistics of a scheduled job.
+
+    Attributes
+    ----------
+    runs : int
+        Number of completed runs, including failed ones.
+    failures : int
+        Number of runs that raised an exception.
+    skipped : int
+        Number of fire times skipped because the job was still running.
+    last_duration : float
+        Duration of the latest run in seconds.
+    max_duration : float
+        Longest run duration in seconds.
+    total_duration : float
+        Sum of all run durations in seconds.
     """
 
-    @staticmethod
-    async def _wait_until(dt: datetime.datetime) -> None:
-        """Wait until a specific datetime.
+    __slots__ = ("failures", "last_duration", "max_duration", "runs", "skipped", "total_duration")
+
+    def __init__(self) -> None:
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+
+    @property
+    def average_duration(self) -> float:
+        """Mean run duration in seconds."""
+        return self.total_duration / self.runs if self.runs else 0.0
+
+    def record(self, duration: float, *, failed: bool) -> None:
+        """Record a finished run.
 
         Parameters
         ----------
-        dt : datetime.datetime
-            Target datetime to wait for.
+        duration : float
+            Duration of the run in seconds.
+        failed : bool
+            Whether the run raised an exception.
         """
-        now = datetime.datetime.now(TIMEZONE)
-        if dt < now:
-            # If the target time is in the past, add one day
-            dt = dt + datetime.timedelta(days=1)
+        self.runs += 1
+        self.failures += failed
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        self.total_duration += duration
 
-        # Calculate seconds until the target time
-        wait_seconds = (dt - now).total_seconds()
-        logger.info("Waiting for %s seconds until %s", wait_seconds, dt)
-        await asyncio.sleep(wait_seconds)
 
-    @staticmethod
-    async def _schedule_daily(
-        time: datetime.time,
-        task: Callable[[], Coroutine[None, None, T]],
+class ScheduledJob:
+    """A coroutine function registered with the scheduler.
+
+    Parameters
+    ----------
+    name : str
+        Unique name of the job, used as the persistence key.
+    cron : CronSpec
+        When the job fires.
+    task : Callable[[], Awaitable[object]]
+        Coroutine function to execute.
+    jitter : float
+        Maximum random delay in seconds added to each fire time.
+    catch_up : bool
+        Whether to run once on startup if a fire time was missed while
+        the bot was offline.
+    """
+
+    __slots__ = ("catch_up", "cron", "jitter", "metrics", "name", "running", "task")
+
+    def __init__(
+        self,
+        name: str,
+        cron: CronSpec,
+        task: Callable[[], Awaitable[object]],
+        jitter: float,
+        *,
+        catch_up: bool,
+    ) -> None:
+        self.name = name
+        self.cron = cron
+        self.task = task
+        self.jitter = jitter
+        self.catch_up = catch_up
+        self.metrics = JobMetrics()
+        self.running = False
+
+
+class JobScheduler:
+    """A singleton scheduler for periodic asynchronous jobs.
+
+    Each job runs in its own loop and never overlaps with itself. Fire
+    times are computed from cron expressions in `TIMEZONE` against the
+    wall clock, the last run of each job is persisted so that runs
+    missed during downtime can be caught up, and `shutdown` lets running
+    jobs finish before returning.
+
+    Examples
+    --------
+    >>> scheduler = JobScheduler()
+    >>> scheduler.add_job("sweep", CronSpec("0 4 * * *"), sweep, jitter=300)
+    >>> await scheduler.start()
+    >>> ...
+    >>> await scheduler.shutdown()
+    """
+
+    _instance = None
+    jobs: dict[str, ScheduledJob]
+    _loops: dict[str, asyncio.Task]
+    _runs: set[asyncio.Task]
+    _last_runs: dict[str, float] | None
+
+    def __new__(cls) -> Self:
+        """Create a new instance of JobScheduler or return the existing one.
+
+        Returns
+        -------
+        Self
+            The singleton instance of JobScheduler.
+        """
+        if cls._instance is None:
+            instance = super().__new__(cls)
+            instance.jobs = {}
+            instance._loops = {}
+            instance._runs = set()
+            instance._last_runs = None
+            cls._instance = instance
+        return cls._instance
+
+    def add_job(
+        self,
+        name: str,
+        cron: CronSpec,
+        task: Callable[[], Awaitable[object]],
+        *,
+        jitter: float = 0.0,
+        catch_up: bool = True,
     ) -> None:
-        """Schedule a task to run daily at a specific time.
+        """Register a job. Jobs added after `start` are started immediately.
 
         Parameters
         ----------
-        time : datetime.time
-            Time of day to run the task.
-        task : Callable[[], Coroutine[None, None, T]]
+        name : str
+            Unique name of the job.
+        cron : CronSpec
+            When the job fires.
+        task : Callable[[], Awaitable[object]]
             Coroutine function to execute.
+        jitter : float
+            Maximum random delay in seconds added to each fire time.
+        catch_up : bool
+            Whether to run once on startup if a fire time was missed.
+
+        Raises
+        ------
+        ValueError
+            If a job with the same name is already registered.
         """
-        while True:
-            # Next run datetime
-            now = datetime.datetime.now(TIMEZONE)
-            next_run = datetime.datetime.combine(now.date(), time, TIMEZONE)
+        if name in self.jobs:
+            msg = f"Job already registered: {name}"
+            raise ValueError(msg)
+        self.jobs[name] = ScheduledJob(name, cron, task, jitter, catch_up=catch_up)
+        if self._last_runs is not None:
+            self._start_loop(self.jobs[name])
+
+    async def start(self) -> None:
+        """Load the persisted run history and start all job loops."""
+        self._last_runs = await JobRunDAO().get_last_runs()
+        for job in self.jobs.values():
+            self._start_loop(job)
+        logger.info("Started scheduler with %d jobs", len(self.jobs))
 
-            # If it's already past the time today, schedule for tomorrow
-            if now.time() > time:
-                next_run = next_run + datetime.timedelta(days=1)
+    def _start_loop(self, job: ScheduledJob) -> None:
+        self._loops[job.name] = asyncio.create_task(self._job_loop(job), name=f"job:{job.name}")
 
-            # Wait until the scheduled time
-            await TaskScheduler._wait_until(next_run)
+    async def _job_loop(self, job: ScheduledJob) -> None:
+        last_run = (self._last_runs or {}).get(job.name)
+        if job.catch_up and last_run is not None:
+            last_run_at = datetime.datetime.fromtimestamp(last_run, TIMEZONE)
+            missed = job.cron.next_after(last_run_at)
+            if missed <= datetime.datetime.now(TIMEZONE):
+                logger.info("Catching up job %s missed at %s", job.name, missed)
+                await self.run_job(job.name)
 
-            # Execute the task
-            try:
-                logger.info("Running scheduled task at %s", next_run)
-                await task()
-                logger.info("Scheduled task completed successfully")
-            except Exception:
-                logger.exception("Error in scheduled task")
+        while True:
+            next_run = job.cron.next_after(datetime.datetime.now(TIMEZONE))
+            await self._sleep_until(next_run)
+            if job.jitter > 0:
+                # Jitter only spreads load and does not need to be secure
+                await asyncio.sleep(random.uniform(0, job.jitter))  # noqa: S311
+            await self.run_job(job.name)
 
-            # Wait a bit to avoid running the task twice if execution is very fast
-            await asyncio.sleep(1)
+            # Count fire times that passed while the job was running
+            after = job.cron.next_after(next_run)
+            while after <= datetime.datetime.now(TIMEZONE):
+                job.metrics.skipped += 1
+                logger.warning("Skipped run of job %s at %s (still running)", job.name, after)
+                after = job.cron.next_after(after)
 
     @staticmethod
-    async def start_reset_usage_scheduler() -> None:
-        """Start scheduler to reset usage counts at midnight."""
-        # Reset time - midnight (00:00:00)
-        reset_time = datetime.time(0, 0, 0, tzinfo=TIMEZONE)
-
-        async def reset_all_usage() -> None:
-            logger.info("Resetting all user API usage counts")
-            await UsageLimitDAO().reset_all_usage_counts()
-            logger.info("Successfully reset all user API usage counts")
-
-        # Start the scheduler
-        await TaskScheduler._schedule_daily(reset_time, reset_all_usage)
+    async def _sleep_until(target: datetime.datetime) -> None:
+        # Polling the wall clock is intended here: a single long sleep
+        # would not notice the clock being adjusted
+        while True:
+            remaining = (target - datetime.datetime.now(TIMEZONE)).total_seconds()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, _MAX_SLEEP_SECONDS))
+
+    async def run_job(self, name: str) -> bool:
+        """Run a job now unless it is already running.
+
+        The run is shielded from cancellation of the caller, so that
+        `shutdown` can drain it.
+
+        Parameters
+        ----------
+        name : str
+            Name of the job to run.
+
+        Returns
+        -------
+        bool
+            True if the job was run, False if it was already running.
+        """
+        job = self.jobs[name]
+        if job.running:
+            job.metrics.skipped += 1
+            logger.warning("Job %s is already running", name)
+            return False
+
+        job.running = True
+        run = asyncio.create_task(self._execute(job))
+        self._runs.add(run)
+        run.add_done_callback(self._runs.discard)
+        await asyncio.shield(run)
+        return True
+
+    async def _execute(self, job: ScheduledJob) -> None:
+        started_at = time.time()
+        started = time.perf_counter()
+        failed = False
+        try:
+            logger.info("Running job %s", job.name)
+            await job.task()
+        except Exception:
+            failed = True
+            logger.exception("Error in job %s", job.name)
+        finally:
+            duration = time.perf_counter() - started
+            job.metrics.record(duration, failed=failed)
+            job.running = False
+            logger.info("Job %s finished in %.3f seconds", job.name, duration)
+
+        try:
+            await JobRunDAO().set_last_run(job.name, started_at, duration)
+        except Exception:
+            logger.exception("Failed to persist the last run of job %s", job.name)
+
+    def metrics(self) -> dict[str, JobMetrics]:
+        """Get the run statistics of every job.
+
+        Returns
+        -------
+        dict[str, JobMetrics]
+            Mapping of job names to their metrics.
+        """
+        return {name: job.metrics for name, job in self.jobs.items()}
+
+    async def shutdown(self, timeout: float = 30.0) -> None:
+        """Stop scheduling and wait for running jobs to finish.
+
+        Parameters
+        ----------
+        timeout : float
+            Seconds to wait for running jobs before cancelling them.
+        """
+        for loop in self._loops.values():
+            loop.cancel()
+        await asyncio.gather(*self._loops.values(), return_exceptions=True)
+        self._loops.clear()
+
+        if self._runs:
+            logger.info("Waiting for %d running jobs to finish", len(self._runs))
+            _, pending = await asyncio.wait(set(self._runs), timeout=timeout)
+            for run in pending:
+                run.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        for name, metrics in self.metrics().items():
+            logger.info(
+                "Job %s: %d runs, %d failed, %d skipped, avg %.3fs, max %.3fs",
+                name,
+                metrics.runs,
+                metrics.failures,
+                metrics.skipped,
+                metrics.average_duration,
+                metrics.max_duration,
+            )
+        logger.info("Scheduler stopped")
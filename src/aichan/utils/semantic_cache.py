@@ -0,0 +1,395 @@
+"""A cache of `/chat` answers that also matches paraphrased prompts.
+
+Prompts are embedded locally as 256-bit SimHash signatures of their
+character trigrams. The fraction of differing bits between two
+signatures estimates the angle between the trigram count vectors, so a
+signature is all that is kept per prompt to compare it by cosine
+similarity.
+
+The signatures are stored in a memory-mapped file, a ring of
+`chat_cache_size` slots in which the oldest entry is overwritten. In
+memory, only an LSH index is kept: the signature is cut into 16 bands of
+16 bits, and each band value maps to the slots that share it. A lookup
+only compares the slots that share a band with the prompt, which keeps
+it fast at a million entries. The answers are stored in SQLite.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import math
+import mmap
+import re
+import struct
+import unicodedata
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import NamedTuple, Self
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.config.store import get_settings
+from src.aichan.database.dao.chat_cache_dao import ChatCacheDAO
+
+logger = parse_args_and_setup_logging()
+
+SIGNATURE_BITS = 256
+_BANDS = 16
+_BAND_BITS = SIGNATURE_BITS // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+# File layout: a header, then one record of signature and context per slot
+_MAGIC = b"AICHSIM1"
+_HEADER = struct.Struct("<8sIII12x")
+_RECORD = struct.Struct("<32sQ")
+# Prompts longer than this are not cached, so that lane sums never overflow
+_MAX_PROMPT_CHARS = 8000
+# The 16-bit lanes of a signature with all bits 0, see `prompt_signature`
+_ZERO_LANES = int.from_bytes(("0" * SIGNATURE_BITS).encode("utf-16-be"), "big")
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def prompt_signature(text: str) -> int:
+    """Compute the SimHash signature of a prompt.
+
+    The prompt is normalized (NFKC, lower case, punctuation and repeated
+    spaces removed) and split into character trigrams. Each trigram votes
+    on every bit with the bits of its BLAKE2b hash, weighted by its count,
+    and a bit is set where the votes for 1 win.
+
+    Parameters
+    ----------
+    text : str
+        The prompt.
+
+    Returns
+    -------
+    int
+        The signature, `SIGNATURE_BITS` bits long.
+    """
+    normalized = unicodedata.normalize("NFKC", text).lower()
+    normalized = _SPACES.sub(" ", _NON_WORD.sub(" ", normalized)).strip()
+    trigrams = Counter(normalized[i : i + 3] for i in range(max(1, len(normalized) - 2)))
+
+    # Every bit of the hash is spread into a 16-bit lane of one big integer,
+    # so a single multiplication adds the weighted votes of all bits at once
+    votes = 0
+    for trigram, count in trigrams.items():
+        digest = hashlib.blake2b(trigram.encode(), digest_size=SIGNATURE_BITS // 8).digest()
+        bits = format(int.from_bytes(digest, "big"), f"0{SIGNATURE_BITS}b")
+        votes += (int.from_bytes(bits.encode("utf-16-be"), "big") - _ZERO_LANES) * count
+    lanes = votes.to_bytes(SIGNATURE_BITS * 2, "big")
+    half = trigrams.total() / 2
+    bits = "".join(
+        "1" if int.from_bytes(lanes[i : i + 2], "big") > half else "0"
+        for i in range(0, SIGNATURE_BITS * 2, 2)
+    )
+    return int(bits, 2)
+
+
+def context_id(*parts: object) -> int:
+    """Hash what an answer depends on besides the prompt, e.g. the model.
+
+    Parameters
+    ----------
+    *parts : object
+        The system prompt and the model parameters.
+
+    Returns
+    -------
+    int
+        A 64-bit hash. Entries only match prompts of the same context.
+    """
+    digest = hashlib.blake2b("\0".join(map(str, parts)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class CacheHit(NamedTuple):
+    """A cached answer to a similar prompt.
+
+    Attributes
+    ----------
+    response : str
+        The cached answer.
+    similarity : float
+        The estimated cosine similarity of the prompts.
+    """
+
+    response: str
+    similarity: float
+
+
+class SignatureIndex:
+    """A ring of signatures in a memory-mapped file, indexed by LSH bands.
+
+    Parameters
+    ----------
+    path : Path
+        The file. It is created, or recreated if its capacity differs.
+    capacity : int
+        The number of slots.
+    """
+
+    def __init__(self, path: Path, capacity: int) -> None:
+        self.capacity = capacity
+        self.bands: list[dict[int, array[int]]] = [{} for _ in range(_BANDS)]
+        size = _HEADER.size + capacity * _RECORD.size
+        fresh = not path.exists() or path.stat().st_size != size
+        with path.open("a+b") as file:
+            file.truncate(size)
+            self.map = mmap.mmap(file.fileno(), size)
+        magic, stored_capacity, self.next_slot, self.count = _HEADER.unpack_from(self.map)
+        if fresh or magic != _MAGIC or stored_capacity != capacity:
+            self.map[:] = bytes(size)
+            self.next_slot = self.count = 0
+            self._write_header()
+        for slot in range(self.count):
+            self._link(slot, self.signature_at(slot)[0])
+
+    def signature_at(self, slot: int) -> tuple[int, int]:
+        """Read the signature and context of a slot.
+
+        Parameters
+        ----------
+        slot : int
+            The slot.
+
+        Returns
+        -------
+        tuple[int, int]
+            (signature, context).
+        """
+        signature, context = _RECORD.unpack_from(self.map, _HEADER.size + slot * _RECORD.size)
+        return int.from_bytes(signature, "big"), context
+
+    def search(self, signature: int, context: int) -> tuple[int, float] | None:
+        """Find the most similar entry of a context.
+
+        Parameters
+        ----------
+        signature : int
+            The signature of the prompt.
+        context : int
+            The context of the prompt.
+
+        Returns
+        -------
+        tuple[int, float] | None
+            (slot, similarity) of the best candidate, or None if no
+            entry shares a band with the prompt.
+        """
+        candidates: set[int] = set()
+        for band, buckets in enumerate(self.bands):
+            bucket = buckets.get((signature >> (band * _BAND_BITS)) & _BAND_MASK)
+            if bucket is not None:
+                candidates.update(bucket)
+        best_slot = None
+        best_distance = SIGNATURE_BITS
+        for slot in candidates:
+            other, other_context = self.signature_at(slot)
+            distance = (signature ^ other).bit_count()
+            if other_context == context and (best_slot is None or distance < best_distance):
+                best_slot, best_distance = slot, distance
+        if best_slot is None:
+            return None
+        return best_slot, math.cos(math.pi * best_distance / SIGNATURE_BITS)
+
+    def find(self, signature: int, context: int) -> int | None:
+        """Find a slot holding exactly a signature and context.
+
+        Parameters
+        ----------
+        signature : int
+            The signature of the prompt.
+        context : int
+            The context of the prompt.
+
+        Returns
+        -------
+        int | None
+            The slot, or None if no slot holds them.
+        """
+        # An equal signature is in the bucket of every band, so one is enough
+        for slot in self.bands[0].get(signature & _BAND_MASK, ()):
+            if self.signature_at(slot) == (signature, context):
+                return slot
+        return None
+
+    def add(self, signature: int, context: int) -> tuple[int, tuple[int, int] | None]:
+        """Store a signature in the next slot, overwriting the oldest entry.
+
+        Parameters
+        ----------
+        signature : int
+            The signature of the prompt.
+        context : int
+            The context of the prompt.
+
+        Returns
+        -------
+        tuple[int, tuple[int, int] | None]
+            The slot, and the (signature, context) it held before, if any.
+        """
+        slot = self.next_slot
+        evicted = None
+        if slot < self.count:
+            evicted = self.signature_at(slot)
+            self._unlink(slot, evicted[0])
+        _RECORD.pack_into(
+            self.map,
+            _HEADER.size + slot * _RECORD.size,
+            signature.to_bytes(SIGNATURE_BITS // 8, "big"),
+            context,
+        )
+        self._link(slot, signature)
+        self.next_slot = (slot + 1) % self.capacity
+        self.count = max(self.count, slot + 1)
+        self._write_header()
+        return slot, evicted
+
+    def close(self) -> None:
+        """Write the file back and unmap it."""
+        self.map.flush()
+        self.map.close()
+
+    def _link(self, slot: int, signature: int) -> None:
+        for band, buckets in enumerate(self.bands):
+            key = (signature >> (band * _BAND_BITS)) & _BAND_MASK
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = array("I", (slot,))
+            else:
+                bucket.append(slot)
+
+    def _unlink(self, slot: int, signature: int) -> None:
+        for band, buckets in enumerate(self.bands):
+            key = (signature >> (band * _BAND_BITS)) & _BAND_MASK
+            bucket = buckets[key]
+            bucket.remove(slot)
+            if not bucket:
+                del buckets[key]
+
+    def _write_header(self) -> None:
+        _HEADER.pack_into(self.map, 0, _MAGIC, self.capacity, self.next_slot, self.count)
+
+
+def entry_key(signature: int, context: int) -> str:
+    """Return the key of the answer of an entry in the database.
+
+    Parameters
+    ----------
+    signature : int
+        The signature of the prompt.
+    context : int
+        The context of the prompt.
+
+    Returns
+    -------
+    str
+        The key.
+    """
+    return f"{context:016x}{signature:064x}"
+
+
+class SemanticCache:
+    """A singleton cache of `/chat` answers matched by prompt similarity.
+
+    Disabled if `chat_cache_size` is 0. The index is loaded from its file
+    on first use. When sharded, each process keeps its own file.
+    """
+
+    _instance = None
+    index: SignatureIndex | None
+    lock: asyncio.Lock
+    dao: ChatCacheDAO
+
+    def __new__(cls) -> Self:
+        """Create a new instance of SemanticCache or return the existing one.
+
+        Returns
+        -------
+        Self
+            The singleton instance of SemanticCache.
+        """
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.index = None
+            cls._instance.lock = asyncio.Lock()
+            cls._instance.dao = ChatCacheDAO()
+        return cls._instance
+
+    async def lookup(self, prompt: str, context: int) -> CacheHit | None:
+        """Find the answer to a prompt similar enough to the given one.
+
+        Parameters
+        ----------
+        prompt : str
+            The prompt.
+        context : int
+            The context of the prompt, from `context_id`.
+
+        Returns
+        -------
+        CacheHit | None
+            The answer, or None if there is none above
+            `chat_cache_threshold`.
+        """
+        index = await self._get_index()
+        if index is None or len(prompt) > _MAX_PROMPT_CHARS:
+            return None
+        signature = prompt_signature(prompt)
+        found = index.search(signature, context)
+        if found is None or found[1] < get_settings().chat_cache_threshold:
+            return None
+        response = await self.dao.get(entry_key(index.signature_at(found[0])[0], context))
+        return None if response is None else CacheHit(response, found[1])
+
+    async def store(self, prompt: str, context: int, response: str) -> None:
+        """Cache the answer to a prompt.
+
+        Parameters
+        ----------
+        prompt : str
+            The prompt.
+        context : int
+            The context of the prompt, from `context_id`.
+        response : str
+            The answer.
+        """
+        index = await self._get_index()
+        if index is None or len(prompt) > _MAX_PROMPT_CHARS:
+            return
+        signature = prompt_signature(prompt)
+        # Slots of the same entry would share its answer, and evicting one
+        # would delete the answer of the others
+        if index.find(signature, context) is None:
+            _, evicted = index.add(signature, context)
+            if evicted is not None and index.find(*evicted) is None:
+                await self.dao.delete(entry_key(*evicted))
+        await self.dao.put(entry_key(signature, context), response)
+
+    def close(self) -> None:
+        """Write the index file back to disk."""
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+    async def _get_index(self) -> SignatureIndex | None:
+        settings = get_settings()
+        if settings.chat_cache_size <= 0:
+            return None
+        async with self.lock:
+            if self.index is None:
+                path = Path(settings.chat_cache_path)
+                if settings.discord_shard_ids:
+                    shard = settings.discord_shard_ids[0]
+                    path = path.with_name(f"{path.stem}.{shard}{path.suffix}")
+                # Rebuilding the bands of a large file takes a while
+                self.index = await asyncio.to_thread(
+                    SignatureIndex,
+                    path,
+                    settings.chat_cache_size,
+                )
+                logger.info("Loaded %d cached /chat answers", self.index.count)
+        return self.index
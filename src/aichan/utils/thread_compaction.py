@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Any
+
+from src.aichan._cli import parse_args_and_setup_logging
+from src.aichan.adapters.chat import ChatTurn, Conversation
+from src.aichan.adapters.response import ResponseResult, ResponseStatus
+from src.aichan.ai.models.claude_model import ClaudeModelParams
+from src.aichan.ai.services.anthropic_batch import anthropic_batch_params
+from src.aichan.ai.services.anthropic_text import generate_anthropic_response
+from src.aichan.config.store import get_config
+from src.aichan.utils.batch_queue import BatchQueue
+from src.aichan.utils.thread_session_store import ThreadSessionStore
+
+if TYPE_CHECKING:
+    from src.aichan.utils.thread_session_store import ThreadSession
+
+logger = parse_args_and_setup_logging()
+
+_SUMMARY_KIND = "thread_summary"
+# Compactions in progress by thread ID; also keeps the tasks referenced
+_running: dict[int, asyncio.Task[bool]] = {}
+
+
+def schedule_compaction(session: ThreadSession) -> None:
+    """Compact the conversation of a thread in the background.
+
+    Does nothing if a compaction of the thread is already running.
+
+    Parameters
+    ----------
+    session : ThreadSession
+        The session of the thread.
+    """
+    thread_id = session.thread_id
+    if thread_id in _running:
+        return
+    task = asyncio.create_task(compact_thread(session))
+    _running[thread_id] = task
+    task.add_done_callback(lambda _: _running.pop(thread_id, None))
+
+
+async def compact_thread(session: ThreadSession) -> bool:
+    """Summarize the older messages of a thread.
+
+    All but the last `thread_summary_keep_messages` messages are
+    summarized together with the previous summary, and the summary is
+    sent in their place from then on. With `thread_summary_deferred`,
+    the request is queued for the next batch instead, once per thread,
+    and the summary is applied when the batch has finished.
+
+    Parameters
+    ----------
+    session : ThreadSession
+        The session of the thread.
+
+    Returns
+    -------
+    bool
+        True if the conversation was compacted, False otherwise.
+    """
+    config = get_config()
+    settings = config.settings
+    conversation = session.conversation
+    messages = conversation.messages
+    # The kept messages must start with a user message
+    cut = len(messages) - settings.thread_summary_keep_messages
+    if cut > 0 and messages[cut]["role"] != "user":
+        cut -= 1
+    if cut <= 0:
+        return False
+    summary_until = conversation.message_ids[cut - 1]
+    if summary_until is None:
+        return False
+
+    transcript = "\n\n".join(
+        f"{message['role']}: {message['content']}" for message in messages[:cut]
+    )
+    if session.summary is not None:
+        transcript = f"<summary>\n{session.summary}\n</summary>\n\n{transcript}"
+
+    system_prompt = config.prompts.summary_system
+    prompt = Conversation([ChatTurn("user", transcript)])
+    model_params = ClaudeModelParams(
+        model=settings.thread_summary_model,
+        max_tokens=settings.thread_summary_max_tokens,
+        temperature=0.0,
+        top_p=1.0,
+    )
+    try:
+        if settings.thread_summary_deferred:
+            await BatchQueue().enqueue(
+                _SUMMARY_KIND,
+                f"summary-{session.thread_id}",
+                {"thread_id": session.thread_id, "summary_until": summary_until},
+                {"0": anthropic_batch_params(system_prompt, prompt, model_params)},
+            )
+            return False
+
+        response = await generate_anthropic_response(
+            system_prompt=system_prompt,
+            prompt=prompt,
+            model_params=model_params,
+        )
+        if response.status != ResponseStatus.SUCCESS or not response.result:
+            logger.warning("Failed to summarize thread %d", session.thread_id)
+            return False
+
+        await ThreadSessionStore().set_summary(session, response.result, summary_until)
+    except Exception:
+        logger.exception("Failed to compact thread %d", session.thread_id)
+        return False
+    logger.info("Compacted %d messages of thread %d", cut, session.thread_id)
+    return True
+
+
+async def _apply_deferred_summary(
+    context: dict[str, Any],
+    results: dict[str, ResponseResult],
+) -> None:
+    # The thread may have been compacted, reset or deleted in the meantime
+    thread_id = context["thread_id"]
+    summary_until = context["summary_until"]
+    response = results.get("0")
+    if response is None or response.status != ResponseStatus.SUCCESS or not response.result:
+        logger.warning("Failed to summarize thread %d in a batch", thread_id)
+        return
+    store = ThreadSessionStore()
+    session = await store.get_session(thread_id)
+    if session is None or (
+        session.summary_until is not None and session.summary_until >= summary_until
+    ):
+        return
+    await store.set_summary(session, response.result, summary_until)
+    logger.info("Compacted thread %d with a batch summary", thread_id)
+
+
+BatchQueue().register(_SUMMARY_KIND, _apply_deferred_summary)
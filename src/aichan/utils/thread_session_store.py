@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Self
+
+from src.aichan.adapters.chat import Conversation
+from src.aichan.ai.models.claude_model import ClaudeModelParams
+from src.aichan.config.store import get_settings
+from src.aichan.database.dao.thread_session_dao import ThreadSessionDAO
+
+if TYPE_CHECKING:
+    from src.aichan.config.prompt import Prompts
+
+# Refresh the database timestamp of a session used in memory at most this often
+_TOUCH_INTERVAL_SECONDS = 24 * 60 * 60
+
+
+class ThreadSession:
+    """The conversation settings of a `/talk` thread.
+
+    Parameters
+    ----------
+    thread_id : int
+        ID of the Discord thread.
+    model_params : ClaudeModelParams
+        The model parameters of the conversation.
+    prompt_key : str
+        Key of the system prompt in `.prompt.yml`.
+    summary : str | None
+        Summary of the older messages of the thread, if any.
+    summary_until : int | None
+        ID of the last Discord message covered by the summary, if any.
+
+    Attributes
+    ----------
+    conversation : Conversation
+        The rendered messages of the thread, kept in memory only and
+        rebuilt from the thread history when the session is reloaded.
+    """
+
+    __slots__ = (
+        "accessed_at",
+        "conversation",
+        "model_params",
+        "prompt_key",
+        "summary",
+        "summary_until",
+        "thread_id",
+        "touched_at",
+    )
+
+    def __init__(
+        self,
+        thread_id: int,
+        model_params: ClaudeModelParams,
+        prompt_key: str,
+        summary: str | None = None,
+        summary_until: int | None = None,
+    ) -> None:
+        self.thread_id = thread_id
+        self.model_params = model_params
+        self.prompt_key = prompt_key
+        self.summary = summary
+        self.summary_until = summary_until
+        self.conversation = Conversation()
+        self.accessed_at = time.monotonic()
+        self.touched_at = self.accessed_at
+
+    def system_prompt(self, prompts: Prompts) -> str:
+        """Render the system prompt of the conversation, including its summary.
+
+        Parameters
+        ----------
+        prompts : Prompts
+            The system prompts of the snapshot used for the turn.
+
+        Returns
+        -------
+        str
+            The system prompt.
+        """
+        system_prompt = prompts.by_key(self.prompt_key)
+        if self.summary is None:
+            return system_prompt
+        return (
+            f"{system_prompt}\n\n"
+            "The earlier part of this conversation is summarized below.\n"
+            f"<summary>\n{self.summary}\n</summary>"
+        )
+
+
+class ThreadSessionStore:
+    """A singleton two-tier store of thread sessions.
+
+    Sessions are persisted in the `thread_sessions` table and cached in
+    memory. The memory tier is bounded both by count (least recently used
+    sessions are evicted first) and by idle time, and sessions of archived
+    threads are evicted explicitly. Evicted sessions, including every
+    session after a restart, are loaded back from the database on their
+    next use.
+    """
+
+    _instance = None
+    data: OrderedDict[int, ThreadSession]
+
+    def __new__(cls) -> Self:
+        """Create a new instance of ThreadSessionStore or return the existing one.
+
+        Returns
+        -------
+        Self
+            The singleton instance of ThreadSessionStore.
+        """
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.data = OrderedDict()
+        return cls._instance
+
+    async def set_session(self, session: ThreadSession) -> None:
+        """Store the session of a thread.
+
+        Parameters
+        ----------
+        session : ThreadSession
+            The session to store.
+        """
+        params = session.model_params
+        await ThreadSessionDAO().upsert(
+            thread_id=session.thread_id,
+            model=str(params.model),
+            max_tokens=params.max_tokens,
+            temperature=params.temperature,
+            top_p=params.top_p,
+            prompt_key=session.prompt_key,
+        )
+        self._put(session)
+
+    async def get_session(self, thread_id: int) -> ThreadSession | None:
+        """Retrieve the session of a thread.
+
+        Parameters
+        ----------
+        thread_id : int
+            ID of the Discord thread.
+
+        Returns
+        -------
+        ThreadSession | None
+            The session if found, None otherwise.
+        """
+        now = time.monotonic()
+        session = self.data.get(thread_id)
+        ttl = get_settings().thread_session_cache_ttl
+        if session is not None and now - session.accessed_at > ttl:
+            del self.data[thread_id]
+            session = None
+
+        if session is None:
+            row = await ThreadSessionDAO().get(thread_id)
+            if row is None:
+                return None
+            model, max_tokens, temperature, top_p, prompt_key, summary, summary_until = row
+            session = ThreadSession(
+                thread_id=thread_id,
+                model_params=ClaudeModelParams(
+                    model=model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                ),
+                prompt_key=prompt_key,
+                summary=summary,
+                summary_until=summary_until,
+            )
+            await ThreadSessionDAO().touch(thread_id)
+            self._put(session)
+            return session
+
+        self.data.move_to_end(thread_id)
+        session.accessed_at = now
+        if now - session.touched_at > _TOUCH_INTERVAL_SECONDS:
+            session.touched_at = now
+            await ThreadSessionDAO().touch(thread_id)
+        return session
+
+    def evict(self, thread_id: int) -> None:
+        """Drop the session of a thread from memory, keeping it in the database.
+
+        Parameters
+        ----------
+        thread_id : int
+            ID of the Discord thread.
+        """
+        self.data.pop(thread_id, None)
+
+    def reset_conversation(self, thread_id: int) -> None:
+        """Discard the rendered messages of a thread, if its session is in memory.
+
+        Parameters
+        ----------
+        thread_id : int
+            ID of the Discord thread.
+        """
+        session = self.data.get(thread_id)
+        if session is not None:
+            session.conversation.clear()
+
+    async def set_summary(self, session: ThreadSession, summary: str, summary_until: int) -> None:
+        """Replace the older messages of a thread with their summary.
+
+        Parameters
+        ----------
+        session : ThreadSession
+            The session of the thread.
+        summary : str
+            Summary of the messages up to `summary_until`, including any
+            previous summary.
+        summary_until : int
+            ID of the last Discord message covered by the summary.
+        """
+        await ThreadSessionDAO().set_summary(session.thread_id, summary, summary_until)
+        session.summary = summary
+        session.summary_until = summary_until
+        session.conversation.drop_until(summary_until)
+
+    async def delete_session(self, thread_id: int) -> None:
+        """Delete the session of a thread from memory and the database.
+
+        Parameters
+        ----------
+        thread_id : int
+            ID of the Discord thread.
+        """
+        self.evict(thread_id)
+        await ThreadSessionDAO().delete(thread_id)
+
+    def prune(self) -> None:
+        """Drop sessions that have been idle for longer than the TTL."""
+        now = time.monotonic()
+        ttl = get_settings().thread_session_cache_ttl
+        # The least recently used sessions come first
+        while self.data:
+            session = next(iter(self.data.values()))
+            if now - session.accessed_at <= ttl:
+                break
+            self.data.popitem(last=False)
+
+    def _put(self, session: ThreadSession) -> None:
+        self.prune()
+        self.data[session.thread_id] = session
+        self.data.move_to_end(session.thread_id)
+        while len(self.data) > get_settings().thread_session_cache_size:
+            self.data.popitem(last=False)
@@ -0,0 +1,255 @@
+"""A local stub of the batch endpoints of the Anthropic and OpenAI APIs.
+
+It serves the Message Batches API under `/v1/messages/batches` and the
+Batch API under `/v1/files` and `/v1/batches`, enough for the SDKs to
+submit batches and fetch their results. Point `ANTHROPIC_BASE_URL` at
+its root and `OPENAI_BASE_URL` at its `/v1` to use it. A batch finishes
+the second time it is retrieved, so that polling it first finds it still
+processing.
+
+Run ``python -m tests.batch_stub [port]`` to try the deferred mode of the
+bot against it. Every request is then answered with its last user message.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+from typing import TYPE_CHECKING, Any
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    # Called with the parameters of a request; None makes the request fail
+    Answer = Callable[[dict[str, Any]], str | None]
+
+_DEFAULT_PORT = 8765
+
+
+def last_user_message(params: dict[str, Any]) -> str:
+    """Answer a request with the text of its last user message."""
+    content = next(
+        message["content"] for message in reversed(params["messages"]) if message["role"] == "user"
+    )
+    return content if isinstance(content, str) else json.dumps(content)
+
+
+class BatchStub:
+    """The stub server and the batches submitted to it.
+
+    Parameters
+    ----------
+    answer : Answer
+        Gives the text of the answer to each request.
+    """
+
+    def __init__(self, answer: Answer = last_user_message) -> None:
+        self.answer = answer
+        # Requests of each batch by ID, and how often the batch was retrieved
+        self.batches: dict[str, list[dict[str, Any]]] = {}
+        self.retrievals: dict[str, int] = {}
+        # Requests left out of the results, as in a batch that expired
+        self.missing: set[str] = set()
+        self.files: dict[str, str] = {}
+        self.server: TestServer | None = None
+        self.app = web.Application()
+        self.app.add_routes(
+            [
+                web.post("/v1/messages/batches", self._anthropic_create),
+                web.get("/v1/messages/batches/{batch_id}", self._anthropic_retrieve),
+                web.get("/v1/messages/batches/{batch_id}/results", self._anthropic_results),
+                web.post("/v1/files", self._openai_upload),
+                web.get("/v1/files/{file_id}/content", self._openai_content),
+                web.post("/v1/batches", self._openai_create),
+                web.get("/v1/batches/{batch_id}", self._openai_retrieve),
+            ],
+        )
+
+    async def start(self, port: int = 0) -> str:
+        """Start serving on localhost.
+
+        Parameters
+        ----------
+        port : int
+            The port, or 0 for any free port.
+
+        Returns
+        -------
+        str
+            The root URL of the stub.
+        """
+        self.server = TestServer(self.app, host="127.0.0.1", port=port or None)
+        await self.server.start_server()
+        return str(self.server.make_url("")).rstrip("/")
+
+    async def close(self) -> None:
+        """Stop serving."""
+        if self.server is not None:
+            await self.server.close()
+
+    def _retrieve(self, batch_id: str) -> bool:
+        # Whether the batch has finished
+        self.retrievals[batch_id] += 1
+        return self.retrievals[batch_id] > 1
+
+    def _add_batch(self, prefix: str, requests: list[dict[str, Any]]) -> str:
+        batch_id = f"{prefix}_{len(self.batches)}"
+        self.batches[batch_id] = requests
+        self.retrievals[batch_id] = 0
+        return batch_id
+
+    async def _anthropic_create(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        batch_id = self._add_batch("msgbatch", body["requests"])
+        return web.json_response(_anthropic_batch(request, batch_id, ended=False))
+
+    async def _anthropic_retrieve(self, request: web.Request) -> web.Response:
+        batch_id = request.match_info["batch_id"]
+        ended = self._retrieve(batch_id)
+        return web.json_response(_anthropic_batch(request, batch_id, ended=ended))
+
+    async def _anthropic_results(self, request: web.Request) -> web.Response:
+        lines = []
+        for entry in self.batches[request.match_info["batch_id"]]:
+            if entry["custom_id"] in self.missing:
+                continue
+            text = self.answer(entry["params"])
+            if text is None:
+                error = {"type": "error", "error": {"type": "api_error", "message": "stub"}}
+                result: dict[str, Any] = {"type": "errored", "error": error}
+            else:
+                result = {"type": "succeeded", "message": _anthropic_message(text)}
+            lines.append(json.dumps({"custom_id": entry["custom_id"], "result": result}))
+        return web.Response(text="\n".join(lines), content_type="application/binary")
+
+    async def _openai_upload(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        upload = form["file"]
+        if not isinstance(upload, web.FileField):
+            raise web.HTTPBadRequest
+        file_id = self._add_file(upload.file.read().decode())
+        return web.json_response(
+            {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(self.files[file_id]),
+                "created_at": 0,
+                "filename": upload.filename,
+                "purpose": "batch",
+                "status": "processed",
+            },
+        )
+
+    async def _openai_content(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.files[request.match_info["file_id"]])
+
+    async def _openai_create(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        lines = self.files[body["input_file_id"]].splitlines()
+        batch_id = self._add_batch("batch", [json.loads(line) for line in lines if line])
+        return web.json_response(self._openai_batch(batch_id, "validating"))
+
+    async def _openai_retrieve(self, request: web.Request) -> web.Response:
+        batch_id = request.match_info["batch_id"]
+        if not self._retrieve(batch_id):
+            return web.json_response(self._openai_batch(batch_id, "in_progress"))
+        outputs = []
+        errors = []
+        for entry in self.batches[batch_id]:
+            if entry["custom_id"] in self.missing:
+                continue
+            text = self.answer(entry["body"])
+            if text is None:
+                error = {"code": "server_error", "message": "stub"}
+                errors.append({"custom_id": entry["custom_id"], "response": None, "error": error})
+            else:
+                outputs.append(
+                    {"custom_id": entry["custom_id"], "response": _openai_response(text)},
+                )
+        output_file_id = self._add_file("\n".join(json.dumps(line) for line in outputs))
+        error_file_id = self._add_file("\n".join(json.dumps(line) for line in errors))
+        return web.json_response(
+            self._openai_batch(batch_id, "completed", output_file_id, error_file_id),
+        )
+
+    def _add_file(self, content: str) -> str:
+        file_id = f"file-{len(self.files)}"
+        self.files[file_id] = content
+        return file_id
+
+    def _openai_batch(
+        self,
+        batch_id: str,
+        status: str,
+        output_file_id: str | None = None,
+        error_file_id: str | None = None,
+    ) -> dict[str, Any]:
+        return {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": "/v1/chat/completions",
+            "input_file_id": "file-0",
+            "completion_window": "24h",
+            "status": status,
+            "created_at": 0,
+            "output_file_id": output_file_id,
+            "error_file_id": error_file_id,
+        }
+
+
+def _anthropic_batch(request: web.Request, batch_id: str, *, ended: bool) -> dict[str, Any]:
+    counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+    results_url = f"{request.url.origin()}/v1/messages/batches/{batch_id}/results"
+    return {
+        "id": batch_id,
+        "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": counts,
+        "created_at": "2025-01-01T00:00:00Z",
+        "expires_at": "2025-01-02T00:00:00Z",
+        "ended_at": "2025-01-01T01:00:00Z" if ended else None,
+        "archived_at": None,
+        "cancel_initiated_at": None,
+        "results_url": results_url if ended else None,
+    }
+
+
+def _anthropic_message(text: str) -> dict[str, Any]:
+    return {
+        "id": "msg_stub",
+        "type": "message",
+        "role": "assistant",
+        "model": "stub",
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": 10, "output_tokens": 5},
+    }
+
+
+def _openai_response(text: str) -> dict[str, Any]:
+    return {
+        "status_code": 200,
+        "body": {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+        },
+    }
+
+
+async def _serve(port: int) -> None:
+    stub = BatchStub()
+    url = await stub.start(port)
+    print(f"ANTHROPIC_BASE_URL={url} OPENAI_BASE_URL={url}/v1")  # noqa: T201
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stub.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_serve(int(sys.argv[1]) if len(sys.argv) > 1 else _DEFAULT_PORT))
@@ -0,0 +1,105 @@
+"""Measure how long the moderation filter takes to compile and to check prompts.
+
+The blocklist has random ASCII words and phrases, Japanese terms and one
+expression, and the prompts mix English words and Japanese text, as the
+prompts of the bot do. None of the blocked terms are in the vocabulary of
+the prompts, so every flagged prompt is a false hit of random text.
+
+Run ``python -m tests.bench_moderation [--terms N] [--prompts N]``.
+"""
+
+import argparse
+import dataclasses
+import random
+import string
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+_KANA = "".join(chr(code) for code in range(ord("ぁ"), ord("ゖ")))
+_KANJI = "日本語質問回答関数変数設定時間場合理由方法"
+_VOCABULARY = (
+    *("the", "a", "of", "to", "and", "in", "is", "it", "you", "that", "for", "on", "with"),
+    *("as", "this", "how", "do", "I", "can", "my", "code", "function", "error", "list"),
+    *("value", "python", "return", "file", "why", "what", "when", "test", "class", "data"),
+    *("run", "not", "work", "help"),
+)
+# Share of the parts of prompts in English
+_ENGLISH = 0.7
+# Share of the blocklist of each kind of term, and the expressions
+_PHRASES = 0.04
+_JAPANESE = 0.1
+_EXPRESSIONS = ("re:\\bfree \\$\\d+\\b",)
+_SHORT_CHARS = 100
+_LONG_CHARS = 2200
+# Long prompts are fewer, as they are rarer and slower to check
+_LONG_PROMPTS_DIVISOR = 20
+
+
+def _blocklist(rng: random.Random, count: int) -> str:
+    def word() -> str:
+        # Random letters are not in the vocabulary of the prompts
+        return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 10)))
+
+    phrases = int(count * _PHRASES)
+    japanese = int(count * _JAPANESE)
+    lines = [word() for _ in range(count - phrases - japanese)]
+    lines += [f"{word()} {word()}" for _ in range(phrases)]
+    lines += ["".join(rng.choices(_KANA, k=rng.randint(4, 6))) for _ in range(japanese)]
+    return "\n".join([*lines, *_EXPRESSIONS])
+
+
+def _prompt(rng: random.Random, length: int) -> str:
+    parts: list[str] = []
+    size = 0
+    while size < length:
+        if rng.random() < _ENGLISH:
+            part = " ".join(rng.choices(_VOCABULARY, k=rng.randint(3, 12)))
+        else:
+            part = "".join(rng.choices(_KANA + _KANJI, k=rng.randint(5, 30)))
+        parts.append(part)
+        size += len(part) + 1
+    return " ".join(parts)[:length]
+
+
+def _bench(prompts: list[str], check: Callable[[str], str | None]) -> tuple[float, int]:
+    started = time.perf_counter()
+    flagged = sum(check(prompt) is not None for prompt in prompts)
+    return (time.perf_counter() - started) / len(prompts), flagged
+
+
+def main() -> None:
+    """Print the compile time and the time per prompt."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--terms", type=int, default=5000)
+    parser.add_argument("--prompts", type=int, default=100_000)
+    args = parser.parse_args()
+    # Sets the environment and clears the command line, which the bot reads on import
+    import tests.conftest  # noqa: F401, PLC0415
+    from src.aichan.config.moderation import ModerationFilter  # noqa: PLC0415
+    from src.aichan.config.store import get_settings  # noqa: PLC0415
+
+    # Reproducible text, not a secret
+    rng = random.Random(0)  # noqa: S311
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "blocklist.txt"
+        path.write_text(_blocklist(rng, args.terms), encoding="utf-8")
+        settings = dataclasses.replace(get_settings(), moderation_blocklist_path=str(path))
+        started = time.perf_counter()
+        rules = ModerationFilter.from_settings(settings)
+        compiled = time.perf_counter() - started
+
+    print(f"compile {args.terms:,} terms: {compiled * 1e3:.0f} ms")  # noqa: T201
+    long_prompts = args.prompts // _LONG_PROMPTS_DIVISOR
+    for count, length in ((args.prompts, _SHORT_CHARS), (long_prompts, _LONG_CHARS)):
+        prompts = [_prompt(rng, length) for _ in range(count)]
+        per_prompt, flagged = _bench(prompts, rules.check)
+        print(  # noqa: T201
+            f"{count:,} prompts of {length:,} chars: {per_prompt * 1e6:.0f} us/prompt, "
+            f"{flagged} flagged",
+        )
+
+
+if __name__ == "__main__":
+    main()
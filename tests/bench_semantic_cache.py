@@ -0,0 +1,220 @@
+"""Measure the hit rate and the lookup latency of the `/chat` cache index.
+
+The index is filled with prompts generated from templates. It is then
+queried with paraphrases of stored prompts (case, punctuation, "do" and
+"can", or "a" and "the"), which should hit their entry, and with prompts
+that were not stored, which should miss. Prompts of one template that
+differ in a single word are the false hits a lexical signature cannot
+tell apart.
+
+Run ``python -m tests.bench_semantic_cache [--sizes N ...]``. Filling an
+index of a million entries takes a few minutes.
+"""
+
+import argparse
+import math
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+_OPENERS = (
+    "How do I",
+    "What is the best way to",
+    "Can you explain how to",
+    "Why does it fail when I try to",
+    "Show me how to",
+)
+_VERBS = (
+    "sort",
+    "reverse",
+    "parse",
+    "serialize",
+    "validate",
+    "compress",
+    "encrypt",
+    "merge",
+    "split",
+    "filter",
+    "cache",
+    "index",
+    "stream",
+    "render",
+    "format",
+    "copy",
+    "hash",
+    "search",
+    "group",
+    "count",
+)
+_ADJECTIVES = (
+    "large",
+    "nested",
+    "sorted",
+    "empty",
+    "unicode",
+    "binary",
+    "sparse",
+    "remote",
+    "temporary",
+    "shared",
+    "immutable",
+    "lazy",
+    "concurrent",
+    "compressed",
+    "partial",
+)
+_NOUNS = (
+    "list",
+    "dictionary",
+    "string",
+    "file",
+    "tree",
+    "graph",
+    "matrix",
+    "queue",
+    "table",
+    "date",
+    "image",
+    "column",
+    "array",
+    "set",
+    "buffer",
+    "record",
+    "config",
+    "log",
+    "socket",
+    "request",
+    "response",
+    "template",
+    "stack",
+    "heap",
+    "tuple",
+)
+_TAILS = (
+    "",
+    "quickly",
+    "without a library",
+    "in one line",
+    "with a loop",
+    "in place",
+    "safely",
+    "from the command line",
+    "in a test",
+    "on Windows",
+    "with type hints",
+    "for a beginner",
+)
+_LANGUAGES = (
+    "Python",
+    "JavaScript",
+    "Go",
+    "Rust",
+    "Java",
+    "C",
+    "Ruby",
+    "Kotlin",
+    "Swift",
+    "SQL",
+)
+_SLOTS = (_OPENERS, _VERBS, _ADJECTIVES, _NOUNS, _TAILS, _LANGUAGES)
+_DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+_CONTEXT = 1
+
+
+def _prompt(number: int) -> str:
+    # Decodes the number digit by digit into one word of each slot
+    words = []
+    for slot in _SLOTS:
+        number, digit = divmod(number, len(slot))
+        words.append(slot[digit])
+    opener, verb, adjective, noun, tail, language = words
+    return " ".join(
+        part for part in (opener, verb, "a", adjective, noun, tail, "in", f"{language}?") if part
+    )
+
+
+# Each paraphrase changes the prompt in one of these ways
+_PARAPHRASES = (
+    str.lower,
+    lambda prompt: prompt.rstrip("?"),
+    lambda prompt: prompt.replace(" do I ", " can I "),
+    lambda prompt: prompt.replace(" a ", " the ", 1),
+)
+
+
+def _numbers(rng: random.Random, count: int) -> list[int]:
+    # Distinct prompt numbers in random order
+    return rng.sample(range(math.prod(map(len, _SLOTS))), count)
+
+
+def _bench(size: int, queries: int, thresholds: list[float], directory: Path) -> list[str]:
+    from src.aichan.utils.semantic_cache import (  # noqa: PLC0415
+        SignatureIndex,
+        prompt_signature,
+    )
+
+    # Reproducible prompts, not a secret
+    rng = random.Random(size)  # noqa: S311
+    numbers = _numbers(rng, size + queries)
+    stored, unseen = numbers[:size], numbers[size:]
+
+    path = directory / f"index-{size}.bin"
+    index = SignatureIndex(path, size)
+    for number in stored:
+        index.add(prompt_signature(_prompt(number)), _CONTEXT)
+    index.close()
+    started = time.perf_counter()
+    index = SignatureIndex(path, size)
+    load = time.perf_counter() - started
+
+    # Queries by the slot they should find, None for prompts that were not stored
+    queried: list[tuple[int | None, str]] = [
+        (slot, rng.choice(_PARAPHRASES)(_prompt(stored[slot])))
+        for slot in rng.sample(range(size), queries)
+    ]
+    queried += [(None, _prompt(number)) for number in unseen]
+    results = []
+    latencies = []
+    for expected, prompt in queried:
+        started = time.perf_counter()
+        found = index.search(prompt_signature(prompt), _CONTEXT)
+        latencies.append(time.perf_counter() - started)
+        results.append((expected, found))
+    index.close()
+
+    rows = []
+    for threshold in thresholds:
+        matched = [
+            (expected, found[0]) for expected, found in results if found and found[1] >= threshold
+        ]
+        hits = sum(expected == slot for expected, slot in matched)
+        rows.append(
+            f"{size:>9,}  {threshold:9.2f}  {hits / queries:8.1%}  "
+            f"{(len(matched) - hits) / len(queried):10.2%}  "
+            f"{statistics.median(latencies) * 1e3:7.2f} ms  {load:5.1f} s  "
+            f"{path.stat().st_size / 1e6:5.1f} MB",
+        )
+    return rows
+
+
+def main() -> None:
+    """Print the results for each size of the index."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=_DEFAULT_SIZES)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.9, 0.97])
+    args = parser.parse_args()
+    # Sets the environment and clears the command line, which the bot reads on import
+    import tests.conftest  # noqa: F401, PLC0415
+
+    print("  entries  threshold  hit rate  false hits  lookup p50   load     file")  # noqa: T201
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            for row in _bench(size, args.queries, args.thresholds, Path(directory)):
+                print(row)  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
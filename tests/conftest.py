@@ -0,0 +1,35 @@
+"""Settings shared by the tests.
+
+The settings of the bot are read from the environment when its modules
+are imported, so any valid values are set here first.
+"""
+
+import os
+import sys
+
+_ENVIRON = {
+    "BOT_NAME": "aichan",
+    "DB_NAME": ":memory:",
+    "TIMEZONE": "UTC",
+    "DISCORD_BOT_TOKEN": "token",
+    "CLAUDE_AVAILABLE_MODELS": "claude:1",
+    "CLAUDE_DEFAULT_CONTEXT_WINDOW": "10",
+    "CLAUDE_DEFAULT_MAX_TOKENS": "1024",
+    "CLAUDE_DEFAULT_TEMPERATURE": "1.0",
+    "CLAUDE_DEFAULT_TOP_P": "1.0",
+    "GPT_AVAILABLE_MODELS": "gpt:1",
+    "GPT_DEFAULT_CONTEXT_WINDOW": "10",
+    "GPT_DEFAULT_MAX_TOKENS": "1024",
+    "GPT_DEFAULT_TEMPERATURE": "1.0",
+    "GPT_DEFAULT_TOP_P": "1.0",
+    "ADMIN_USER_IDS": "1",
+    "AUTHORIZED_SERVER_IDS": "1",
+    "MAX_CHARS_PER_MESSAGE": "2000",
+    "CHAT_MODEL": "gpt",
+    "FIXPY_MODEL": "claude",
+}
+for key, value in _ENVIRON.items():
+    os.environ.setdefault(key, value)
+
+# The modules of the bot set up logging from the command line, which is pytest's here
+sys.argv = sys.argv[:1]
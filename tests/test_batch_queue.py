@@ -0,0 +1,190 @@
+"""Run deferred requests through `BatchQueue` against the batch stub.
+
+Each test queues groups, submits them, and polls until the handler has
+delivered them, with the SDKs pointed at `batch_stub.BatchStub`.
+"""
+
+import asyncio
+import dataclasses
+from collections.abc import Awaitable, Callable, Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from src.aichan.adapters.chat import ChatTurn, Conversation
+from src.aichan.adapters.response import ResponseResult, ResponseStatus
+from src.aichan.ai.models.claude_model import ClaudeModelParams
+from src.aichan.ai.models.gpt_model import GptModelParams
+from src.aichan.ai.services import anthropic_text, openai_text
+from src.aichan.ai.services.anthropic_batch import anthropic_batch_params
+from src.aichan.ai.services.openai_batch import openai_batch_params
+from src.aichan.config.store import get_settings
+from src.aichan.database._dao_base import SQLiteDaoBase
+from src.aichan.database.migrations import migrate
+from src.aichan.utils import batch_queue
+from src.aichan.utils.batch_queue import BatchQueue
+from tests.batch_stub import BatchStub, last_user_message
+
+_KIND = "test"
+_CLAUDE = ClaudeModelParams(model="claude", max_tokens=100, temperature=1.0, top_p=1.0)
+_GPT = GptModelParams(model="gpt", max_tokens=100, temperature=1.0, top_p=1.0)
+# Output tokens of every answer of the stub
+_OUTPUT_TOKENS = 5
+
+# Deliveries of the handler: (context, results by key)
+Deliveries = list[tuple[dict[str, Any], dict[str, ResponseResult]]]
+
+
+def _answer(params: dict[str, Any]) -> str | None:
+    # Requests asking to fail are errored, the others are echoed
+    content = last_user_message(params)
+    return None if "fail" in content else f"answer to {content}"
+
+
+def _conversation(text: str) -> Conversation:
+    return Conversation([ChatTurn("user", text)])
+
+
+@pytest.fixture
+def deliveries(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Deliveries]:
+    """Use a fresh database and record what the handler of the test kind delivers."""
+    monkeypatch.setattr(SQLiteDaoBase, "DB_NAME", str(tmp_path / "batch.db"))
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "stub")
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    delivered: Deliveries = []
+
+    async def handler(context: dict[str, Any], results: dict[str, ResponseResult]) -> None:
+        delivered.append((context, results))
+
+    BatchQueue().register(_KIND, handler)
+    yield delivered
+    del BatchQueue().handlers[_KIND]
+    anthropic_text.get_client.cache_clear()
+    openai_text.get_client.cache_clear()
+
+
+def _run_with_stub(
+    monkeypatch: pytest.MonkeyPatch,
+    scenario: Callable[[BatchStub], Awaitable[None]],
+) -> None:
+    async def main() -> None:
+        await migrate()
+        stub = BatchStub(_answer)
+        url = await stub.start()
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", url)
+        monkeypatch.setenv("OPENAI_BASE_URL", f"{url}/v1")
+        # The clients are bound to the event loop and the URL of this test
+        anthropic_text.get_client.cache_clear()
+        openai_text.get_client.cache_clear()
+        try:
+            await scenario(stub)
+        finally:
+            await stub.close()
+
+    asyncio.run(main())
+
+
+def test_anthropic_group_is_delivered(
+    deliveries: Deliveries,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A group is delivered once its batch ends, with errored requests as errors."""
+
+    async def scenario(stub: BatchStub) -> None:
+        queue = BatchQueue()
+        requests = {
+            "ok": anthropic_batch_params("system", _conversation("hello"), _CLAUDE),
+            "bad": anthropic_batch_params("system", _conversation("please fail"), _CLAUDE),
+        }
+        assert await queue.enqueue(_KIND, "group-1", {"thread_id": 7}, requests)
+        assert not await queue.enqueue(_KIND, "group-1", {"thread_id": 7}, requests)
+
+        await queue.submit()
+        assert len(stub.batches) == 1
+        await queue.poll()
+        assert deliveries == []
+        await queue.poll()
+
+        assert len(deliveries) == 1
+        context, results = deliveries[0]
+        assert context == {"thread_id": 7}
+        assert results["ok"].status is ResponseStatus.SUCCESS
+        assert results["ok"].result == "answer to hello"
+        assert results["ok"].output_tokens == _OUTPUT_TOKENS
+        assert results["bad"].status is ResponseStatus.ERROR
+        assert await queue.dao.get_running_batches(queue.owner()) == []
+        assert await queue.dao.get_completed_groups(queue.owner()) == []
+
+    _run_with_stub(monkeypatch, scenario)
+
+
+def test_openai_group_with_missing_results(
+    deliveries: Deliveries,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Requests missing from the results of a finished batch are delivered as errors."""
+
+    async def scenario(stub: BatchStub) -> None:
+        queue = BatchQueue()
+        requests = {
+            key: openai_batch_params("system", _conversation(key), _GPT)
+            for key in ("kept", "lost", "fail")
+        }
+        await queue.enqueue(_KIND, "group-2", {}, requests, provider="openai")
+        stub.missing.add("group-2-lost")
+
+        await queue.submit()
+        await queue.poll()
+        await queue.poll()
+
+        (_, results), *_ = deliveries
+        assert results["kept"].status is ResponseStatus.SUCCESS
+        assert results["kept"].result == "answer to kept"
+        assert results["lost"].status is ResponseStatus.ERROR
+        assert results["fail"].status is ResponseStatus.OPENAI_ERROR
+
+    _run_with_stub(monkeypatch, scenario)
+
+
+def test_groups_are_split_into_batches(
+    deliveries: Deliveries,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Queued requests above the batch size are submitted in several batches."""
+    settings = dataclasses.replace(get_settings(), batch_max_requests=2)
+    monkeypatch.setattr(batch_queue, "get_settings", lambda: settings)
+
+    async def scenario(stub: BatchStub) -> None:
+        queue = BatchQueue()
+        for index in range(3):
+            requests = {"only": anthropic_batch_params("s", _conversation(str(index)), _CLAUDE)}
+            await queue.enqueue(_KIND, f"group-{index}", {"index": index}, requests)
+
+        await queue.submit()
+        assert [len(requests) for requests in stub.batches.values()] == [2, 1]
+        await queue.poll()
+        await queue.poll()
+        assert sorted(context["index"] for context, _ in deliveries) == [0, 1, 2]
+
+    _run_with_stub(monkeypatch, scenario)
+
+
+@pytest.mark.usefixtures("deliveries")
+def test_failed_handler_drops_the_group(monkeypatch: pytest.MonkeyPatch) -> None:
+    """A group whose handler fails is not delivered again on the next poll."""
+
+    async def failing(_context: dict[str, Any], _results: dict[str, ResponseResult]) -> None:
+        raise RuntimeError
+
+    async def scenario(_stub: BatchStub) -> None:
+        queue = BatchQueue()
+        queue.register(_KIND, failing)
+        requests = {"only": anthropic_batch_params("s", _conversation("x"), _CLAUDE)}
+        await queue.enqueue(_KIND, "group-3", {}, requests)
+        await queue.submit()
+        await queue.poll()
+        await queue.poll()
+        assert await queue.dao.get_completed_groups(queue.owner()) == []
+
+    _run_with_stub(monkeypatch, scenario)
@@ -0,0 +1,170 @@
+"""Check the fingerprints of `/fixpy` code and the reuse of cached answers."""
+
+import asyncio
+import time
+
+import pytest
+
+from src.aichan.discord.commands import fixpy_command
+from src.aichan.utils import code_analysis
+from src.aichan.utils.code_analysis import (
+    CodeReport,
+    analyze_code,
+    analyze_code_in_pool,
+    fingerprint_code,
+)
+
+_CODE = """\
+import math
+
+def area(radius):
+    # The area of a circle
+    return math.pi * radius ** 2
+
+print(area(2))
+"""
+_SUBTRACT = "def f(a, b):\n    return a - b\n"
+# ruff(SLF001): the cache lookup of the command is tested without Discord
+_cached_answer = fixpy_command._cached_answer  # noqa: SLF001
+# ruff(SLF001): the note added below cached answers
+_CACHED_NOTE = fixpy_command._CACHED_NOTE  # noqa: SLF001
+# ruff(SLF001): the pool is checked to be replaced after a timeout
+_get_executor = code_analysis._get_executor  # noqa: SLF001
+# Seconds an analysis may take in the timeout test, and to wait for its worker to stop
+_TIMEOUT = 0.5
+_STOP_TIMEOUT = 5.0
+
+
+def _digest(code: str) -> str:
+    fingerprint = fingerprint_code(code)
+    assert fingerprint is not None
+    return fingerprint.digest
+
+
+@pytest.mark.parametrize(
+    "equivalent",
+    [
+        # Renamed local names
+        _CODE.replace("area", "surface").replace("radius", "r"),
+        # Formatting and comments
+        "import math\ndef area( radius ):\n    return math.pi*radius**2\nprint( area(2) )\n",
+    ],
+)
+def test_equivalent_code_shares_a_fingerprint(equivalent: str) -> None:
+    """Code that only differs in local names, formatting or comments hashes the same."""
+    assert _digest(equivalent) == _digest(_CODE)
+
+
+@pytest.mark.parametrize(
+    "different",
+    [
+        # Constants
+        _CODE.replace("** 2", "** 3"),
+        _CODE.replace("area(2)", "area(3)"),
+        # Attributes, builtins and imported names are kept
+        _CODE.replace("math.pi", "math.tau"),
+        _CODE.replace("print", "repr"),
+        _CODE.replace("import math", "import cmath as math"),
+    ],
+)
+def test_different_code_has_another_fingerprint(different: str) -> None:
+    """Code that differs in what it does hashes differently."""
+    assert _digest(different) != _digest(_CODE)
+
+
+def test_names_are_listed_in_order_of_appearance() -> None:
+    """The replaced names map the placeholders back, without builtins or imports."""
+    fingerprint = fingerprint_code(_CODE)
+    assert fingerprint is not None
+    assert fingerprint.names == ("area", "radius")
+    subtract = fingerprint_code(_SUBTRACT)
+    assert subtract is not None
+    assert subtract.names == ("f", "a", "b")
+    assert _digest("def f(a, b):\n    return b - a\n") != _digest(_SUBTRACT)
+
+
+def test_code_with_syntax_errors_is_fingerprinted_by_tokens() -> None:
+    """Broken code, what `/fixpy` usually gets, is hashed in the same way by its tokens."""
+    broken = "import math\ndef area(radius)\n    return math.pi * radius ** 2  # no colon\n"
+    renamed = "import math\ndef size(r)\n    return math.pi * r ** 2\n"
+    assert _digest(broken) == _digest(renamed)
+    assert _digest(broken) != _digest(broken.replace("math.pi", "math.e"))
+    assert _digest(broken) != _digest(_CODE)
+    fingerprint = fingerprint_code(renamed)
+    assert fingerprint is not None
+    assert fingerprint.names == ("size", "r")
+
+
+def test_untokenizable_code_has_no_fingerprint() -> None:
+    """Code the tokenizer rejects is not cached, as different code could collide."""
+    assert fingerprint_code("def f():\n  return 1\n return 2\n") is None
+
+
+class _Cache:
+    def __init__(self, response: str, names: tuple[str, ...]) -> None:
+        self.entry = (response, names)
+
+    async def get(self, _key: str) -> tuple[str, tuple[str, ...]]:
+        return self.entry
+
+
+def test_cached_answer_uses_the_names_of_the_submitted_code(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Names in the code of a cached answer are replaced, names in the prose are not."""
+    cached_code = "def area(radius):\n    return math.pi * radius ** 2\n"
+    answer = (
+        f"The area was missing a colon. `area(radius)` now parses:\n```python\n{cached_code}```"
+    )
+    monkeypatch.setattr(fixpy_command, "fixpy_cache_dao", _Cache(answer, ("area", "radius")))
+    report = analyze_code("import math\ndef size(r)\n    return math.pi * r ** 2\n")
+
+    response = asyncio.run(_cached_answer("key", report))
+    assert response is not None
+    assert response.startswith("The area was missing a colon. `size(r)` now parses:\n")
+    assert "```python\ndef size(r):\n    return math.pi * r ** 2\n```" in response
+    assert response.endswith(_CACHED_NOTE)
+
+
+def test_cached_answer_swaps_names(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Names that trade places are replaced at once, not one after the other."""
+    answer = f"```python\n{_SUBTRACT}```"
+    monkeypatch.setattr(fixpy_command, "fixpy_cache_dao", _Cache(answer, ("f", "a", "b")))
+    report = analyze_code("def f(b, a):\n    return b - a\n")
+
+    response = asyncio.run(_cached_answer("key", report))
+    assert response is not None
+    assert response.startswith("```python\ndef f(b, a):\n    return b - a\n```")
+
+
+def _slow_analysis(_code: str) -> CodeReport:
+    # Run in the worker instead of analyze_code
+    time.sleep(60)
+    return CodeReport()
+
+
+def test_timed_out_workers_are_stopped(monkeypatch: pytest.MonkeyPatch) -> None:
+    """A timed-out analysis terminates the workers of the pool, which is replaced."""
+    monkeypatch.setattr(code_analysis, "analyze_code", _slow_analysis)
+    monkeypatch.setattr(code_analysis, "_ANALYSIS_TIMEOUT_SECONDS", _TIMEOUT)
+    _get_executor.cache_clear()
+
+    async def main() -> None:
+        executor = _get_executor()
+        analysis = asyncio.create_task(analyze_code_in_pool("x = 1"))
+        await asyncio.sleep(_TIMEOUT / 2)
+        # ruff(SLF001): the workers are only reachable through the pool
+        workers = list(executor._processes.values())  # noqa: SLF001
+        assert workers
+
+        assert await analysis == CodeReport()
+        for worker in workers:
+            worker.join(_STOP_TIMEOUT)
+            assert not worker.is_alive()
+        assert _get_executor() is not executor
+
+    try:
+        asyncio.run(main())
+    finally:
+        _get_executor().shutdown()
+        _get_executor.cache_clear()
@@ -0,0 +1,152 @@
+"""Check the rules of the moderation filter and when they are compiled."""
+
+import dataclasses
+import re
+from pathlib import Path
+
+import pytest
+
+from src.aichan.config import store
+from src.aichan.config.moderation import ModerationFilter, trie_pattern
+from src.aichan.config.store import ConfigStore, get_settings
+
+_BLOCKLIST = """\
+# Comments and blank lines are skipped
+
+ass
+Bad Word
+ばか
+ＮＧワード
+re:\\bfree \\$\\d+\\b
+"""
+_PROMPT_EXAMPLE = Path(__file__).resolve().parents[1] / ".prompt.example.yml"
+_MAX_CHARS = 1000
+_MAX_CHAR_RUN = 20
+_MIN_COMPRESSION_RATIO = 0.1
+_PROSE = (
+    "The scheduler keeps one task per job and wakes up when the next job is due. "
+    "Jobs that were missed while the bot was offline run once on startup, and the "
+    "time of their last run is stored, so that a restart never runs a job twice. "
+    "Each job logs how long it took and whether it failed, so slow jobs are found."
+)
+
+
+def _filter(tmp_path: Path, blocklist: str = _BLOCKLIST) -> ModerationFilter:
+    path = tmp_path / "blocklist.txt"
+    path.write_text(blocklist, encoding="utf-8")
+    settings = dataclasses.replace(
+        get_settings(),
+        moderation_blocklist_path=str(path),
+        moderation_max_chars=_MAX_CHARS,
+        moderation_max_char_run=_MAX_CHAR_RUN,
+        moderation_min_compression_ratio=_MIN_COMPRESSION_RATIO,
+    )
+    return ModerationFilter.from_settings(settings)
+
+
+@pytest.mark.parametrize(
+    "terms",
+    [
+        ["abc"],
+        ["abc", "abd", "ab", "b"],
+        ["a.b", "c*d", "(e)", "[f]", "g|h"],
+        ["ばか", "ばかもの", "あほ"],
+    ],
+)
+def test_trie_pattern_matches_exactly_the_terms(terms: list[str]) -> None:
+    """The pattern matches each term in full and nothing else of its alphabet."""
+    pattern = re.compile(trie_pattern(terms))
+    for term in terms:
+        assert pattern.fullmatch(term), term
+    near_misses = {term[:-1] for term in terms} | {f"{term}x" for term in terms}
+    for text in near_misses - set(terms):
+        assert not pattern.fullmatch(text), text
+
+
+@pytest.mark.parametrize(
+    "prompt",
+    [
+        "you ass",
+        "ASS!",
+        # Full-width letters
+        "\uff41\uff53\uff53 again",
+        "this is a bad   word",
+        "BAD-WORD",
+        "bad. Word",
+        "お前はばかだ",
+        "これはngワードです",
+        "get it FREE $100 now",
+    ],
+)
+def test_blocked_terms_are_flagged(tmp_path: Path, prompt: str) -> None:
+    """Words, phrases, terms without spaces and expressions match in any case and width."""
+    assert _filter(tmp_path).check(prompt) == "blocked-term"
+
+
+@pytest.mark.parametrize(
+    "prompt",
+    [
+        "my class has a pass method",
+        "assert it works",
+        "a bad wording",
+        "free $100k",
+        "ばあか",
+    ],
+)
+def test_similar_text_is_not_flagged(tmp_path: Path, prompt: str) -> None:
+    """ASCII terms only match whole words, and phrases consecutive words."""
+    assert _filter(tmp_path).check(prompt) is None
+
+
+@pytest.mark.parametrize(
+    ("prompt", "reason"),
+    [
+        ("x" * (_MAX_CHARS + 1), "too-long"),
+        (f"look{'!' * _MAX_CHAR_RUN}", "repeated-character"),
+        ("buy now " * 40, "repetitive"),
+        (_PROSE, None),
+        ("short " * 10, None),
+        (f"look{'!' * (_MAX_CHAR_RUN - 1)}", None),
+    ],
+)
+def test_spam_heuristics(tmp_path: Path, prompt: str, reason: str | None) -> None:
+    """Long prompts, runs of one character and repetitive prompts are flagged."""
+    assert _filter(tmp_path, "").check(prompt) == reason
+
+
+def test_invalid_blocklists_are_rejected(tmp_path: Path) -> None:
+    """Compiling fails on a missing file or an invalid expression."""
+    with pytest.raises(re.error):
+        _filter(tmp_path, "re:(unclosed\n")
+    settings = dataclasses.replace(
+        get_settings(),
+        moderation_blocklist_path=str(tmp_path / "missing.txt"),
+    )
+    with pytest.raises(OSError, match="missing"):
+        ModerationFilter.from_settings(settings)
+
+
+def test_reload_keeps_the_filter_of_an_invalid_blocklist(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A reload with an invalid blocklist raises and keeps the current snapshot."""
+    blocklist = tmp_path / "blocklist.txt"
+    blocklist.write_text("ass\n", encoding="utf-8")
+    monkeypatch.setattr(store, "ENV_PATH", tmp_path / ".env")
+    monkeypatch.setattr(store, "PROMPT_PATH", _PROMPT_EXAMPLE)
+    monkeypatch.setenv("MODERATION_BLOCKLIST_PATH", str(blocklist))
+    monkeypatch.setattr(ConfigStore, "_instance", None)
+    config = ConfigStore()
+    snapshot = config.current
+    assert snapshot.moderation.check("you ass") == "blocked-term"
+
+    blocklist.write_text("re:(unclosed\n", encoding="utf-8")
+    with pytest.raises(re.error):
+        config.reload()
+    assert config.current is snapshot
+
+    blocklist.write_text("class\n", encoding="utf-8")
+    config.reload()
+    assert config.current.moderation.check("you ass") is None
+    assert config.current.moderation.check("my class") == "blocked-term"
@@ -0,0 +1,89 @@
+"""Check that the queries of the DAOs are served by an index.
+
+The SQL is read from the source of the DAO modules and explained against
+a database built from `MIGRATIONS`, so a new query or migration that
+makes a lookup scan its table fails here instead of slowing down as the
+table grows. Queries without a WHERE clause read the whole table on
+purpose and may scan it.
+"""
+
+import ast
+import re
+import sqlite3
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from src.aichan.database.migrations import MIGRATIONS
+
+ROOT = Path(__file__).resolve().parents[1]
+DAO_DIR = ROOT / "src" / "aichan" / "database"
+
+# The DAOs write SQL keywords in upper case, unlike the docstrings
+_STATEMENT = re.compile(r"^\s*(?:SELECT|INSERT|UPDATE|DELETE|WITH) ")
+_WHERE = re.compile(r"\bWHERE\b")
+
+
+def _sql_strings(path: Path) -> list[tuple[int, str]]:
+    # Interpolated parts of f-strings are "?" placeholders in the DAOs
+    queries = []
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    parts = {
+        id(part)
+        for node in ast.walk(tree)
+        if isinstance(node, ast.JoinedStr)
+        for part in node.values
+    }
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Constant)
+            and isinstance(node.value, str)
+            and id(node) not in parts
+        ):
+            sql = node.value
+        elif isinstance(node, ast.JoinedStr):
+            sql = "".join(
+                str(part.value) if isinstance(part, ast.Constant) else "?" for part in node.values
+            )
+        else:
+            continue
+        if _STATEMENT.match(sql):
+            queries.append((node.lineno, sql))
+    return queries
+
+
+def _dao_queries() -> list[Any]:
+    return [
+        pytest.param(sql, id=f"{path.relative_to(ROOT)}:{lineno}")
+        for path in sorted(DAO_DIR.rglob("*.py"))
+        for lineno, sql in _sql_strings(path)
+    ]
+
+
+@pytest.fixture(scope="module")
+def conn() -> Iterator[sqlite3.Connection]:
+    """Return an in-memory database with the schema of `MIGRATIONS`."""
+    conn = sqlite3.connect(":memory:")
+    for statements in MIGRATIONS:
+        for statement in statements:
+            conn.execute(statement)
+    yield conn
+    conn.close()
+
+
+def test_queries_are_found() -> None:
+    """The source of the DAOs yields queries to check."""
+    assert _dao_queries()
+
+
+@pytest.mark.parametrize("sql", _dao_queries())
+def test_filtered_queries_use_an_index(conn: sqlite3.Connection, sql: str) -> None:
+    """A query with a WHERE clause searches an index instead of scanning a table."""
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", [None] * sql.count("?")).fetchall()
+    scans = [
+        detail for _, _, _, detail in plan if detail.startswith("SCAN") and "INDEX" not in detail
+    ]
+    if _WHERE.search(sql):
+        assert not scans, " ".join(sql.split())
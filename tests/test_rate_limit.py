@@ -0,0 +1,23 @@
+"""Check that the rate limit of commands is not consumed by rejected commands."""
+
+# ruff(F401): the commands register themselves on the client when imported
+from src.aichan.discord import commands  # noqa: F401
+from src.aichan.discord.client import BotClient
+from src.aichan.utils.decorators import is_within_rate_limit
+
+
+def _is_rate_limit(check: object) -> bool:
+    return getattr(check, "__qualname__", "").startswith(is_within_rate_limit.__name__)
+
+
+def test_rate_limit_is_checked_last() -> None:
+    """The token is taken after every other check, so a failing check costs nothing."""
+    limited: dict[str, list[object]] = {}
+    for command in BotClient.get_instance().tree.get_commands():
+        # Groups have no checks of their own
+        checks = getattr(command, "checks", [])
+        if any(_is_rate_limit(check) for check in checks):
+            limited[command.name] = checks
+    assert {"chat", "talk", "fixpy", "fixpy_batch"} <= limited.keys()
+    for name, checks in limited.items():
+        assert _is_rate_limit(checks[-1]), name
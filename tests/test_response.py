@@ -0,0 +1,137 @@
+"""Check how long responses are split into messages or attached as a file."""
+
+import asyncio
+import dataclasses
+from typing import Any
+
+import pytest
+
+from src.aichan.adapters import response
+from src.aichan.adapters.response import (
+    RESPONSE_FILENAME,
+    ResponseResult,
+    ResponseStatus,
+    _split_into_shorter_messages,
+    send_response_result,
+)
+from src.aichan.config.store import get_settings
+
+_LIMIT = 100
+_THRESHOLD = 500
+
+
+@pytest.fixture(autouse=True)
+def _settings(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Use a small message limit, so that short texts are split."""
+    settings = dataclasses.replace(
+        get_settings(),
+        max_chars_per_message=_LIMIT,
+        response_attachment_threshold=_THRESHOLD,
+    )
+    monkeypatch.setattr(response, "get_settings", lambda: settings)
+
+
+def _paragraph(index: int, length: int = 40) -> str:
+    return f"paragraph {index} ".ljust(length, "x")
+
+
+def test_short_messages_are_not_split() -> None:
+    """A message within the limit is sent as it is."""
+    assert _split_into_shorter_messages("hello\n\nworld") == ["hello\n\nworld"]
+
+
+def test_chunks_are_within_the_limit() -> None:
+    """Every chunk fits in a message and no text is lost."""
+    message = "\n\n".join(_paragraph(index) for index in range(20))
+    chunks = _split_into_shorter_messages(message)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= _LIMIT for chunk in chunks)
+    assert "".join(chunks) == message
+
+
+def test_chunks_end_at_paragraph_breaks() -> None:
+    """Chunks are cut after a blank line rather than inside a paragraph."""
+    message = "\n\n".join(_paragraph(index) for index in range(6))
+    chunks = _split_into_shorter_messages(message)
+    assert all(chunk.endswith("\n\n") for chunk in chunks[:-1])
+    assert all(chunk.startswith("paragraph") for chunk in chunks)
+
+
+def test_long_lines_are_cut_at_spaces() -> None:
+    """A line longer than the limit is cut at a space, text without spaces at the limit."""
+    words = " ".join(f"word{index}" for index in range(60))
+    chunks = _split_into_shorter_messages(words)
+    assert all(len(chunk) <= _LIMIT for chunk in chunks)
+    assert all(chunk.endswith(" ") for chunk in chunks[:-1])
+    assert "".join(chunks) == words
+
+    japanese = "あ" * (_LIMIT * 2 + 10)
+    assert [len(chunk) for chunk in _split_into_shorter_messages(japanese)] == [
+        _LIMIT,
+        _LIMIT,
+        10,
+    ]
+
+
+def test_code_blocks_are_closed_and_reopened() -> None:
+    """A code block cut in two is closed and reopened with its language."""
+    code = "\n".join(f"print({index})  # line {index}" for index in range(12))
+    message = f"Here is the code:\n```python\n{code}\n```\nDone."
+    chunks = _split_into_shorter_messages(message)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= _LIMIT for chunk in chunks)
+    for chunk in chunks:
+        fences = [line for line in chunk.splitlines() if line.startswith("```")]
+        assert len(fences) % 2 == 0, chunk
+    assert all(chunk.startswith("```python\n") for chunk in chunks[1:-1])
+    # Without the fences closing and reopening the block, the chunks join back
+    assert "".join(chunks).replace("``````python\n", "") == message
+
+
+def test_blank_chunks_are_dropped() -> None:
+    """Discord rejects empty messages, so whitespace-only chunks are not sent."""
+    message = _paragraph(0, _LIMIT) + "\n" * _LIMIT
+    assert all(chunk.strip() for chunk in _split_into_shorter_messages(message))
+
+
+class _Dispatcher:
+    def __init__(self) -> None:
+        self.sent: list[dict[str, Any]] = []
+        self.queued: list[str] = []
+
+    async def send(self, _thread: object, **kwargs: Any) -> None:  # noqa: ANN401
+        self.sent.append(kwargs)
+
+    async def enqueue(self, _thread: object, content: str) -> None:
+        self.queued.append(content)
+
+
+def _send(monkeypatch: pytest.MonkeyPatch, text: str) -> _Dispatcher:
+    dispatcher = _Dispatcher()
+    monkeypatch.setattr(response, "OutboundDispatcher", lambda: dispatcher)
+    result = ResponseResult(status=ResponseStatus.SUCCESS, result=text)
+    # mypy(arg-type): the dispatcher is the only user of the thread
+    asyncio.run(send_response_result(None, result))  # type: ignore[arg-type]
+    return dispatcher
+
+
+def test_responses_up_to_the_threshold_are_sent_as_messages(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A response of at most the threshold is queued as chunks, in order."""
+    text = "\n\n".join(_paragraph(index) for index in range(10))
+    assert len(text) <= _THRESHOLD
+    dispatcher = _send(monkeypatch, text)
+    assert dispatcher.sent == []
+    assert dispatcher.queued == _split_into_shorter_messages(text)
+
+
+def test_responses_above_the_threshold_are_attached(monkeypatch: pytest.MonkeyPatch) -> None:
+    """A response longer than the threshold is sent as one file."""
+    text = "x" * (_THRESHOLD + 1)
+    dispatcher = _send(monkeypatch, text)
+    assert dispatcher.queued == []
+    (sent,) = dispatcher.sent
+    assert sent["file"].filename == RESPONSE_FILENAME
+    assert sent["file"].fp.read() == text.encode()
@@ -0,0 +1,122 @@
+"""Check the confinement and the reports of the `/fixpy` sandbox worker.
+
+The worker is run as `SandboxPool` runs it, and the tests are skipped
+where it cannot confine the code, as it then refuses every job.
+"""
+
+import json
+import subprocess
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKER = ROOT / "src" / "aichan" / "utils" / "_sandbox_worker.py"
+
+# Writes a payload to every descriptor that could be the result pipe
+_FORGE = (
+    "import os\n"
+    "def f():\n"
+    "    '''\n"
+    "    >>> for fd in range(3, 32):\n"
+    "    ...     try: os.write(fd, {payload!r})\n"
+    "    ...     except OSError: pass\n"
+    "    >>> os._exit(0)\n"
+    "    '''\n"
+)
+
+pytestmark = pytest.mark.skipif(sys.platform != "linux", reason="the sandbox is Linux only")
+
+
+class _Worker:
+    def __init__(self) -> None:
+        self.process = subprocess.Popen(  # noqa: S603
+            [sys.executable, "-I", str(WORKER)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            env={},
+        )
+
+    def run(self, code: str, tests: str = "") -> dict[str, Any]:
+        assert self.process.stdin is not None
+        assert self.process.stdout is not None
+        job = {"code": code, "tests": tests, "timeout": 2, "memory_bytes": 256 * 1024 * 1024}
+        self.process.stdin.write(json.dumps(job) + "\n")
+        self.process.stdin.flush()
+        result: dict[str, Any] = json.loads(self.process.stdout.readline())
+        return result
+
+    def close(self) -> int:
+        assert self.process.stdin is not None
+        self.process.stdin.close()
+        return self.process.wait()
+
+
+@pytest.fixture(scope="module")
+def worker() -> Iterator[_Worker]:
+    """Return a running worker, or skip if it cannot confine the code."""
+    worker = _Worker()
+    probe = worker.run("")
+    if "unconfined" in probe:
+        worker.close()
+        pytest.skip(f"the sandbox cannot confine the code: {probe['unconfined']}")
+    yield worker
+    worker.close()
+
+
+def test_files_of_the_bot_cannot_be_read(worker: _Worker) -> None:
+    """Only the Python installation is visible to the code."""
+    result = worker.run(f"open({str(ROOT / 'README.md')!r}).read()")
+    assert result["failure"] == "Running the code raised FileNotFoundError."
+
+
+def test_the_standard_library_can_be_imported(worker: _Worker) -> None:
+    """Modules of the standard library, including extension modules, import."""
+    result = worker.run("import decimal, fractions, json, sqlite3, zlib")
+    assert result == {"ok": True, "attempted": 0, "failed": 0, "failure": ""}
+
+
+def test_failures_do_not_include_the_output(worker: _Worker) -> None:
+    """A failing example is described without what the code returned."""
+    code = "def f():\n    '''\n    >>> f()\n    1\n    '''\n    return 'secret'\n"
+    result = worker.run(code)
+    assert not result["ok"]
+    assert result["attempted"] == result["failed"] == 1
+    assert ">>> f()" in result["failure"]
+    assert "secret" not in result["failure"]
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        b'{"unconfined": "forged"}',
+        b"not json",
+        b'{"ok": true, "attempted": "9", "failed": 0, "failure": ""}',
+    ],
+)
+def test_forged_results_are_rejected(worker: _Worker, payload: bytes) -> None:
+    """What the code writes to the result pipe never disables the pool or the worker."""
+    result = worker.run(_FORGE.format(payload=payload))
+    assert result == {
+        "ok": False,
+        "attempted": 0,
+        "failed": 0,
+        "failure": "The sandbox returned an invalid result.",
+    }
+    assert worker.run("")["ok"]
+
+
+def test_closing_the_pipe_does_not_hang(worker: _Worker) -> None:
+    """Code that closes the result pipe and keeps running is killed."""
+    code = (
+        "import os, time\n"
+        "for fd in range(3, 32):\n"
+        "    try: os.close(fd)\n"
+        "    except OSError: pass\n"
+        "time.sleep(60)\n"
+    )
+    assert worker.run(code)["failure"] == "Terminated by signal 9"
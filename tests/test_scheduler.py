@@ -0,0 +1,210 @@
+"""Check the fire times of cron expressions and the catch-up of missed jobs."""
+
+import asyncio
+import datetime
+import time
+from pathlib import Path
+
+import pytest
+import pytz
+
+from src.aichan.database._dao_base import SQLiteDaoBase
+from src.aichan.database.dao.job_dao import JobRunDAO
+from src.aichan.database.migrations import migrate
+from src.aichan.utils import cron, scheduler
+from src.aichan.utils.cron import CronSpec
+from src.aichan.utils.scheduler import JobScheduler
+
+_BERLIN = pytz.timezone("Europe/Berlin")
+_DAY_SECONDS = 24 * 60 * 60
+
+
+def _utc(text: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(text).replace(tzinfo=datetime.UTC)
+
+
+@pytest.fixture
+def utc(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Evaluate cron expressions in UTC."""
+    monkeypatch.setattr(cron, "TIMEZONE", pytz.utc)
+
+
+@pytest.mark.usefixtures("utc")
+@pytest.mark.parametrize(
+    ("expression", "after", "expected"),
+    [
+        # Minutes and hours, strictly after the given time
+        ("*/15 * * * *", "2025-01-01 10:07", "2025-01-01 10:15"),
+        ("*/15 * * * *", "2025-01-01 10:45", "2025-01-01 11:00"),
+        ("0 4 * * *", "2025-01-01 04:00", "2025-01-02 04:00"),
+        ("0 4 * * *", "2025-01-01 03:59:30", "2025-01-01 04:00"),
+        ("5,35 8-9 * * *", "2025-01-01 08:40", "2025-01-01 09:05"),
+        ("10-20/5 * * * *", "2025-01-01 10:16", "2025-01-01 10:20"),
+        ("10/20 * * * *", "2025-01-01 10:31", "2025-01-01 10:50"),
+        # Days of the month and months
+        ("0 0 1,15 * *", "2025-01-02 00:00", "2025-01-15 00:00"),
+        ("0 0 31 * *", "2025-04-01 00:00", "2025-05-31 00:00"),
+        ("0 12 * 6-8/2 *", "2025-07-01 00:00", "2025-08-01 12:00"),
+        ("0 0 29 2 *", "2025-03-01 00:00", "2028-02-29 00:00"),
+        ("59 23 31 12 *", "2025-12-31 23:59", "2026-12-31 23:59"),
+        # Days of the week: 2025-01-03 is a Friday, and 0 and 7 are Sunday
+        ("30 4 * * 1-5", "2025-01-03 05:00", "2025-01-06 04:30"),
+        ("0 9 * * 0", "2025-01-03 00:00", "2025-01-05 09:00"),
+        ("0 9 * * 7", "2025-01-03 00:00", "2025-01-05 09:00"),
+        # Either day field matches when both are restricted
+        ("0 0 13 * 5", "2025-01-01 00:00", "2025-01-03 00:00"),
+        ("0 0 13 * 5", "2025-01-10 00:00", "2025-01-13 00:00"),
+        # Only the weekday restricts the day when the day of month is *
+        ("0 0 * * 5", "2025-01-10 00:00", "2025-01-17 00:00"),
+        # Macros
+        ("@hourly", "2025-01-01 10:30", "2025-01-01 11:00"),
+        ("@daily", "2025-01-01 10:30", "2025-01-02 00:00"),
+        ("@weekly", "2025-01-01 10:30", "2025-01-05 00:00"),
+        ("@monthly", "2025-01-01 10:30", "2025-02-01 00:00"),
+        ("@yearly", "2025-01-01 10:30", "2026-01-01 00:00"),
+    ],
+)
+def test_next_after(expression: str, after: str, expected: str) -> None:
+    """Each field, list, range, step and macro gives the next fire time."""
+    assert CronSpec(expression).next_after(_utc(after)) == _utc(expected)
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "* * * *",
+        "* * * * * *",
+        "60 * * * *",
+        "* 24 * * *",
+        "0 0 0 * *",
+        "0 0 * 13 *",
+        "0 0 * * 8",
+        "a * * * *",
+        "*/0 * * * *",
+        "5-1 * * * *",
+        "0 0 31 2 *",
+        "@reboot",
+    ],
+)
+def test_invalid_expressions_are_rejected(expression: str) -> None:
+    """Malformed expressions and expressions that never fire raise ValueError."""
+    with pytest.raises(ValueError, match=r"(?i)cron"):
+        CronSpec(expression)
+
+
+@pytest.mark.parametrize(
+    ("expression", "after", "expected"),
+    [
+        # 02:00-03:00 is skipped on 2025-03-30: the missing time fires an hour late
+        ("30 2 * * *", "2025-03-29 12:00", "2025-03-30 01:30"),
+        ("0 * * * *", "2025-03-30 00:00", "2025-03-30 01:00"),
+        ("0 * * * *", "2025-03-30 01:00", "2025-03-30 02:00"),
+        # 02:00-03:00 is repeated on 2025-10-26: the job fires once, in the second
+        ("30 2 * * *", "2025-10-25 12:00", "2025-10-26 01:30"),
+        ("30 2 * * *", "2025-10-26 00:15", "2025-10-26 01:30"),
+        ("30 2 * * *", "2025-10-26 01:30", "2025-10-27 01:30"),
+        ("0 * * * *", "2025-10-26 00:00", "2025-10-26 02:00"),
+        # Local times stay the same across the change
+        ("0 9 * * *", "2025-03-29 12:00", "2025-03-30 07:00"),
+        ("0 9 * * *", "2025-10-25 12:00", "2025-10-26 08:00"),
+    ],
+)
+def test_next_after_across_dst(
+    monkeypatch: pytest.MonkeyPatch,
+    expression: str,
+    after: str,
+    expected: str,
+) -> None:
+    """Fire times are local to the configured timezone, given here in UTC."""
+    monkeypatch.setattr(cron, "TIMEZONE", _BERLIN)
+    fire = CronSpec(expression).next_after(_utc(after))
+    assert fire == _utc(expected)
+    assert fire.tzinfo is not None
+
+
+def _run_scheduler(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    expression: str,
+    last_run: float | None,
+    *,
+    catch_up: bool = True,
+) -> tuple[int, dict[str, float]]:
+    # Starts a scheduler with one job and returns its runs and the persisted last runs
+    monkeypatch.setattr(SQLiteDaoBase, "DB_NAME", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(JobScheduler, "_instance", None)
+    monkeypatch.setattr(scheduler, "TIMEZONE", pytz.utc)
+    monkeypatch.setattr(cron, "TIMEZONE", pytz.utc)
+    runs = 0
+
+    async def task() -> None:
+        nonlocal runs
+        runs += 1
+
+    async def main() -> dict[str, float]:
+        await migrate()
+        if last_run is not None:
+            await JobRunDAO().set_last_run("job", last_run, 0.0)
+        jobs = JobScheduler()
+        jobs.add_job("job", CronSpec(expression), task, catch_up=catch_up)
+        await jobs.start()
+        # Let the loop of the job catch up and go to sleep
+        await asyncio.sleep(0.1)
+        await jobs.shutdown()
+        return await JobRunDAO().get_last_runs()
+
+    last_runs = asyncio.run(main())
+    return runs, last_runs
+
+
+def test_missed_run_is_caught_up(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """A job whose fire time passed while the bot was offline runs once on startup."""
+    two_days_ago = time.time() - 2 * _DAY_SECONDS
+    runs, last_runs = _run_scheduler(tmp_path, monkeypatch, "0 4 * * *", two_days_ago)
+    assert runs == 1
+    assert last_runs["job"] > two_days_ago
+
+
+@pytest.mark.parametrize(
+    ("expression", "last_run", "catch_up"),
+    [
+        # Missed, but the job does not catch up
+        ("0 4 * * *", -2 * _DAY_SECONDS, False),
+        # Ran recently, and the next fire time is next year
+        ("@yearly", -60, True),
+        # Never ran, so nothing was missed
+        ("0 4 * * *", None, True),
+    ],
+)
+def test_nothing_is_caught_up(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    expression: str,
+    last_run: float | None,
+    catch_up: bool,  # noqa: FBT001
+) -> None:
+    """Jobs that missed nothing, or do not catch up, wait for their next fire time."""
+    since = None if last_run is None else time.time() + last_run
+    runs, _ = _run_scheduler(tmp_path, monkeypatch, expression, since, catch_up=catch_up)
+    assert runs == 0
+
+
+def test_running_job_is_not_run_again(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """A job that is still running is skipped instead of overlapping."""
+    monkeypatch.setattr(SQLiteDaoBase, "DB_NAME", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(JobScheduler, "_instance", None)
+
+    async def main() -> None:
+        await migrate()
+        release = asyncio.Event()
+        jobs = JobScheduler()
+        jobs.add_job("slow", CronSpec("@yearly"), release.wait, catch_up=False)
+        first = asyncio.create_task(jobs.run_job("slow"))
+        await asyncio.sleep(0)
+        assert not await jobs.run_job("slow")
+        release.set()
+        assert await first
+        assert jobs.metrics()["slow"].runs == 1
+        assert jobs.metrics()["slow"].skipped == 1
+
+    asyncio.run(main())
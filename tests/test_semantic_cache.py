@@ -0,0 +1,195 @@
+"""Check the signatures, the ring index and the lookups of the `/chat` cache."""
+
+import asyncio
+import dataclasses
+import math
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from src.aichan.database._dao_base import SQLiteDaoBase
+from src.aichan.database.migrations import migrate
+from src.aichan.utils import semantic_cache
+from src.aichan.utils.semantic_cache import (
+    SIGNATURE_BITS,
+    SemanticCache,
+    SignatureIndex,
+    context_id,
+    prompt_signature,
+)
+
+_CAPACITY = 3
+_CONTEXT = context_id("system", "gpt")
+_PROMPT = "How do I reverse a list in Python?"
+_PARAPHRASE = "how do you reverse a list in python"
+# Estimated similarity of the prompt and its paraphrase lies between these
+_BELOW_PARAPHRASE = 0.8
+_ABOVE_PARAPHRASE = 0.999
+# Unrelated prompts differ in about half of the bits
+_UNRELATED = 0.5
+
+
+def _similarity(first: str, second: str) -> float:
+    distance = (prompt_signature(first) ^ prompt_signature(second)).bit_count()
+    return math.cos(math.pi * distance / SIGNATURE_BITS)
+
+
+def test_signature_ignores_case_punctuation_and_spaces() -> None:
+    """Prompts that only differ in case, punctuation or spacing are equal."""
+    assert prompt_signature(_PROMPT) == prompt_signature("  how do i   reverse a list in PYTHON ")
+    # NFKC folds full-width letters
+    assert prompt_signature("\uff50\uff59\uff54\uff48\uff4f\uff4e") == prompt_signature("python")
+
+
+def test_signature_is_within_its_size() -> None:
+    """Signatures, including that of an empty prompt, fit in `SIGNATURE_BITS`."""
+    for prompt in ("", "a", _PROMPT, "日本語の質問です" * 100):
+        assert 0 <= prompt_signature(prompt) < 1 << SIGNATURE_BITS
+
+
+def test_paraphrases_are_closer_than_unrelated_prompts() -> None:
+    """A paraphrase shares most bits, an unrelated prompt about half."""
+    assert _similarity(_PROMPT, _PARAPHRASE) > _BELOW_PARAPHRASE
+    assert _similarity(_PROMPT, "What is the capital of France?") < _UNRELATED
+
+
+def _index(path: Path, capacity: int = _CAPACITY) -> SignatureIndex:
+    return SignatureIndex(path / "index.bin", capacity)
+
+
+def test_index_finds_similar_entries_of_the_same_context(tmp_path: Path) -> None:
+    """Search returns the closest entry of the context of the prompt."""
+    index = _index(tmp_path)
+    slot, _ = index.add(prompt_signature(_PROMPT), _CONTEXT)
+    index.add(prompt_signature("What is the capital of France?"), _CONTEXT)
+
+    found = index.search(prompt_signature(_PARAPHRASE), _CONTEXT)
+    assert found is not None
+    assert found[0] == slot
+    assert found[1] > _BELOW_PARAPHRASE
+    assert index.search(prompt_signature(_PROMPT), _CONTEXT + 1) is None
+    index.close()
+
+
+def test_index_overwrites_the_oldest_entry(tmp_path: Path) -> None:
+    """A full ring wraps around and evicts its oldest entry from the bands."""
+    index = _index(tmp_path)
+    signatures = [prompt_signature(f"question number {number}") for number in range(4)]
+    slots = [index.add(signature, _CONTEXT) for signature in signatures]
+
+    assert [slot for slot, _ in slots] == [0, 1, 2, 0]
+    assert [evicted for _, evicted in slots] == [None, None, None, (signatures[0], _CONTEXT)]
+    assert index.count == _CAPACITY
+    assert index.next_slot == 1
+    assert index.find(signatures[0], _CONTEXT) is None
+    assert index.find(signatures[3], _CONTEXT) == 0
+    assert index.search(signatures[0], _CONTEXT) != (0, 1.0)
+    index.close()
+
+
+def test_index_is_reloaded_from_its_file(tmp_path: Path) -> None:
+    """A reopened index has the same entries, next slot and bands."""
+    index = _index(tmp_path)
+    for number in range(4):
+        index.add(prompt_signature(f"question number {number}"), _CONTEXT)
+    index.close()
+
+    reloaded = _index(tmp_path)
+    assert (reloaded.count, reloaded.next_slot) == (_CAPACITY, 1)
+    assert reloaded.find(prompt_signature("question number 3"), _CONTEXT) == 0
+    found = reloaded.search(prompt_signature("question number 2"), _CONTEXT)
+    assert found == (2, 1.0)
+    reloaded.close()
+
+
+def test_index_is_recreated_when_its_capacity_changes(tmp_path: Path) -> None:
+    """A file of another capacity is emptied instead of misread."""
+    index = _index(tmp_path)
+    index.add(prompt_signature(_PROMPT), _CONTEXT)
+    index.close()
+
+    resized = _index(tmp_path, _CAPACITY + 1)
+    assert (resized.count, resized.next_slot) == (0, 0)
+    assert resized.search(prompt_signature(_PROMPT), _CONTEXT) is None
+    resized.close()
+
+
+@pytest.fixture
+def cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[SemanticCache]:
+    """Return a cache of `_CAPACITY` entries in a fresh database and file."""
+    monkeypatch.setattr(SQLiteDaoBase, "DB_NAME", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(SemanticCache, "_instance", None)
+    _set_settings(monkeypatch, chat_cache_path=str(tmp_path / "cache.bin"))
+    asyncio.run(migrate())
+    cache = SemanticCache()
+    yield cache
+    cache.close()
+
+
+def _set_settings(monkeypatch: pytest.MonkeyPatch, **changes: Any) -> None:  # noqa: ANN401
+    settings = dataclasses.replace(
+        semantic_cache.get_settings(),
+        chat_cache_size=_CAPACITY,
+        **changes,
+    )
+    monkeypatch.setattr(semantic_cache, "get_settings", lambda: settings)
+
+
+@pytest.mark.parametrize(
+    ("threshold", "hit"),
+    [(_BELOW_PARAPHRASE, True), (_ABOVE_PARAPHRASE, False)],
+)
+def test_lookup_applies_the_threshold(
+    cache: SemanticCache,
+    monkeypatch: pytest.MonkeyPatch,
+    threshold: float,
+    hit: bool,  # noqa: FBT001
+) -> None:
+    """A paraphrase gets the answer only if its similarity reaches the threshold."""
+    asyncio.run(cache.store(_PROMPT, _CONTEXT, "answer"))
+    _set_settings(monkeypatch, chat_cache_threshold=threshold)
+
+    found = asyncio.run(cache.lookup(_PARAPHRASE, _CONTEXT))
+    assert (found is not None) is hit
+    if found is not None:
+        assert found.response == "answer"
+    assert asyncio.run(cache.lookup(_PROMPT, _CONTEXT + 1)) is None
+
+
+def test_storing_a_prompt_again_updates_its_entry(cache: SemanticCache) -> None:
+    """The same prompt takes one slot, and its answer is replaced."""
+
+    async def scenario() -> None:
+        await cache.store(_PROMPT, _CONTEXT, "first")
+        await cache.store(_PROMPT, _CONTEXT, "second")
+        assert cache.index is not None
+        assert cache.index.count == 1
+        hit = await cache.lookup(_PROMPT, _CONTEXT)
+        assert hit is not None
+        assert hit.response == "second"
+
+    asyncio.run(scenario())
+
+
+def test_evicting_a_slot_keeps_answers_of_live_slots(cache: SemanticCache) -> None:
+    """An answer still held by another slot survives the eviction of one of them."""
+
+    async def scenario() -> None:
+        await cache.store(_PROMPT, _CONTEXT, "answer")
+        # Indexes written before entries were deduplicated may repeat them
+        assert cache.index is not None
+        cache.index.add(prompt_signature(_PROMPT), _CONTEXT)
+        await cache.store("What is the capital of France?", _CONTEXT, "Paris")
+        await cache.store("What is the capital of Spain?", _CONTEXT, "Madrid")
+
+        hit = await cache.lookup(_PROMPT, _CONTEXT)
+        assert hit is not None
+        assert hit.response == "answer"
+
+        # Evicting the last slot of the prompt deletes its answer
+        await cache.store("What is the capital of Italy?", _CONTEXT, "Rome")
+        assert await cache.lookup(_PROMPT, _CONTEXT) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,61 @@
+"""Check that starting the bot stays fast.
+
+The SDKs of the providers take most of the import time, so they are only
+imported when a client is first used. The entry module is imported in a
+fresh interpreter, as the tests themselves have imported most of it.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+# Seconds importing the entry module may take, see docs/DEVELOPERS.md
+STARTUP_BUDGET_SECONDS = 1.0
+# Imports are timed this many times, and the fastest counts
+_RUNS = 3
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import src.aichan.__main__
+elapsed = time.perf_counter() - started
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def _import_entry_module() -> tuple[float, list[str], str]:
+    process = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        capture_output=True,
+        check=True,
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+        text=True,
+    )
+    result = json.loads(process.stdout.splitlines()[-1])
+    return result["elapsed"], result["modules"], process.stderr
+
+
+def _slowest_imports(importtime: str, count: int = 5) -> list[str]:
+    # Lines of -X importtime: "import time: self [us] | cumulative | package"
+    timings = []
+    for line in importtime.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            _, cumulative, name = line.removeprefix("import time:").split("|")
+            timings.append((int(cumulative), name.strip()))
+    return [f"{name} {cumulative / 1e6:.2f}s" for cumulative, name in sorted(timings)[-count:]]
+
+
+def test_provider_sdks_are_not_imported_on_startup() -> None:
+    """The anthropic and openai packages are left to the first request."""
+    _, modules, _ = _import_entry_module()
+    assert not {"anthropic", "openai"} & set(modules)
+
+
+def test_startup_is_within_budget() -> None:
+    """Importing the entry module takes less than the budget."""
+    runs = [_import_entry_module() for _ in range(_RUNS)]
+    elapsed, _, importtime = min(runs)
+    assert elapsed < STARTUP_BUDGET_SECONDS, _slowest_imports(importtime)